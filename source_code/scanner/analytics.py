@@ -0,0 +1,354 @@
+#/usr/bin/python3
+#!coding=utf-8
+
+import argparse
+import json
+import numpy as np
+import pandas as pd
+
+# 各结果文件的列（service*.csv 没有表头；aggtest/septest 每次运行都会追加一行表头）
+MAGNIFY_COLUMNS = ["target", "type", "send", "receive", "magnify"]
+AGG_COLUMNS = ["IP", "dnssd_mag", "mdns_mag", "total_resp_len", "total_req_len", "service_count"]
+SEP_COLUMNS = AGG_COLUMNS + ["time_consumed"]
+SERVICE_COLUMNS = ["target", "rrname"]
+
+# 放大倍数直方图的对数分桶范围：0.01 ~ 1e5，0 及以下计入第一个桶
+LOG_MIN = -2.0
+LOG_MAX = 5.0
+CHUNKSIZE = 100000
+
+_IPV4 = r"(\d{1,3})\.(\d{1,3})\.(\d{1,3})\.(\d{1,3})"
+_SERVICE_TYPE = r"(_[^.]+\._(?:tcp|udp)\.local)\.?$"
+
+def ip_to_int(values):
+    """
+    把 IP 列（"1.2.3.4" 或 "('1.2.3.4', 5353)" 字符串）向量化转换为 uint32；
+    无法解析的行为 0（0.0.0.0 不会是扫描目标）。
+    """
+    parts = pd.Series(values, dtype=object).astype(str).str.extract(_IPV4)
+    parts = parts.apply(pd.to_numeric, errors="coerce")
+    valid = parts.notna().all(axis=1).to_numpy() & (parts.fillna(0).to_numpy() <= 255).all(axis=1)
+    octets = parts.fillna(0).to_numpy(dtype=np.uint32)
+    ips = (octets[:, 0] << 24) | (octets[:, 1] << 16) | (octets[:, 2] << 8) | octets[:, 3]
+    return np.where(valid, ips, 0).astype(np.uint32)
+
+def int_to_ip(value):
+    value = int(value)
+    return f"{value >> 24 & 255}.{value >> 16 & 255}.{value >> 8 & 255}.{value & 255}"
+
+def _numeric(frame, columns, dtype):
+    return {c: pd.to_numeric(frame[c], errors="coerce").to_numpy(dtype=np.float64).astype(dtype) for c in columns}
+
+def read_chunks(path, kind, chunksize=CHUNKSIZE):
+    """
+    分块读取结果文件，每块产出 {列名: NumPy 数组}，内存只与块大小有关。
+    kind 为 "magnify"（service_magnify.csv）、"agg"（aggtest.csv / hybtest.csv）、
+    "sep"（septest.csv）或 "service"（service.csv，只取目标与记录名并提取服务类型）。
+    表头行与无法解析的行被丢弃。
+    """
+    if kind == "magnify":
+        reader = pd.read_csv(path, header=None, names=MAGNIFY_COLUMNS, dtype=str, chunksize=chunksize,
+                             on_bad_lines="skip")
+    elif kind in ("agg", "sep"):
+        columns = SEP_COLUMNS if kind == "sep" else AGG_COLUMNS
+        reader = pd.read_csv(path, header=None, names=columns, usecols=range(len(columns)), dtype=str,
+                             chunksize=chunksize, on_bad_lines="skip")
+    elif kind == "service":
+        reader = pd.read_csv(path, header=None, names=SERVICE_COLUMNS, usecols=[0, 1], dtype=str,
+                             chunksize=chunksize, on_bad_lines="skip")
+    else:
+        raise ValueError(f"unknown result kind {kind}")
+    for frame in reader:
+        if kind == "magnify":
+            chunk = {"ip": ip_to_int(frame["target"]),
+                     "mdns": (frame["type"] == "mDNS").to_numpy()}
+            chunk.update(_numeric(frame, ["send", "receive"], np.float64))
+            chunk.update(_numeric(frame, ["magnify"], np.float64))
+            keep = (chunk["ip"] != 0) & ~np.isnan(chunk["magnify"])
+        elif kind == "service":
+            types = frame["rrname"].str.extract(_SERVICE_TYPE, expand=False)
+            chunk = {"ip": ip_to_int(frame["target"]), "service_type": types.to_numpy(dtype=object)}
+            keep = (chunk["ip"] != 0) & types.notna().to_numpy()
+        else:
+            chunk = {"ip": ip_to_int(frame["IP"])}
+            chunk.update(_numeric(frame, columns[1:], np.float64))
+            keep = (chunk["ip"] != 0) & ~np.isnan(chunk["mdns_mag"])
+        if not keep.all():
+            chunk = {k: v[keep] for k, v in chunk.items()}
+        if len(chunk["ip"]):
+            yield chunk
+
+class GroupedStats:
+    """
+    按整数键分组的流式统计：样本数、均值、标准差、最小/最大值，
+    以及对数分桶直方图（用于近似分位数，bins 越多越精确，每组占用 bins*4 字节）。
+    每块数据以 np.bincount 向量化累加，内存只与组数有关，与行数无关。
+    """
+    def __init__(self, bins=64):
+        self.bins = bins
+        self.index = {}
+        self.keys = []
+        self.count = np.zeros(0, np.int64)
+        self.total = np.zeros(0, np.float64)
+        self.squares = np.zeros(0, np.float64)
+        self.low = np.zeros(0, np.float64)
+        self.high = np.zeros(0, np.float64)
+        self.hist = np.zeros((0, bins), np.uint32)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _group_ids(self, keys):
+        uniq, inverse = np.unique(keys, return_inverse=True)
+        ids = np.empty(len(uniq), np.int64)
+        for i, key in enumerate(uniq.tolist()):
+            gid = self.index.get(key)
+            if gid is None:
+                gid = self.index[key] = len(self.keys)
+                self.keys.append(key)
+            ids[i] = gid
+        self._grow(len(self.keys))
+        return ids[inverse]
+
+    def _grow(self, size):
+        old = len(self.count)
+        if size <= old:
+            return
+        size = max(size, old * 2, 16)
+        pad = size - old
+        self.count = np.concatenate([self.count, np.zeros(pad, np.int64)])
+        self.total = np.concatenate([self.total, np.zeros(pad)])
+        self.squares = np.concatenate([self.squares, np.zeros(pad)])
+        self.low = np.concatenate([self.low, np.full(pad, np.inf)])
+        self.high = np.concatenate([self.high, np.full(pad, -np.inf)])
+        self.hist = np.concatenate([self.hist, np.zeros((pad, self.bins), np.uint32)])
+
+    def bin_of(self, values):
+        with np.errstate(divide="ignore", invalid="ignore"):
+            scaled = (np.log10(values) - LOG_MIN) / (LOG_MAX - LOG_MIN) * self.bins
+        return np.clip(np.nan_to_num(scaled, nan=0, neginf=0), 0, self.bins - 1).astype(np.int64)
+
+    def add(self, keys, values):
+        """keys 为可比较的 NumPy 数组（整数或字符串），values 为对应的数值。"""
+        if not len(values):
+            return
+        gids = self._group_ids(keys)
+        size = len(self.count)
+        self.count += np.bincount(gids, minlength=size)
+        self.total += np.bincount(gids, values, minlength=size)
+        self.squares += np.bincount(gids, values * values, minlength=size)
+        np.minimum.at(self.low, gids, values)
+        np.maximum.at(self.high, gids, values)
+        # 只累加本块出现过的 (组, 桶)，避免每块分配 组数×桶数 的临时数组
+        cells, counts = np.unique(gids * self.bins + self.bin_of(values), return_counts=True)
+        self.hist.reshape(-1)[cells] += counts.astype(np.uint32)
+
+    def quantiles(self, qs, groups=None):
+        """
+        各组（或 groups 给出的组下标）的近似分位数，形状为 (组数, len(qs))；
+        桶内按对数插值并限制在 [min, max] 内。
+        """
+        if groups is None:
+            groups = np.arange(len(self.keys))
+        n = len(groups)
+        hist = self.hist[groups].astype(np.float64)
+        cumulative = np.cumsum(hist, axis=1)
+        counts = self.count[groups].astype(np.float64)
+        width = (LOG_MAX - LOG_MIN) / self.bins
+        out = np.full((n, len(qs)), np.nan)
+        for j, q in enumerate(qs):
+            rank = q * counts
+            b = np.minimum((cumulative < rank[:, None]).sum(axis=1), self.bins - 1)
+            before = np.where(b > 0, cumulative[np.arange(n), b - 1], 0)
+            inside = hist[np.arange(n), b]
+            frac = np.where(inside > 0, (rank - before) / np.maximum(inside, 1), 0)
+            estimate = 10 ** (LOG_MIN + (b + frac) * width)
+            out[:, j] = np.clip(estimate, self.low[groups], self.high[groups])
+        out[counts == 0] = np.nan
+        return out
+
+    def table(self, qs=(0.5, 0.9, 0.99), order="count", limit=None, label=None):
+        """每组一行的汇总：[{key, count, mean, std, min, max, p50, ...}]，按 order 降序。"""
+        n = len(self.keys)
+        if not n:
+            return []
+        count = self.count[:n]
+        mean = self.total[:n] / count
+        std = np.sqrt(np.maximum(self.squares[:n] / count - mean * mean, 0))
+        columns = {"count": count, "mean": mean, "max": self.high[:n]}
+        ranking = np.argsort(-columns.get(order, count), kind="stable")
+        if limit:
+            ranking = ranking[:limit]
+        quant = self.quantiles(qs, ranking)
+        rows = []
+        for i, values in zip(ranking.tolist(), quant):
+            key = self.keys[i]
+            row = {"key": label(key) if label else key, "count": int(count[i]), "mean": round(float(mean[i]), 4),
+                   "std": round(float(std[i]), 4), "min": float(self.low[i]), "max": float(self.high[i])}
+            for q, v in zip(qs, values):
+                row[f"p{q * 100:g}"] = round(float(v), 4)
+            rows.append(row)
+        return rows
+
+def load_asn_table(path):
+    """
+    读取前缀到 ASN 的映射（CAIDA routeviews pfx2as 格式 "1.0.0.0<TAB>24<TAB>13335"，
+    或 "1.0.0.0/24,13335"），返回按前缀长度分组、排序好的 {长度: (网络号数组, ASN 数组)}。
+    """
+    frame = pd.read_csv(path, sep=r"[\s,/]+", header=None, engine="python", dtype=str, comment="#")
+    nets = ip_to_int(frame[0])
+    lengths = pd.to_numeric(frame[1], errors="coerce").fillna(-1).to_numpy(np.int64)
+    asns = frame[2].str.extract(r"(\d+)", expand=False)
+    asns = pd.to_numeric(asns, errors="coerce").fillna(0).to_numpy(np.int64)
+    table = {}
+    for length in np.unique(lengths):
+        if not 0 <= length <= 32:
+            continue
+        sel = lengths == length
+        order = np.argsort(nets[sel])
+        table[int(length)] = (nets[sel][order] & _mask(length), asns[sel][order])
+    return table
+
+def _mask(length):
+    return np.uint32((0xffffffff << (32 - length)) & 0xffffffff) if length else np.uint32(0)
+
+def lookup_asn(ips, table):
+    """向量化最长前缀匹配：按前缀长度从长到短各做一次 searchsorted，未匹配的为 0。"""
+    result = np.zeros(len(ips), np.int64)
+    pending = np.ones(len(ips), bool)
+    for length in sorted(table, reverse=True):
+        nets, asns = table[length]
+        if not pending.any():
+            break
+        masked = ips[pending] & _mask(length)
+        pos = np.searchsorted(nets, masked)
+        pos = np.minimum(pos, len(nets) - 1)
+        hit = nets[pos] == masked
+        idx = np.flatnonzero(pending)[hit]
+        result[idx] = asns[pos[hit]]
+        pending[idx] = False
+    return result
+
+def magnify_report(path, prefix=24, asn_table=None, top=20, chunksize=CHUNKSIZE):
+    """
+    service_magnify.csv 的分布报告：DNS-SD 与 mDNS 两类放大倍数的总体分布（细分桶），
+    以及按 /prefix 网段与 ASN（给出 asn_table 时）分组的分布，各取样本数最多的 top 组。
+    """
+    overall = GroupedStats(bins=700)
+    by_prefix = GroupedStats()
+    by_asn = GroupedStats() if asn_table else None
+    shift = np.uint32(32 - prefix)
+    rows = 0
+    for chunk in read_chunks(path, "magnify", chunksize):
+        rows += len(chunk["ip"])
+        kinds = np.where(chunk["mdns"], "mDNS", "DNS-SD")
+        values = chunk["magnify"]
+        overall.add(kinds, values)
+        mdns = chunk["mdns"]
+        by_prefix.add(chunk["ip"][mdns] >> shift, values[mdns])
+        if by_asn is not None:
+            by_asn.add(lookup_asn(chunk["ip"][mdns], asn_table), values[mdns])
+    report = {"rows": rows, "overall": overall.table(qs=(0.5, 0.9, 0.99, 0.999)),
+              "prefix_length": prefix, "prefixes": len(by_prefix),
+              "by_prefix": by_prefix.table(limit=top, label=lambda k: f"{int_to_ip(int(k) << (32 - prefix))}/{prefix}")}
+    if by_asn is not None:
+        report["by_asn"] = by_asn.table(limit=top, label=lambda k: f"AS{k}" if k else "unknown")
+    return report
+
+def _host_values(path, kind, columns, chunksize):
+    """
+    一次读取给出每个主机的若干列（重复扫描时取最后一次），返回按 IP 排序的 (ips, {列名: 值})。
+    每块读入后即与已有结果合并去重，内存为每主机 4 + 8×列数 字节加一块的大小，与行数无关。
+    """
+    ips = np.zeros(0, np.uint32)
+    values = {c: np.zeros(0) for c in columns}
+    for chunk in read_chunks(path, kind, chunksize):
+        # 已有结果在前、本块在后，反转后 np.unique 取到的是每个 IP 最后一次出现的值
+        ips, last = np.unique(np.concatenate([ips, chunk["ip"]])[::-1], return_index=True)
+        for c in columns:
+            values[c] = np.concatenate([values[c], chunk[c]])[::-1][last]
+    return ips, values
+
+def service_type_report(service_path, agg_path, top=50, chunksize=CHUNKSIZE):
+    """
+    按服务类型统计提供该服务的主机的 mDNS 放大倍数（来自 aggtest.csv），
+    同一主机的同一服务类型只计一次。主机值表每主机占 12 字节，service.csv 分块读取。
+    """
+    ips, values = _host_values(agg_path, "agg", ["mdns_mag"], chunksize)
+    mags = values["mdns_mag"]
+    stats = GroupedStats()
+    types = {}
+    seen = set()
+    for chunk in read_chunks(service_path, "service", chunksize):
+        pos = np.minimum(np.searchsorted(ips, chunk["ip"]), max(len(ips) - 1, 0))
+        known = (ips[pos] == chunk["ip"]) if len(ips) else np.zeros(len(pos), bool)
+        codes = np.array([types.setdefault(t, len(types)) for t in chunk["service_type"].tolist()], np.int64)
+        pairs = chunk["ip"].astype(np.int64) * 65536 + codes
+        pairs, first = np.unique(pairs[known], return_index=True)
+        fresh = np.array([p not in seen for p in pairs.tolist()], bool)
+        seen.update(pairs[fresh].tolist())
+        stats.add(codes[known][first][fresh], mags[pos[known][first][fresh]].astype(np.float64))
+    names = {code: name for name, code in types.items()}
+    return {"service_types": len(stats), "by_service_type": stats.table(limit=top, label=names.get)}
+
+def compare_modes(agg_path, sep_path, chunksize=CHUNKSIZE):
+    """
+    聚合模式与分离模式的对比：按 IP 连接 aggtest.csv 与 septest.csv，
+    给出两种模式的 mDNS 放大倍数、请求字节数的分布，以及每主机的比值（聚合/分离）分布。
+    """
+    columns = ("mdns_mag", "total_req_len", "total_resp_len")
+    agg_ips, agg = _host_values(agg_path, "agg", columns, chunksize)
+    sep_ips, sep = _host_values(sep_path, "sep", columns + ("time_consumed",), chunksize)
+    ips, agg_pos, sep_pos = np.intersect1d(agg_ips, sep_ips, assume_unique=True, return_indices=True)
+    stats = GroupedStats(bins=700)
+    for c in columns:
+        a = agg[c][agg_pos].astype(np.float64)
+        s = sep[c][sep_pos].astype(np.float64)
+        stats.add(np.full(len(a), f"aggregate {c}"), a)
+        stats.add(np.full(len(s), f"separate {c}"), s)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ratio = a / s
+        ok = np.isfinite(ratio)
+        stats.add(np.full(int(ok.sum()), f"ratio {c}"), ratio[ok])
+    t = sep["time_consumed"][sep_pos].astype(np.float64)
+    stats.add(np.full(len(t), "separate time_consumed"), t[~np.isnan(t)])
+    return {"hosts": len(ips), "modes": stats.table(order=None)}
+
+def main():
+    parser = argparse.ArgumentParser(description="扫描结果的放大倍数统计")
+    parser.add_argument("--magnify", help="service_magnify.csv")
+    parser.add_argument("--services", help="service.csv，与 --agg 一起给出按服务类型的统计")
+    parser.add_argument("--agg", help="aggtest.csv")
+    parser.add_argument("--sep", help="septest.csv，与 --agg 一起给出两种模式的对比")
+    parser.add_argument("--prefix", type=int, default=24)
+    parser.add_argument("--asn", help="前缀到 ASN 的映射文件（routeviews pfx2as）")
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--chunksize", type=int, default=CHUNKSIZE)
+    parser.add_argument("--json", help="把报告写入 JSON 文件")
+    args = parser.parse_args()
+
+    report = {}
+    if args.magnify:
+        table = load_asn_table(args.asn) if args.asn else None
+        report["magnify"] = magnify_report(args.magnify, args.prefix, table, args.top, args.chunksize)
+    if args.services and args.agg:
+        report["services"] = service_type_report(args.services, args.agg, args.top, args.chunksize)
+    if args.agg and args.sep:
+        report["modes"] = compare_modes(args.agg, args.sep, args.chunksize)
+    if not report:
+        parser.print_help()
+        return
+    for section, content in report.items():
+        for name, rows in content.items():
+            if not isinstance(rows, list):
+                print(f"{section}.{name}: {rows}")
+                continue
+            print(f"--- {section}.{name} ---")
+            for row in rows:
+                print("  " + "  ".join(f"{k}={v}" for k, v in row.items()))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,401 @@
+#/usr/bin/python3
+#!coding=utf-8
+
+import asyncio
+import itertools
+import socket
+import metrics
+import utils
+from batch_io import BatchedTransport
+from dns_parser import parse_dns
+from query_builder import SERVICES_QUERY, QueryBuilder, query_header
+from scanner import parse_service_info_an, parse_service_info_ar
+from targets import TargetSource
+from rtt import RTTEstimator
+
+class ScanProtocol(asyncio.DatagramProtocol):
+    """
+    共享UDP套接字上的协议，按 (源地址, 事务ID) 将响应分发给等待中的目标。
+    """
+    def __init__(self):
+        self.transport = None
+        # {(ip, port): {txid: future}}，重传的各个 txid 指向同一个 future
+        self.pending = {}
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        self.deliver(data, addr, None)
+
+    def deliver(self, data, addr, release):
+        """
+        把响应交给等待的请求，返回是否被认领。release 不为 None 时 data 是缓冲池中的
+        memoryview，由认领方解析后调用 release() 归还。
+        """
+        if len(data) < 12:
+            return False
+        waiters = self.pending.get(addr[:2])
+        if not waiters:
+            return False
+        txid = int.from_bytes(data[:2], "big")
+        fut = waiters.pop(txid, None)
+        if fut is None and txid == 0:
+            # 部分 mDNS 应答方不回显事务ID（固定为0），按最早发出的请求匹配
+            txid = next(iter(waiters))
+            fut = waiters.pop(txid)
+        if fut is not None and not fut.done():
+            fut.set_result((data, txid, release))
+            return True
+        return False
+
+    def error_received(self, exc):
+        pass
+
+class AsyncScanner:
+    """
+    基于 asyncio 的聚合模式扫描引擎：少量共享套接字上同时保持大量目标在途，
+    每个目标依次执行 PTR 枚举 -> AN 聚合 ANY -> AR 聚合 ANY 三个阶段。
+    """
+    def __init__(self, concurrency=2000, timeout=2, sockets=1, rate_controller=None, rate_log_interval=None,
+                 retries=1, backoff=2.0, rtt_estimator=None, batched_io=False, batch=64, rcvbuf=None,
+                 service_cache=None):
+        self.concurrency = concurrency
+        self.timeout = timeout
+        # 超时由 rtt.RTTEstimator 按目标前缀估计，未知前缀使用 timeout；
+        # 每次重传使用新的 txid，超时按 backoff 倍数退避
+        self.rtt = rtt_estimator or RTTEstimator(initial=timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.num_sockets = sockets
+        self.endpoints = []
+        # batched_io=True 时使用 batch_io.BatchedTransport：sendmmsg/recvmmsg 批量收发，
+        # 响应写入预分配的缓冲池（非 Linux 平台逐包收发）；rcvbuf 设置套接字接收缓冲区字节数
+        self.batched_io = batched_io
+        self.batch = batch
+        self.rcvbuf = rcvbuf
+        # 可选的 rate_control.AdaptiveRateController，控制发送节奏
+        self.rate_controller = rate_controller
+        self.rate_log_interval = rate_log_interval
+        self._rate_logger = None
+        self._txid = itertools.cycle(range(1, 0x10000))
+        self.builder = QueryBuilder()
+        # 可选的 service_cache.ServiceCache：命中时跳过首轮 PTR 查询
+        self.service_cache = service_cache
+
+    async def open(self):
+        loop = asyncio.get_running_loop()
+        for _ in range(self.num_sockets):
+            if self.batched_io:
+                protocol = ScanProtocol()
+                transport = BatchedTransport(loop, protocol, batch=self.batch, rcvbuf=self.rcvbuf)
+            else:
+                transport, protocol = await loop.create_datagram_endpoint(
+                    ScanProtocol, local_addr=("0.0.0.0", 0))
+                if self.rcvbuf:
+                    transport.get_extra_info("socket").setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.rcvbuf)
+            self.endpoints.append((transport, protocol))
+        if self.rate_controller and self.rate_log_interval:
+            self._rate_logger = asyncio.create_task(self._log_rate())
+
+    def close(self):
+        for transport, _ in self.endpoints:
+            transport.close()
+        self.endpoints = []
+        if self._rate_logger:
+            self._rate_logger.cancel()
+            self._rate_logger = None
+        if self.service_cache is not None:
+            # 扫描结束时把未满一批的条目写盘，否则小规模扫描的缓存不会落盘
+            self.service_cache.sync()
+
+    async def _log_rate(self):
+        """定期把速率与丢包计数写入 rate_control.csv。"""
+        columns = list(self.rate_controller.snapshot())
+        writer = utils.get_writer("rate_control.csv", columns)
+        while True:
+            await asyncio.sleep(self.rate_log_interval)
+            snapshot = self.rate_controller.snapshot()
+            writer.write([snapshot[c] for c in columns])
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, *exc):
+        self.close()
+
+    async def _exchange(self, target, payload, responsive=False, stage="ptr"):
+        """
+        发送一个请求并等待对应响应，超时按 RTT 估计给出，最多重传 retries 次。
+        返回 (data, release)，全部超时时 data 为 None；release 不为 None 时须在解析 data 后调用。
+        responsive 表示目标此前已应答过：只有这类请求的超时才计为丢包，
+        首轮探测无应答多半只是主机未开放 5353，不能作为拥塞信号。
+        stage 为 metrics 中的阶段标签（ptr/an/ar）。
+        """
+        loop = asyncio.get_running_loop()
+        transport, protocol = self.endpoints[hash(target) % len(self.endpoints)]
+        fut = loop.create_future()
+        sent_at = {}
+        data = release = None
+        try:
+            for attempt in range(self.retries + 1):
+                if self.rate_controller:
+                    await self.rate_controller.acquire(target[0])
+                waiters = protocol.pending.setdefault(target, {})
+                txid = next(self._txid)
+                while txid in waiters:
+                    txid = next(self._txid)
+                waiters[txid] = fut
+                sent_at[txid] = loop.time()
+                # 每次重传都按最新的 RTT 估计重新计算超时
+                timeout = self.rtt.timeout(target[0]) * self.backoff ** attempt
+                try:
+                    transport.sendto(txid.to_bytes(2, "big") + memoryview(payload)[2:], target)
+                    metrics.PACKETS_SENT.inc(stage)
+                    metrics.BYTES_SENT.inc(stage, amount=len(payload))
+                    data, answered, release = await asyncio.wait_for(asyncio.shield(fut), timeout)
+                except asyncio.TimeoutError:
+                    metrics.TIMEOUTS.inc(stage)
+                    if self.rate_controller and responsive:
+                        self.rate_controller.record(target[0], True)
+                    continue
+                except OSError:
+                    break
+                now = loop.time()
+                self.rtt.sample(target[0], now - sent_at[answered])
+                metrics.PACKETS_RECEIVED.inc(stage)
+                metrics.BYTES_RECEIVED.inc(stage, amount=len(data))
+                metrics.STAGE_SECONDS.observe(now - min(sent_at.values()), stage)
+                if self.rate_controller and responsive:
+                    self.rate_controller.record(target[0], False)
+                break
+        finally:
+            waiters = protocol.pending.get(target)
+            if waiters is not None:
+                for txid in sent_at:
+                    waiters.pop(txid, None)
+                if not waiters:
+                    protocol.pending.pop(target, None)
+            if not fut.done():
+                fut.cancel()
+            elif data is None and not fut.cancelled():
+                # 响应在放弃等待的同时到达，归还其缓冲区
+                late = fut.result()[2]
+                if late is not None:
+                    late()
+        return data, release
+
+    async def _service_round(self, target, resp, section, parse):
+        """
+        发送一次第二阶段聚合请求，返回 (magnify, len(resp)) 与请求长度；失败返回 -1。
+        """
+        if section == "AN":
+            records, count = resp.an, resp.ancount
+        else:
+            records, count = resp.ar, resp.arcount
+        self.builder.reset()
+        self.builder.add_records(records, count, section)
+        return await self._send_round(target, self.builder.build(count), section, parse)
+
+    async def _send_round(self, target, req, section, parse):
+        data, release = await self._exchange(target, req, responsive=True, stage=section.lower())
+        if data is None:
+            print(f"[{target[0]}] OFFLINE or timeout.")
+            return -1, len(req)
+        try:
+            resp = parse_dns(data)
+        except Exception as e:
+            print(f"An error occurred with {target[0]}: {e}")
+            return -1, len(req)
+        finally:
+            if release:
+                release()
+        return parse(target, len(req), resp), len(req)
+
+    async def _cached_scan(self, target, cached):
+        """与 scanner.cached_scan() 相同：AN 轮失败返回 None，由调用方回退到完整的服务发现。"""
+        an_resp = ar_resp = an_req = ar_req = 0
+        if cached.an_count > 0:
+            ret, an_req = await self._send_round(target, query_header(cached.an_count) + cached.an_payload,
+                                                 "AN", parse_service_info_an)
+            if ret == -1:
+                return None
+            an_resp = ret[1]
+        if cached.ar_count > 0:
+            ret, ar_req = await self._send_round(target, query_header(cached.ar_count) + cached.ar_payload,
+                                                 "AR", parse_service_info_ar)
+            if ret == -1:
+                return None if cached.an_count == 0 else 0
+            ar_resp = ret[1]
+        print(f"[{target[0]}] ONLINE (cached service list)")
+        return cached.result(an_resp, an_req, ar_resp, ar_req)
+
+    @metrics.track_target
+    async def dnssd_scan(self, target_ip, port=5353):
+        """
+        对单个目标执行聚合模式扫描，返回值与 scanner.dnssd_scan() 一致。
+        """
+        target = (target_ip, port)
+
+        if self.service_cache is not None:
+            cached = self.service_cache.get(target)
+            if cached is not None:
+                ret = await self._cached_scan(target, cached)
+                if ret is not None:
+                    return ret
+                self.service_cache.invalidate(target)
+
+        # 阶段一: 查询所有服务
+        f_req = SERVICES_QUERY
+        data, release = await self._exchange(target, f_req)
+        if data is None:
+            print(f"[{target[0]}] OFFLINE or timeout.")
+            return -1
+        try:
+            magnify = round(len(data)/len(f_req),2)
+            utils.get_magnify(target,len(f_req),len(data),magnify,"DNS-SD")
+            resp = parse_dns(data)
+        finally:
+            if release:
+                release()
+
+        an_mag = ar_mag = 0
+        an_resp = ar_resp = 0
+        an_req = ar_req = 0
+        print(f"[{target[0]}] ONLINE")
+        if self.service_cache is not None:
+            self.service_cache.put(target, resp, len(resp), magnify)
+
+        # 阶段二: 基于 ancount 的聚合查询
+        if resp.ancount > 0:
+            ret, req_len = await self._service_round(target, resp, "AN", parse_service_info_an)
+            if ret == -1:
+                return 0
+            an_mag, an_resp = ret
+            an_req = req_len
+
+        # 阶段三: 基于 arcount 的聚合查询
+        if resp.arcount > 0:
+            ret, req_len = await self._service_round(target, resp, "AR", parse_service_info_ar)
+            if ret == -1:
+                return 0
+            ar_mag, ar_resp = ret
+            ar_req = req_len
+
+        total_req_len = len(f_req) + an_req + ar_req
+        total_resp_len = len(resp) + an_resp + ar_resp
+        mdns_mag = total_resp_len / total_req_len if total_req_len > 0 else 0
+        return [magnify, mdns_mag, total_resp_len, total_req_len, resp.ancount+resp.arcount]
+
+    async def scan(self, targets):
+        """
+        并发扫描目标序列（IP 或 (IP, 端口)），按完成顺序逐个产出 (目标, 结果)。
+        targets 可以是普通可迭代对象或异步可迭代对象，均被惰性消费，在途目标数不超过 concurrency。
+        """
+        done = asyncio.Queue()
+        if hasattr(targets, "__aiter__"):
+            source = targets.__aiter__()
+            lock = asyncio.Lock()
+
+            async def next_target():
+                # 异步生成器不允许并发调用 __anext__，用锁串行化
+                async with lock:
+                    return await source.__anext__()
+        else:
+            source = iter(targets)
+
+            async def next_target():
+                try:
+                    return next(source)
+                except StopIteration:
+                    raise StopAsyncIteration
+
+        async def worker():
+            while True:
+                try:
+                    item = await next_target()
+                except StopAsyncIteration:
+                    break
+                ip, port = item if isinstance(item, tuple) else (item, 5353)
+                try:
+                    result = await self.dnssd_scan(ip, port)
+                except Exception as e:
+                    print(f"An error occurred with {ip}: {e}")
+                    result = -1
+                await done.put((item, result))
+            await done.put(None)
+
+        workers = [asyncio.create_task(worker()) for _ in range(self.concurrency)]
+        remaining = len(workers)
+        try:
+            while remaining:
+                item = await done.get()
+                if item is None:
+                    remaining -= 1
+                    continue
+                yield item
+        finally:
+            for w in workers:
+                w.cancel()
+
+def run_scan(targets, concurrency=2000, timeout=2, sockets=1, rate_controller=None, service_cache=None):
+    """
+    同步入口：并发扫描目标列表，返回 [(目标, 结果), ...]。
+    """
+    async def _main():
+        results = []
+        async with AsyncScanner(concurrency, timeout, sockets, rate_controller, service_cache=service_cache) as scanner:
+            async for item in scanner.scan(targets):
+                results.append(item)
+        return results
+    return asyncio.run(_main())
+
+MAGNIFY_STATUS_COLUMNS = ["IP", "Port_5353_Status", "dnssd_mag", "mdns_mag", "total_resp_len"]
+
+def magnify_stream(paths, checkpoint="magnify.ckpt", require=None, concurrency=2000, timeout=2, checkpoint_every=1000,
+                   rate_controller=None):
+    """
+    流式版本的 magnify_test()：逐个读取目标文件中的 IP 并发扫描，
+    每个目标的状态追加写入 magnify_status.csv，不在内存中保存或改写目标列表。
+    中断后以相同参数重新运行即可从检查点继续。
+    """
+    source = TargetSource(paths, checkpoint, require=require)
+    status = utils.get_writer("magnify_status.csv", MAGNIFY_STATUS_COLUMNS)
+    dnssd_max = mdns_max = len_max = 0
+
+    async def _main():
+        nonlocal dnssd_max, mdns_max, len_max
+        finished = 0
+        async with AsyncScanner(concurrency, timeout, rate_controller=rate_controller, rate_log_interval=10) as scanner:
+            async for ip, result in scanner.scan(source):
+                if result == -1:
+                    status.write([ip, "Close", "", "", ""])
+                elif result == 0:
+                    status.write([ip, "Open", "", "", ""])
+                else:
+                    status.write([ip, "Open", result[0], result[1], result[2]])
+                    dnssd_max = max(dnssd_max, result[0])
+                    mdns_max = max(mdns_max, result[1])
+                    len_max = max(len_max, result[2])
+                source.mark_done(ip)
+                finished += 1
+                if finished % checkpoint_every == 0:
+                    print(f"{source.position} scan finished")
+                    utils.flush_writers()
+                    source.save()
+
+    try:
+        asyncio.run(_main())
+    finally:
+        utils.flush_writers()
+        source.save()
+    print("Scan end")
+    print(f"Max DNS-SD magnify: {dnssd_max}")
+    print(f"Max mDNS magnify: {mdns_max}")
+    print(f"Skipped duplicates: {source.duplicates}")
+
+if __name__ == "__main__":
+    import sys
+    for target, result in run_scan(sys.argv[1:] or ["8.8.8.8"]):
+        print(target, result)
@@ -0,0 +1,317 @@
+#/usr/bin/python3
+#!coding=utf-8
+
+import collections
+import ctypes
+import errno
+import socket
+import struct
+import sys
+import threading
+
+# 接收缓冲区大小，与原先 recvfrom(10240) 相同
+BUFFER_SIZE = 10240
+MSG_DONTWAIT = getattr(socket, "MSG_DONTWAIT", 0x40)
+
+class _IOVec(ctypes.Structure):
+    _fields_ = [("iov_base", ctypes.c_void_p), ("iov_len", ctypes.c_size_t)]
+
+class _SockAddrIn(ctypes.Structure):
+    _fields_ = [("sin_family", ctypes.c_ushort), ("sin_port", ctypes.c_uint16),
+                ("sin_addr", ctypes.c_ubyte * 4), ("sin_zero", ctypes.c_ubyte * 8)]
+
+class _MsgHdr(ctypes.Structure):
+    _fields_ = [("msg_name", ctypes.c_void_p), ("msg_namelen", ctypes.c_uint32),
+                ("msg_iov", ctypes.POINTER(_IOVec)), ("msg_iovlen", ctypes.c_size_t),
+                ("msg_control", ctypes.c_void_p), ("msg_controllen", ctypes.c_size_t),
+                ("msg_flags", ctypes.c_int)]
+
+class _MMsgHdr(ctypes.Structure):
+    _fields_ = [("msg_hdr", _MsgHdr), ("msg_len", ctypes.c_uint)]
+
+def _load_mmsg():
+    if not sys.platform.startswith("linux") or ctypes.sizeof(_IOVec) != 16:
+        return None
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        libc.sendmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(_MMsgHdr), ctypes.c_uint, ctypes.c_int]
+        libc.recvmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(_MMsgHdr), ctypes.c_uint, ctypes.c_int, ctypes.c_void_p]
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+_libc = _load_mmsg()
+# 当前平台是否支持 sendmmsg/recvmmsg；不支持时 BatchSocket 退化为逐包收发
+HAVE_MMSG = _libc is not None
+_local = threading.local()
+
+class BufferPool:
+    """
+    预分配的接收缓冲区池。每个槽位是一个固定大小的 bytearray，地址只计算一次，
+    可直接作为 recvmmsg 的 iovec；空闲槽位按先进先出轮转复用，不足时自动扩充。
+    """
+    def __init__(self, count=256, size=BUFFER_SIZE):
+        self.size = size
+        self.buffers = []
+        self.addresses = []
+        self.free = collections.deque()
+        self._grow(count)
+
+    def _grow(self, count):
+        for _ in range(count):
+            buf = bytearray(self.size)
+            self.free.append(len(self.buffers))
+            self.buffers.append(buf)
+            self.addresses.append(ctypes.addressof((ctypes.c_char * self.size).from_buffer(buf)))
+
+    def acquire(self):
+        if not self.free:
+            self._grow(max(len(self.buffers) // 2, 16))
+        return self.free.popleft()
+
+    def release(self, slot):
+        self.free.append(slot)
+
+    def view(self, slot, length):
+        return memoryview(self.buffers[slot])[:length]
+
+    def in_use(self):
+        return len(self.buffers) - len(self.free)
+
+def recv_buffer():
+    """当前线程复用的接收缓冲区，供阻塞式扫描 recvfrom_into() 使用。"""
+    buf = getattr(_local, "buf", None)
+    if buf is None:
+        buf = _local.buf = bytearray(BUFFER_SIZE)
+    return buf
+
+_SOCKADDR = struct.Struct("=H2s4s8x")
+# 与 _IOVec / mmsghdr.msg_len 的内存布局对应（64 位 Linux）
+_IOV = struct.Struct("=QQ")
+_IOV_BASE = struct.Struct("=Q")
+_IOV_LEN = struct.Struct("=Q")
+_UINT = struct.Struct("=I")
+
+def _sockaddr(addr):
+    """(ip, port) 编码为 sockaddr_in 的 16 字节。"""
+    return _SOCKADDR.pack(socket.AF_INET, addr[1].to_bytes(2, "big"), socket.inet_aton(addr[0]))
+
+class BatchSocket:
+    """
+    非阻塞 IPv4 UDP 套接字上的批量收发：Linux 上一次系统调用收发最多 batch 个数据报
+    （sendmmsg/recvmmsg），其他平台逐包 sendto/recvfrom_into。接收的数据写入 BufferPool 槽位。
+    mmsghdr/iovec/sockaddr 数组只构造一次，之后每个数据报只做切片复制与整数写入。
+    """
+    def __init__(self, sock, pool=None, batch=64, use_mmsg=None, max_send=BUFFER_SIZE):
+        self.sock = sock
+        self.sock.setblocking(False)
+        self.fd = sock.fileno()
+        self.batch = batch
+        self.pool = pool or BufferPool(batch * 4)
+        self.use_mmsg = HAVE_MMSG if use_mmsg is None else (use_mmsg and HAVE_MMSG)
+        self.slots = [self.pool.acquire() for _ in range(batch)]
+        self._addr_cache = {}
+        if self.use_mmsg:
+            self._recv = self._build(batch)
+            self._send = self._build(batch)
+            iov = self._recv[0]
+            for i in range(batch):
+                _IOV.pack_into(iov, i * _IOV.size, self.pool.addresses[self.slots[i]], self.pool.size)
+            # 发送缓冲区：每个数据报占一段固定位置，iov_base 不再变化
+            self.max_send = max_send
+            self._send_buf = bytearray(batch * max_send)
+            base = ctypes.addressof((ctypes.c_char * len(self._send_buf)).from_buffer(self._send_buf))
+            iov = self._send[0]
+            for i in range(batch):
+                _IOV.pack_into(iov, i * _IOV.size, base + i * max_send, 0)
+
+    def _build(self, n):
+        # 三个数组都建立在 bytearray 上，热路径用 struct.pack_into/切片直接读写，避免 ctypes 属性访问
+        iov_buf = bytearray(ctypes.sizeof(_IOVec) * n)
+        iov = (_IOVec * n).from_buffer(iov_buf)
+        names = bytearray(ctypes.sizeof(_SockAddrIn) * n)
+        names_base = ctypes.addressof((ctypes.c_char * len(names)).from_buffer(names))
+        msgs_buf = bytearray(ctypes.sizeof(_MMsgHdr) * n)
+        msgs = (_MMsgHdr * n).from_buffer(msgs_buf)
+        for i in range(n):
+            hdr = msgs[i].msg_hdr
+            hdr.msg_iov = ctypes.pointer(iov[i])
+            hdr.msg_iovlen = 1
+            hdr.msg_name = names_base + i * ctypes.sizeof(_SockAddrIn)
+            hdr.msg_namelen = ctypes.sizeof(_SockAddrIn)
+        return iov_buf, names, msgs_buf, msgs
+
+    def send_many(self, packets):
+        """
+        发送 [(data, (ip, port)), ...]，返回已处理（发送或因错误丢弃）的条数；
+        返回值小于 len(packets) 表示发送缓冲区已满，需等待可写后继续。
+        长于 max_send 的数据报不经 sendmmsg，逐个用 sendto 发送。
+        """
+        if not self.use_mmsg:
+            for done, (data, addr) in enumerate(packets):
+                try:
+                    self.sock.sendto(data, addr)
+                except BlockingIOError:
+                    return done
+                except OSError:
+                    pass
+            return len(packets)
+        iov, names, _, msgs = self._send
+        buf, size, cache = self._send_buf, self.max_send, self._addr_cache
+        pack_len = _IOV_LEN.pack_into
+        done = 0
+        while done < len(packets):
+            chunk = packets[done:done + self.batch]
+            n = 0
+            for i, (data, addr) in enumerate(chunk):
+                if len(data) > size:
+                    break
+                n = i + 1
+                offset = i * size
+                buf[offset:offset + len(data)] = data
+                pack_len(iov, i * 16 + 8, len(data))
+                name = cache.get(addr)
+                if name is None:
+                    if len(cache) > 65536:
+                        cache.clear()
+                    name = cache[addr] = _sockaddr(addr)
+                names[i * 16:i * 16 + 16] = name
+            if n == 0:
+                # 超过槽位大小（max_send）的数据报不能放入发送缓冲区，单独用 sendto 发送
+                data, addr = chunk[0]
+                try:
+                    self.sock.sendto(data, addr)
+                except BlockingIOError:
+                    return done
+                except OSError:
+                    pass
+                done += 1
+                continue
+            sent = _libc.sendmmsg(self.fd, msgs, n, MSG_DONTWAIT)
+            if sent < 0:
+                err = ctypes.get_errno()
+                if err in (errno.EAGAIN, errno.EWOULDBLOCK, errno.ENOBUFS):
+                    return done
+                if err == errno.EINTR:
+                    continue
+                # 首个数据报出错（如挂起的 ICMP 错误）：丢弃它并继续
+                sent = 1
+            done += sent
+        return done
+
+    def recv_many(self):
+        """
+        非阻塞地接收至多 batch 个数据报，返回 [(槽位, 长度, (ip, port)), ...]。
+        返回的槽位由调用方负责 pool.release()；本对象会为下一次接收换入新的槽位。
+        出现挂起的套接字错误（如 ICMP 端口不可达）时返回 None，错误已被清除，可再次调用。
+        """
+        received = []
+        if not self.use_mmsg:
+            for i in range(self.batch):
+                slot = self.slots[i]
+                try:
+                    n, addr = self.sock.recvfrom_into(self.pool.buffers[slot])
+                except (BlockingIOError, InterruptedError):
+                    break
+                except OSError:
+                    return received or None
+                received.append((slot, n, addr[:2]))
+                self.slots[i] = self.pool.acquire()
+            return received
+        iov, names, msgs_buf, msgs = self._recv
+        n = _libc.recvmmsg(self.fd, msgs, self.batch, MSG_DONTWAIT, None)
+        if n < 0:
+            err = ctypes.get_errno()
+            if err in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                return received
+            return None
+        cache = self._addr_cache
+        acquire, addresses = self.pool.acquire, self.pool.addresses
+        msg_size, len_offset = ctypes.sizeof(_MMsgHdr), _MMsgHdr.msg_len.offset
+        for i in range(n):
+            raw = bytes(names[i * 16:i * 16 + 8])
+            addr = cache.get(raw)
+            if addr is None:
+                if len(cache) > 65536:
+                    cache.clear()
+                _, port, ip = _SOCKADDR.unpack(raw + bytes(8))
+                addr = cache[raw] = (socket.inet_ntoa(ip), int.from_bytes(port, "big"))
+            length = _UINT.unpack_from(msgs_buf, i * msg_size + len_offset)[0]
+            received.append((self.slots[i], length, addr))
+            slot = self.slots[i] = acquire()
+            _IOV_BASE.pack_into(iov, i * 16, addresses[slot])
+        return received
+
+    def close(self):
+        self.sock.close()
+
+class BatchedTransport:
+    """
+    为 async_scanner 提供与 DatagramTransport 相同的 sendto()/close() 接口：
+    同一轮事件循环中的发送被合并为一次 send_many()，可读时循环 recv_many()，
+    并把池中缓冲区的 memoryview 交给 protocol.deliver()；未被认领的缓冲区立即归还。
+    """
+    def __init__(self, loop, protocol, local_addr=("0.0.0.0", 0), batch=64, rcvbuf=None):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        if rcvbuf:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+        sock.bind(local_addr)
+        self.loop = loop
+        self.protocol = protocol
+        self.io = BatchSocket(sock, batch=batch)
+        self.pool = self.io.pool
+        self.outbox = []
+        self._flush_scheduled = False
+        self._writer = False
+        self._closed = False
+        loop.add_reader(self.io.fd, self._on_readable)
+        protocol.connection_made(self)
+
+    def sendto(self, data, addr):
+        if self._closed:
+            return
+        self.outbox.append((bytes(data), addr))
+        if not self._flush_scheduled and not self._writer:
+            self._flush_scheduled = True
+            self.loop.call_soon(self._flush)
+
+    def _flush(self):
+        self._flush_scheduled = False
+        if not self.outbox or self._closed:
+            return
+        done = self.io.send_many(self.outbox)
+        del self.outbox[:done]
+        if self.outbox and not self._writer:
+            self._writer = True
+            self.loop.add_writer(self.io.fd, self._on_writable)
+
+    def _on_writable(self):
+        self.loop.remove_writer(self.io.fd)
+        self._writer = False
+        self._flush()
+
+    def _on_readable(self):
+        pool = self.pool
+        while True:
+            received = self.io.recv_many()
+            if received is None:
+                continue
+            for slot, length, addr in received:
+                if not self.protocol.deliver(pool.view(slot, length), addr, lambda s=slot: pool.release(s)):
+                    pool.release(slot)
+            if len(received) < self.io.batch:
+                return
+
+    def get_extra_info(self, name, default=None):
+        if name == "sockname":
+            return self.io.sock.getsockname()
+        return default
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self.loop.remove_reader(self.io.fd)
+        if self._writer:
+            self.loop.remove_writer(self.io.fd)
+        self.io.close()
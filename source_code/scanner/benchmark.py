@@ -0,0 +1,348 @@
+#/usr/bin/python3
+#!coding=utf-8
+
+import argparse
+import asyncio
+import json
+import os
+import struct
+import sys
+import tempfile
+import time
+import utils
+from responder_sim import DEFAULT_SERVICES, ResponderFarm, ResponderProfile, VirtualResponder, encode_name
+
+# 可基准测试的扫描模式
+MODES = ["aggregate", "separate", "pipelined", "hybrid", "threads", "async", "batched", "sharded"]
+
+def _timed(func, ip, port, latencies):
+    start = time.perf_counter()
+    try:
+        result = func(ip, port)
+    except Exception as e:
+        print(f"An error occurred with {ip}: {e}")
+        result = -1
+    latencies.append(time.perf_counter() - start)
+    return result
+
+def bench_sync(targets, func_name="dnssd_scan"):
+    """使用阻塞式 dnssd_scan()（或 separate_send()、separate_pipelined()、hybrid_send()）逐个扫描。"""
+    import scanner
+    func = getattr(scanner, func_name)
+    latencies = []
+    results = [_timed(func, ip, port, latencies) for ip, port in targets]
+    return results, latencies
+
+def bench_threads(targets, threads):
+    """与 run_threads() 相同，用线程池并发调用阻塞式 dnssd_scan()。"""
+    import concurrent.futures
+    import scanner
+    latencies = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=threads) as executor:
+        results = list(executor.map(lambda t: _timed(scanner.dnssd_scan, t[0], t[1], latencies), targets))
+    return results, latencies
+
+def bench_async(targets, concurrency, retries=1, batched_io=False):
+    """使用 asyncio 引擎并发扫描，逐个目标记录耗时；batched_io 使用 sendmmsg/recvmmsg 批量收发。"""
+    import async_scanner
+    latencies = []
+
+    class TimedScanner(async_scanner.AsyncScanner):
+        async def dnssd_scan(self, target_ip, port=5353):
+            start = time.perf_counter()
+            try:
+                return await super().dnssd_scan(target_ip, port)
+            finally:
+                latencies.append(time.perf_counter() - start)
+
+    async def _main():
+        async with TimedScanner(concurrency, retries=retries, batched_io=batched_io) as scanner:
+            return [result async for _, result in scanner.scan(targets)]
+    return asyncio.run(_main()), latencies
+
+def bench_sharded(targets, workers, concurrency, retries=1):
+    """多进程分片扫描；单目标耗时在工作进程内，不统计。"""
+    import sharded
+    return [result for _, result in sharded.scan_sharded(targets, workers, concurrency=concurrency, retries=retries)], []
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(int(round(q / 100 * (len(values) - 1))), len(values) - 1)]
+
+def _usage():
+    import resource
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu = own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+    # Linux 上 ru_maxrss 单位为 KB
+    return cpu, max(own.ru_maxrss, children.ru_maxrss) / 1024
+
+def _run_mode(mode, targets, options, conn):
+    """
+    在独立进程中运行一种扫描模式，使 CPU 时间与峰值内存只反映该模式本身。
+    扫描产生的 CSV 写入临时目录。
+    """
+    # 扫描过程的输出（包括分片模式的子进程）重定向到 /dev/null
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    saved = os.dup(1)
+    os.dup2(devnull, 1)
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            cpu0, _ = _usage()
+            start = time.perf_counter()
+            if mode == "aggregate":
+                results, latencies = bench_sync(targets)
+            elif mode == "separate":
+                results, latencies = bench_sync(targets, "separate_send")
+            elif mode == "pipelined":
+                results, latencies = bench_sync(targets, "separate_pipelined")
+            elif mode == "hybrid":
+                results, latencies = bench_sync(targets, "hybrid_send")
+            elif mode == "threads":
+                results, latencies = bench_threads(targets, options["threads"])
+            elif mode == "async":
+                results, latencies = bench_async(targets, options["concurrency"], options["retries"])
+            elif mode == "batched":
+                results, latencies = bench_async(targets, options["concurrency"], options["retries"], batched_io=True)
+            else:
+                results, latencies = bench_sharded(targets, options["workers"], options["concurrency"], options["retries"])
+            utils.close_writers()
+            elapsed = time.perf_counter() - start
+            cpu1, rss = _usage()
+        finally:
+            sys.stdout.flush()
+            os.dup2(saved, 1)
+    p50, p99 = percentile(latencies, 50), percentile(latencies, 99)
+    conn.send({
+        "mode": mode,
+        "targets": len(targets),
+        "ok": sum(1 for r in results if r != -1 and r != 0),
+        "seconds": round(elapsed, 4),
+        "targets_per_s": round(len(targets) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(p50 * 1000, 3) if p50 is not None else None,
+        "p99_ms": round(p99 * 1000, 3) if p99 is not None else None,
+        "cpu_s": round(cpu1 - cpu0, 3),
+        "max_rss_mb": round(rss, 1),
+    })
+
+def run_mode(mode, targets, options):
+    import multiprocessing
+    ctx = multiprocessing.get_context("spawn")
+    parent, child = ctx.Pipe()
+    proc = ctx.Process(target=_run_mode, args=(mode, targets, options, child))
+    proc.start()
+    report = parent.recv() if parent.poll(options.get("mode_timeout", 3600)) else None
+    proc.join()
+    return report
+
+def check_regression(reports, baseline_path, tolerance):
+    """与基线 JSON 对比吞吐量，任一模式下降超过 tolerance 比例时返回 False。"""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {r["mode"]: r for r in json.load(f)["reports"]}
+    ok = True
+    for report in reports:
+        base = baseline.get(report["mode"])
+        if base is None:
+            continue
+        floor = base["targets_per_s"] * (1 - tolerance)
+        if report["targets_per_s"] < floor:
+            print(f"REGRESSION {report['mode']}: {report['targets_per_s']} targets/s < {floor:.2f} (baseline {base['targets_per_s']})")
+            ok = False
+    return ok
+
+def load_corpus(path=None, hosts=1):
+    """
+    加载响应语料：pcap 文件（取源端口 5353 的 UDP 载荷）或存放原始报文 *.bin 的目录；
+    未指定时使用桩应答方生成的响应，hosts 个应答方的地址、主机名与事务ID各不相同（模拟同一固件的设备）。
+    """
+    if path is None:
+        ptr_query = struct.pack("!HHHHHH", 1, 0x0100, 1, 0, 0, 0) + encode_name("_services._dns-sd._udp.local") + b"\x00\x0c\x00\x01"
+        any_query = struct.pack("!HHHHHH", 1, 0x0100, len(DEFAULT_SERVICES), 0, 0, 0)
+        any_query += b"".join(encode_name(s) + b"\x00\xff\x00\x01" for s in DEFAULT_SERVICES)
+        corpus = []
+        for i in range(hosts):
+            profile = ResponderProfile(hostname="stub.local" if hosts == 1 else f"dev{i % 10000:04d}.local")
+            stub = VirtualResponder(profile, f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}")
+            for query in (ptr_query, any_query):
+                resp = stub.build_response(query)
+                corpus.append(struct.pack("!H", (i * 7919 + len(corpus)) & 0xffff) + resp[2:])
+        return corpus
+    if os.path.isdir(path):
+        corpus = []
+        for name in sorted(os.listdir(path)):
+            if name.endswith(".bin"):
+                with open(os.path.join(path, name), "rb") as f:
+                    corpus.append(f.read())
+        return corpus
+    from scapy.all import rdpcap, UDP
+    return [bytes(pkt[UDP].payload) for pkt in rdpcap(path) if UDP in pkt and pkt[UDP].sport == 5353]
+
+def walk_records(resp):
+    """模拟扫描器对每条记录的字段访问。"""
+    for section, count in ((resp.an, resp.ancount), (resp.ar, resp.arcount)):
+        for i in range(0, count):
+            rr = section[i]
+            rr.rrname.decode()
+            if hasattr(rr, "rdata"):
+                rr.rdata
+            if hasattr(rr, "port"):
+                rr.port
+            if hasattr(rr, "target"):
+                rr.target
+
+def bench_parser(corpus, rounds):
+    """对比 scapy DNS(data)、dns_parser.parse_wire() 与经由指纹缓存（ParseCache）的解析耗时。"""
+    from scapy.all import DNS
+    from dns_parser import parse_wire, ParseCache
+    cache = ParseCache()
+    timings = {}
+    for name, parse in (("scapy DNS(data)", DNS), ("dns_parser", parse_wire), ("dns_parser+cache", cache.parse)):
+        start = time.perf_counter()
+        for _ in range(rounds):
+            for data in corpus:
+                walk_records(parse(data))
+        timings[name] = time.perf_counter() - start
+    print(f"parse cache: {len(cache)} templates, hit rate {cache.hit_rate():.1%}")
+    return timings
+
+def run_engine_bench(args):
+    profile = ResponderProfile(
+        [f"_svc{i}._tcp.local" for i in range(args.services)] if args.services else DEFAULT_SERVICES,
+        txt_size=args.txt_size, latency=args.latency, jitter=args.jitter, loss=args.loss, malformed=args.malformed)
+    options = {"concurrency": args.concurrency, "threads": args.threads, "workers": args.workers, "retries": args.retries}
+    modes = [m.strip() for m in args.modes.split(",") if m.strip()]
+    for mode in modes:
+        if mode not in MODES:
+            raise SystemExit(f"Unknown mode {mode}, choose from {', '.join(MODES)}")
+
+    reports = []
+    # 应答方运行在单独进程中，不计入被测模式的 CPU 与内存
+    network = None if args.network == "none" else args.network
+    with ResponderFarm(args.targets, profile, network, args.port, args.seed, process=True) as farm:
+        for mode in modes:
+            report = run_mode(mode, farm.targets, options)
+            if report is None:
+                print(f"{mode}: failed")
+                continue
+            reports.append(report)
+
+    print(f"targets={args.targets} latency={args.latency}s jitter={args.jitter}s loss={args.loss} malformed={args.malformed}")
+    print(f"  {'mode':10s} {'ok':>6s} {'targets/s':>10s} {'p50 ms':>9s} {'p99 ms':>9s} {'cpu s':>8s} {'rss MB':>8s}")
+    for r in reports:
+        p50 = f"{r['p50_ms']:.2f}" if r["p50_ms"] is not None else "-"
+        p99 = f"{r['p99_ms']:.2f}" if r["p99_ms"] is not None else "-"
+        print(f"  {r['mode']:10s} {r['ok']:6d} {r['targets_per_s']:10.1f} {p50:>9s} {p99:>9s} {r['cpu_s']:8.2f} {r['max_rss_mb']:8.1f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"config": vars(args), "reports": reports}, f, indent=2)
+    if args.baseline and not check_regression(reports, args.baseline, args.tolerance):
+        raise SystemExit(1)
+
+def bench_io(packets, size, batch):
+    """
+    回环上的纯收发吞吐：逐包 sendto()/recvfrom(10240) 对比 batch_io.BatchSocket 的
+    sendmmsg/recvmmsg + 缓冲池。每发送 batch 个数据报就全部收完，避免接收缓冲区溢出。
+    """
+    import socket
+    from batch_io import BatchSocket
+    payload = bytes(size)
+    timings = {}
+    for name in ("per-packet", "batched"):
+        sink = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sink.bind(("127.0.0.1", 0))
+        addr = sink.getsockname()
+        sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        window = [(payload, addr)] * batch
+        start = time.perf_counter()
+        if name == "per-packet":
+            for _ in range(packets // batch):
+                for data, target in window:
+                    sender.sendto(data, target)
+                for _ in range(batch):
+                    sink.recvfrom(10240)
+        else:
+            out, inbox = BatchSocket(sender, batch=batch), BatchSocket(sink, batch=batch)
+            for _ in range(packets // batch):
+                sent = 0
+                while sent < batch:
+                    sent += out.send_many(window[sent:])
+                got = 0
+                while got < batch:
+                    received = inbox.recv_many() or []
+                    for slot, _, _ in received:
+                        inbox.pool.release(slot)
+                    got += len(received)
+        timings[name] = time.perf_counter() - start
+        sender.close()
+        sink.close()
+    return timings
+
+def run_io_bench(args):
+    import batch_io
+    timings = bench_io(args.packets, args.size, args.batch)
+    n = args.packets // args.batch * args.batch
+    print(f"packets={n} size={args.size} batch={args.batch} mmsg={'yes' if batch_io.HAVE_MMSG else 'no (per-packet fallback)'}")
+    for name, elapsed in timings.items():
+        print(f"  {name:10s}: {elapsed:.3f}s  {n / elapsed:,.0f} packets/s")
+
+def run_parser_bench(args):
+    corpus = load_corpus(args.corpus, args.hosts)
+    if not corpus:
+        print("语料为空。")
+        return
+    timings = bench_parser(corpus, args.rounds)
+    n = len(corpus) * args.rounds
+    print(f"responses={len(corpus)} rounds={args.rounds}")
+    for name, elapsed in timings.items():
+        print(f"  {name:16s}: {elapsed:.3f}s  {elapsed / n * 1e6:.1f} us/response")
+
+def main():
+    parser = argparse.ArgumentParser(description="扫描器性能基准")
+    sub = parser.add_subparsers(dest="command")
+
+    engine = sub.add_parser("engine", help="在本地虚拟应答方上对比各扫描模式的吞吐量、时延、CPU 与内存")
+    engine.add_argument("--modes", default="aggregate,async", help=f"逗号分隔，可选 {','.join(MODES)}")
+    engine.add_argument("--targets", type=int, default=200, help="虚拟应答方数量")
+    engine.add_argument("--network", default="127.10.0.0/16", help="应答方绑定的回环网段，none 表示全部使用 127.0.0.1 随机端口")
+    engine.add_argument("--port", type=int, default=5353)
+    engine.add_argument("--services", type=int, default=0, help="每个应答方通告的服务数，0 为默认的 4 个")
+    engine.add_argument("--txt-size", type=int, default=20, help="每个服务 TXT 记录的字节数")
+    engine.add_argument("--latency", type=float, default=0.005, help="应答方响应延迟（秒）")
+    engine.add_argument("--jitter", type=float, default=0.0)
+    engine.add_argument("--loss", type=float, default=0.0, help="应答方丢弃请求的概率")
+    engine.add_argument("--malformed", type=float, default=0.0, help="应答方返回畸形报文的概率")
+    engine.add_argument("--seed", type=int, default=0)
+    engine.add_argument("--concurrency", type=int, default=2000)
+    engine.add_argument("--threads", type=int, default=32, help="threads 模式的线程数")
+    engine.add_argument("--workers", type=int, default=None, help="sharded 模式的进程数，默认每核一个")
+    engine.add_argument("--retries", type=int, default=1, help="async/sharded 模式的重传次数")
+    engine.add_argument("--json", help="把结果写入 JSON 文件")
+    engine.add_argument("--baseline", help="基线 JSON，吞吐量低于基线超过 --tolerance 时退出码为 1")
+    engine.add_argument("--tolerance", type=float, default=0.2)
+
+    io = sub.add_parser("io", help="对比逐包收发与 sendmmsg/recvmmsg 批量收发的回环吞吐")
+    io.add_argument("--packets", type=int, default=200000)
+    io.add_argument("--size", type=int, default=46, help="数据报字节数，默认为首轮 PTR 查询的长度")
+    io.add_argument("--batch", type=int, default=64)
+
+    parse = sub.add_parser("parser", help="对比 scapy 与 dns_parser 的解析耗时")
+    parse.add_argument("--corpus", help="pcap 文件或 *.bin 响应目录，缺省使用桩应答方生成的响应")
+    parse.add_argument("--rounds", type=int, default=2000)
+    parse.add_argument("--hosts", type=int, default=1, help="缺省语料中模拟的设备数")
+
+    args = parser.parse_args()
+    if args.command == "parser":
+        run_parser_bench(args)
+    elif args.command == "io":
+        run_io_bench(args)
+    elif args.command == "engine":
+        run_engine_bench(args)
+    else:
+        parser.print_help()
+
+if __name__ == "__main__":
+    main()
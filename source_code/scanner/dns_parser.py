@@ -0,0 +1,377 @@
+#/usr/bin/python3
+#!coding=utf-8
+
+import collections
+import socket
+import struct
+import threading
+import metrics
+
+# 与 scapy 一致：以下类型的 rdata 为域名（NS, MD, MF, CNAME, PTR, DNAME）
+NAME_TYPES = frozenset((2, 3, 4, 5, 12, 39))
+# scapy 对以下类型使用专门的记录类，字段与 DNSRR 不同，交由 scapy 解析
+SCAPY_ONLY_TYPES = frozenset((6, 13, 15, 35, 41, 43, 46, 48, 50, 51, 64, 65, 250, 32769))
+
+_HEADER = struct.Struct("!HHHHHH")
+_RR_FIXED = struct.Struct("!HHIH")
+_SRV_FIXED = struct.Struct("!HHH")
+
+class DNSParseError(ValueError):
+    """报文格式错误或包含本解析器不处理的记录类型。"""
+
+class DNSQuestion:
+    __slots__ = ("qname", "qtype", "qclass")
+
+    def __init__(self, qname, qtype, qclass):
+        self.qname = qname
+        self.qtype = qtype
+        self.qclass = qclass
+
+class DNSRecord:
+    """
+    资源记录。属性名与 scapy 保持一致：只有该类型具备的字段才会被赋值，
+    因此 hasattr(rr, "rdata") / hasattr(rr, "port") 等探测与 scapy 行为相同。
+    """
+    __slots__ = ("rrname", "type", "cacheflush", "rclass", "ttl", "rdlen",
+                 "rdata", "priority", "weight", "port", "target", "nextname", "typebitmaps")
+
+    def __init__(self, rrname, rtype, rclass, ttl, rdlen):
+        self.rrname = rrname
+        self.type = rtype
+        self.cacheflush = rclass >> 15
+        self.rclass = rclass & 0x7fff
+        self.ttl = ttl
+        self.rdlen = rdlen
+
+    def __repr__(self):
+        fields = []
+        for name in self.__slots__:
+            if hasattr(self, name):
+                fields.append(f"{name}={getattr(self, name)!r}")
+        return f"<DNSRecord {' '.join(fields)}>"
+
+class DNSMessage:
+    """
+    解析后的 DNS 报文，提供 scapy DNS 报文在扫描器中用到的属性与 len()。
+    """
+    __slots__ = ("id", "flags", "qdcount", "ancount", "nscount", "arcount",
+                 "qd", "an", "ns", "ar", "length")
+
+    def __len__(self):
+        return self.length
+
+    def show(self):
+        print(f"###[ DNS ]### id={self.id} flags={self.flags:#06x} "
+              f"qdcount={self.qdcount} ancount={self.ancount} nscount={self.nscount} arcount={self.arcount}")
+        for section in ("an", "ns", "ar"):
+            for rr in getattr(self, section):
+                print(f"  {section} {rr!r}")
+
+def _read_name(buf, pos, cache):
+    """
+    从 pos 处解码（可能被压缩的）域名，返回 (name, 名称之后的偏移)。
+    cache 以起始偏移为键缓存 (name, 结束偏移)，压缩指针指向同一偏移时直接复用。
+    """
+    labels = []
+    start = pos
+    end = None
+    hops = 0
+    while True:
+        if pos in cache:
+            suffix, cached_end = cache[pos]
+            if suffix != b".":
+                labels.append(suffix)
+            if end is None:
+                end = cached_end
+            break
+        length = buf[pos]
+        if length == 0:
+            if end is None:
+                end = pos + 1
+            break
+        if length & 0xc0 == 0xc0:
+            if end is None:
+                end = pos + 2
+            hops += 1
+            if hops > 32:
+                raise DNSParseError("compression loop")
+            pos = ((length & 0x3f) << 8) | buf[pos + 1]
+            continue
+        if length & 0xc0:
+            raise DNSParseError("bad label type")
+        label = bytes(buf[pos + 1:pos + 1 + length])
+        if len(label) != length:
+            raise DNSParseError("truncated label")
+        labels.append(label + b".")
+        pos += length + 1
+    name = b"".join(labels) or b"."
+    cache[start] = (name, end)
+    return name, end
+
+def _read_text(buf, pos, end):
+    strings = []
+    while pos < end:
+        length = buf[pos]
+        strings.append(bytes(buf[pos + 1:pos + 1 + length]))
+        pos += length + 1
+    if pos != end:
+        raise DNSParseError("bad TXT rdata")
+    return strings
+
+def _read_records(buf, pos, count, cache):
+    records = []
+    for _ in range(count):
+        rrname, pos = _read_name(buf, pos, cache)
+        rtype, rclass, ttl, rdlen = _RR_FIXED.unpack_from(buf, pos)
+        pos += 10
+        end = pos + rdlen
+        if end > len(buf):
+            raise DNSParseError("truncated rdata")
+        rr = DNSRecord(rrname, rtype, rclass, ttl, rdlen)
+        if rtype == 1:
+            if rdlen != 4:
+                raise DNSParseError("bad A rdata")
+            rr.rdata = socket.inet_ntop(socket.AF_INET, buf[pos:end])
+        elif rtype == 28:
+            if rdlen != 16:
+                raise DNSParseError("bad AAAA rdata")
+            rr.rdata = socket.inet_ntop(socket.AF_INET6, buf[pos:end])
+        elif rtype in NAME_TYPES:
+            rr.rdata = _read_name(buf, pos, cache)[0]
+        elif rtype == 16:
+            rr.rdata = _read_text(buf, pos, end)
+        elif rtype == 33:
+            rr.priority, rr.weight, rr.port = _SRV_FIXED.unpack_from(buf, pos)
+            rr.target = _read_name(buf, pos + 6, cache)[0]
+        elif rtype == 47:
+            rr.nextname, bitmap_pos = _read_name(buf, pos, cache)
+            if bitmap_pos > end:
+                raise DNSParseError("bad NSEC rdata")
+            rr.typebitmaps = bytes(buf[bitmap_pos:end])
+        elif rtype in SCAPY_ONLY_TYPES:
+            raise DNSParseError(f"type {rtype} handled by scapy")
+        else:
+            rr.rdata = bytes(buf[pos:end])
+        records.append(rr)
+        pos = end
+    return records, pos
+
+def parse_wire(data):
+    """
+    在 memoryview 上解析 DNS 报文，格式错误时抛出 DNSParseError。
+    """
+    buf = memoryview(data)
+    if len(buf) < 12:
+        raise DNSParseError("short header")
+    msg = DNSMessage()
+    msg.id, msg.flags, msg.qdcount, msg.ancount, msg.nscount, msg.arcount = _HEADER.unpack_from(buf, 0)
+    msg.length = len(buf)
+    cache = {}
+    pos = 12
+    msg.qd = []
+    for _ in range(msg.qdcount):
+        qname, pos = _read_name(buf, pos, cache)
+        qtype, qclass = struct.unpack_from("!HH", buf, pos)
+        pos += 4
+        msg.qd.append(DNSQuestion(qname, qtype, qclass))
+    try:
+        msg.an, pos = _read_records(buf, pos, msg.ancount, cache)
+        msg.ns, pos = _read_records(buf, pos, msg.nscount, cache)
+        msg.ar, pos = _read_records(buf, pos, msg.arcount, cache)
+    except (IndexError, struct.error) as e:
+        raise DNSParseError(str(e))
+    return msg
+
+def _skip_name(buf, pos, key=None, masked=None):
+    """
+    跳过 pos 处的名称（不跟随压缩指针），返回其后的偏移。
+    给出 key 时把名称内联标签的内容置零，并把标签偏移加入 masked。
+    """
+    while True:
+        length = buf[pos]
+        if length == 0:
+            return pos + 1
+        if length & 0xc0 == 0xc0:
+            return pos + 2
+        if length & 0xc0:
+            raise DNSParseError("bad label type")
+        if key is not None:
+            key[pos + 1:pos + 1 + length] = bytes(length)
+            masked.add(pos)
+        pos += length + 1
+
+def _skeleton(buf):
+    """
+    不解码名称与 rdata，只按长度走一遍报文，得到掩码后的指纹与各记录的位置。
+    掩去的字段：事务ID、A/AAAA 地址、SRV 目标与 A/AAAA 属主名的内联标签（主机名）。
+    标签长度与压缩指针不掩，指纹相同的报文结构完全一致。
+    返回 (指纹, [(名称偏移, 类型, rdata 偏移)], 掩去的标签偏移)；含 question 段的报文返回 None。
+    """
+    qdcount, ancount, nscount, arcount = _HEADER.unpack_from(buf, 0)[2:]
+    if qdcount:
+        return None
+    key = bytearray(buf)
+    key[0] = key[1] = 0
+    layout = []
+    masked = set()
+    pos = 12
+    for _ in range(ancount + nscount + arcount):
+        start = pos
+        pos = _skip_name(buf, pos)
+        rtype, _, _, rdlen = _RR_FIXED.unpack_from(buf, pos)
+        rdata = pos + 10
+        end = rdata + rdlen
+        if end > len(buf):
+            raise DNSParseError("truncated rdata")
+        if rtype == 1 or rtype == 28:
+            key[rdata:end] = bytes(rdlen)
+            _skip_name(buf, start, key, masked)
+        elif rtype == 33 and rdlen > 6:
+            _skip_name(buf, rdata + 6, key, masked)
+        layout.append((start, rtype, rdata))
+        pos = end
+    return bytes(key), layout, masked
+
+def _name_labels(buf, pos):
+    # 解码名称时经过的所有标签偏移（跟随压缩指针）
+    labels = set()
+    for _ in range(256):
+        length = buf[pos]
+        if length == 0:
+            return labels
+        if length & 0xc0 == 0xc0:
+            pos = ((length & 0x3f) << 8) | buf[pos + 1]
+            continue
+        labels.add(pos)
+        pos += length + 1
+    raise DNSParseError("compression loop")
+
+def _clone(rr, slots):
+    new = DNSRecord.__new__(DNSRecord)
+    for name in slots:
+        setattr(new, name, getattr(rr, name))
+    return new
+
+class ParseCache:
+    """
+    按响应指纹缓存解析结果。同一固件的设备返回的响应往往只在事务ID、主机名与地址上不同：
+    以掩去这些字段后的报文为键保存解码好的 DNSMessage，命中时只复制需要改动的记录，
+    从新报文中重新读取地址及经过主机名标签的名称，其余记录与模板共享（调用方只读）。
+    主机名长度不同会改变后续压缩指针的偏移，此时按不同指纹处理。
+    最多保留 max_entries 个模板（LRU），hits/misses 同时计入 metrics.PARSE_CACHE。
+    """
+    def __init__(self, max_entries=4096):
+        self.max_entries = max_entries
+        self.templates = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.templates)
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def parse(self, data):
+        buf = memoryview(data)
+        if len(buf) < 12:
+            raise DNSParseError("short header")
+        try:
+            skeleton = _skeleton(buf)
+        except (IndexError, struct.error) as e:
+            raise DNSParseError(str(e))
+        if skeleton is None:
+            return parse_wire(buf)
+        key, layout, masked = skeleton
+        with self.lock:
+            template = self.templates.get(key)
+            if template is not None:
+                self.templates.move_to_end(key)
+                self.hits += 1
+        if template is not None:
+            metrics.PARSE_CACHE.inc("hit")
+            return self._patch(buf, template)
+        msg = parse_wire(buf)
+        template = (msg, self._patches(buf, msg, layout, masked))
+        with self.lock:
+            self.misses += 1
+            self.templates[key] = template
+            while len(self.templates) > self.max_entries:
+                self.templates.popitem(last=False)
+        metrics.PARSE_CACHE.inc("miss")
+        return msg
+
+    def _patches(self, buf, msg, layout, masked):
+        """列出命中时需要从新报文重新读取的记录及字段：[(段, 下标, 已赋值的属性, [(字段, 偏移)])]。"""
+        patches = []
+        index = 0
+        for section, count in (("an", msg.ancount), ("ns", msg.nscount), ("ar", msg.arcount)):
+            for i in range(count):
+                start, rtype, rdata = layout[index]
+                index += 1
+                fields = []
+                if rtype == 1 or rtype == 28:
+                    fields.append(("address", rdata))
+                if masked:
+                    if _name_labels(buf, start) & masked:
+                        fields.append(("rrname", start))
+                    if rtype in NAME_TYPES or rtype == 47:
+                        field = "rdata" if rtype in NAME_TYPES else "nextname"
+                        if _name_labels(buf, rdata) & masked:
+                            fields.append((field, rdata))
+                    elif rtype == 33 and _name_labels(buf, rdata + 6) & masked:
+                        fields.append(("target", rdata + 6))
+                if fields:
+                    rr = getattr(msg, section)[i]
+                    slots = tuple(name for name in DNSRecord.__slots__ if hasattr(rr, name))
+                    patches.append((section, i, slots, fields))
+        return patches
+
+    def _patch(self, buf, template):
+        base, patches = template
+        msg = DNSMessage()
+        msg.id = (buf[0] << 8) | buf[1]
+        msg.flags, msg.qdcount, msg.ancount, msg.nscount, msg.arcount = (
+            base.flags, base.qdcount, base.ancount, base.nscount, base.arcount)
+        msg.length = len(buf)
+        msg.qd = []
+        msg.an, msg.ns, msg.ar = list(base.an), list(base.ns), list(base.ar)
+        names = {}
+        for section, i, slots, fields in patches:
+            records = getattr(msg, section)
+            rr = records[i] = _clone(records[i], slots)
+            for field, pos in fields:
+                if field == "address":
+                    family = socket.AF_INET if rr.type == 1 else socket.AF_INET6
+                    rr.rdata = socket.inet_ntop(family, buf[pos:pos + rr.rdlen])
+                else:
+                    setattr(rr, field, _read_name(buf, pos, names)[0])
+        return msg
+
+# 不为 None 时 parse_dns() 先查询该 ParseCache
+CACHE = None
+
+def enable_cache(max_entries=4096):
+    """启用响应指纹解析缓存，返回 ParseCache（可读取 hits/misses/hit_rate()）。"""
+    global CACHE
+    CACHE = ParseCache(max_entries)
+    return CACHE
+
+def parse_dns(data):
+    """
+    解析 DNS 响应：优先使用 parse_wire()（启用 CACHE 时经由指纹缓存），报文异常时回退到 scapy 的 DNS(data)。
+    """
+    try:
+        if CACHE is not None:
+            return CACHE.parse(data)
+        return parse_wire(data)
+    except (DNSParseError, IndexError, struct.error):
+        from scapy.all import DNS
+        metrics.PARSE_FALLBACKS.inc()
+        try:
+            return DNS(bytes(data))
+        except Exception:
+            metrics.PARSE_ERRORS.inc()
+            raise
@@ -0,0 +1,302 @@
+#/usr/bin/python3
+#!coding=utf-8
+
+import functools
+import inspect
+import json
+import threading
+import time
+
+# 阶段耗时直方图的桶上界（秒）
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class Metric:
+    """
+    指标基类。values 以标签取值元组为键；所有更新都持有锁，阻塞式扫描的多线程模式下也能正确计数。
+    """
+    kind = "untyped"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def state(self):
+        with self.lock:
+            return {key: (list(v) if isinstance(v, list) else v) for key, v in self.values.items()}
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+class Gauge(Metric):
+    """瞬时值。可以直接 set/inc/dec，也可以给出 callback 在导出时取值（返回 {标签元组: 值}）。"""
+    kind = "gauge"
+
+    def __init__(self, name, help, labels=(), callback=None):
+        super().__init__(name, help, labels)
+        self.callback = callback
+
+    def set(self, value, *labels):
+        with self.lock:
+            self.values[labels] = value
+
+    def inc(self, *labels, amount=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+    def state(self):
+        if self.callback is not None:
+            return dict(self.callback())
+        return super().state()
+
+class Histogram(Metric):
+    """累积直方图：每组标签保存 [各桶计数..., 总和, 样本数]。"""
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        with self.lock:
+            row = self.values.get(labels)
+            if row is None:
+                row = self.values[labels] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    row[i] += 1
+                    break
+            row[-2] += value
+            row[-1] += 1
+
+def _merge(kind, total, state):
+    for key, value in state.items():
+        key = tuple(key)
+        if kind == "histogram":
+            row = total.setdefault(key, [0] * len(value))
+            for i, v in enumerate(value):
+                row[i] += v
+        else:
+            total[key] = total.get(key, 0) + value
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{str(v)}"' for k, v in pairs) + "}"
+
+class Registry:
+    """
+    指标集合。remote 保存其他进程（分片扫描的工作进程）最近一次上报的状态，
+    导出时与本进程的值相加。
+    """
+    def __init__(self):
+        self.metrics = []
+        self.remote = {}
+        self.started = time.time()
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self.register(Counter(name, help, labels))
+
+    def gauge(self, name, help, labels=(), callback=None):
+        return self.register(Gauge(name, help, labels, callback))
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def state(self):
+        """本进程的原始指标值，可序列化后交给其他进程合并。"""
+        return {m.name: [[list(k), v] for k, v in m.state().items()] for m in self.metrics}
+
+    def merge_remote(self, source, state):
+        self.remote[source] = state
+
+    def collect(self):
+        """返回 [(metric, {标签元组: 值})]，已合并各进程上报的值。"""
+        out = []
+        for metric in self.metrics:
+            total = {}
+            _merge(metric.kind, total, metric.state())
+            for state in list(self.remote.values()):
+                _merge(metric.kind, total, dict((tuple(k), v) for k, v in state.get(metric.name, [])))
+            out.append((metric, total))
+        return out
+
+    def render(self):
+        """Prometheus 文本格式。"""
+        lines = []
+        for metric, values in self.collect():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for key, value in sorted(values.items()):
+                if metric.kind != "histogram":
+                    lines.append(f"{metric.name}{_format_labels(metric.labels, key)} {value}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(metric.buckets, value):
+                    cumulative += count
+                    lines.append(f"{metric.name}_bucket{_format_labels(metric.labels, key, ('le', bound))} {cumulative}")
+                lines.append(f"{metric.name}_bucket{_format_labels(metric.labels, key, ('le', '+Inf'))} {value[-1]}")
+                lines.append(f"{metric.name}_sum{_format_labels(metric.labels, key)} {value[-2]}")
+                lines.append(f"{metric.name}_count{_format_labels(metric.labels, key)} {value[-1]}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        """JSON 快照：计数与瞬时值按标签展开，直方图给出样本数、均值和近似 p50/p99。"""
+        out = {"time": round(time.time(), 3), "uptime": round(time.time() - self.started, 3)}
+        for metric, values in self.collect():
+            entry = {}
+            for key, value in values.items():
+                label = ",".join(str(k) for k in key) or "total"
+                if metric.kind == "histogram":
+                    count = value[-1]
+                    entry[label] = {
+                        "count": count,
+                        "mean": round(value[-2] / count, 6) if count else 0.0,
+                        "p50": _bucket_quantile(metric.buckets, value, 0.5),
+                        "p99": _bucket_quantile(metric.buckets, value, 0.99),
+                    }
+                else:
+                    entry[label] = value
+            out[metric.name] = entry
+        return out
+
+def _bucket_quantile(buckets, row, q):
+    # 以桶上界近似分位数
+    count = row[-1]
+    if not count:
+        return None
+    rank = q * count
+    cumulative = 0
+    for bound, n in zip(buckets, row):
+        cumulative += n
+        if cumulative >= rank:
+            return bound
+    return "+Inf"
+
+REGISTRY = Registry()
+
+def _writer_depths():
+    import utils
+    return {(name,): writer.qsize() for name, writer in list(utils._writers.items())}
+
+STAGE_SECONDS = REGISTRY.histogram("mdns_scan_stage_seconds", "Time from the first send of a request to its matched response, per scan stage", ["stage"])
+PACKETS_SENT = REGISTRY.counter("mdns_scan_packets_sent_total", "Datagrams sent, including retransmissions", ["stage"])
+BYTES_SENT = REGISTRY.counter("mdns_scan_bytes_sent_total", "Bytes sent", ["stage"])
+PACKETS_RECEIVED = REGISTRY.counter("mdns_scan_packets_received_total", "Responses matched to a request", ["stage"])
+BYTES_RECEIVED = REGISTRY.counter("mdns_scan_bytes_received_total", "Bytes received", ["stage"])
+TIMEOUTS = REGISTRY.counter("mdns_scan_timeouts_total", "Request attempts that timed out", ["stage"])
+PARSE_FALLBACKS = REGISTRY.counter("mdns_scan_parse_fallbacks_total", "Responses the wire parser handed to scapy")
+PARSE_ERRORS = REGISTRY.counter("mdns_scan_parse_errors_total", "Responses neither parser could decode")
+PARSE_CACHE = REGISTRY.counter("mdns_scan_parse_cache_total", "Response-fingerprint parse cache lookups", ["result"])
+TARGETS = REGISTRY.counter("mdns_scan_targets_total", "Finished targets by scan function and outcome", ["mode", "result"])
+SERVICE_CACHE = REGISTRY.counter("mdns_scan_service_cache_total", "Service-list cache lookups (hit/miss) and cached lists that failed and fell back to discovery", ["result"])
+IN_FLIGHT = REGISTRY.gauge("mdns_scan_in_flight", "Targets currently being scanned")
+WRITER_QUEUE = REGISTRY.gauge("mdns_scan_writer_queue_depth", "Rows waiting in each result writer", ["file"], callback=_writer_depths)
+
+def target_done(mode, result):
+    """按 dnssd_scan() 的返回值记录目标结果：-1 无响应，0 部分阶段失败，其余为完成。"""
+    TARGETS.inc(mode, "closed" if result == -1 else "partial" if result == 0 else "open")
+
+def track_target(func):
+    """装饰单目标扫描函数（同步或协程）：维护在途目标数并按函数名与返回值计数，抛出异常计为 error。"""
+    mode = func.__name__
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            IN_FLIGHT.inc()
+            try:
+                result = await func(*args, **kwargs)
+            except Exception:
+                TARGETS.inc(mode, "error")
+                raise
+            finally:
+                IN_FLIGHT.dec()
+            target_done(mode, result)
+            return result
+    else:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            IN_FLIGHT.inc()
+            try:
+                result = func(*args, **kwargs)
+            except Exception:
+                TARGETS.inc(mode, "error")
+                raise
+            finally:
+                IN_FLIGHT.dec()
+            target_done(mode, result)
+            return result
+    return wrapper
+
+def serve(port=9105, addr="127.0.0.1", registry=REGISTRY):
+    """
+    在后台线程启动 HTTP 服务：/metrics 返回 Prometheus 文本，/metrics.json 返回 JSON 快照。
+    返回 server，调用 server.shutdown() 停止。
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.startswith("/metrics.json"):
+                body = json.dumps(registry.snapshot()).encode()
+                ctype = "application/json"
+            elif self.path.startswith("/metrics"):
+                body = registry.render().encode()
+                ctype = "text/plain; version=0.0.4"
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", ctype)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((addr, port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+class Snapshotter:
+    """每 interval 秒把 JSON 快照追加到 path（每行一个对象）。"""
+    def __init__(self, path="metrics.jsonl", interval=10.0, registry=REGISTRY):
+        self.path = path
+        self.interval = interval
+        self.registry = registry
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="metrics-snapshot", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def write(self):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(self.registry.snapshot()) + "\n")
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.write()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.write()
@@ -0,0 +1,100 @@
+#/usr/bin/python3
+#!coding=utf-8
+
+import functools
+import struct
+import threading
+
+# 首轮服务枚举查询的名称
+SERVICES_QNAME = "_services._dns-sd._udp.local"
+# DNS 报文头长度
+HEADER_LEN = 12
+
+_HEADER = struct.Struct("!HHHHHH")
+_local = threading.local()
+
+def query_header(count, txid=0x0001):
+    """构造查询报文头（rd=1，与 DNS(id=txid, rd=1, qdcount=count) 一致）。"""
+    return _HEADER.pack(txid, 0x0100, count & 0xffff, 0, 0, 0)
+
+def _is_ptr(x):
+    # 与 scapy 相同的启发式：末尾为 \x00 或压缩指针时视为已编码的名称
+    return (x and x[-1] == 0) or (len(x) >= 2 and (x[-2] & 0xc0) == 0xc0)
+
+@functools.lru_cache(maxsize=65536)
+def _encode_question(qname, qtype, qclass):
+    if isinstance(qname, str):
+        qname = qname.encode()
+    if not qname:
+        qname = b"."
+    elif qname[-1:] != b"." and not _is_ptr(qname):
+        qname += b"."
+    if qname == b".":
+        encoded = b"\x00"
+    elif _is_ptr(qname):
+        encoded = qname
+    else:
+        encoded = b"".join(bytes([len(k[:63])]) + k[:63] for k in qname.split(b"."))
+        if encoded[-1:] != b"\x00":
+            encoded += b"\x00"
+    return encoded + struct.pack("!HH", qtype, qclass)
+
+def encode_question(qname, qtype=255, qclass=1):
+    """
+    编码一个 question，结果与 bytes(DNSQR(qtype=qtype, qname=qname)) 相同。
+    str/bytes 名称的编码结果按名称缓存；其他类型（如 TXT 的列表 rdata）交给 scapy 处理。
+    """
+    if isinstance(qname, (str, bytes)):
+        return _encode_question(qname, qtype, qclass)
+    from scapy.all import DNSQR
+    return bytes(DNSQR(qtype=qtype, qclass=qclass, qname=qname))
+
+# 固定的首轮 PTR 查询，只构造一次
+SERVICES_QUERY = query_header(1) + encode_question(SERVICES_QNAME, 12)
+
+class QueryBuilder:
+    """
+    在一个复用的 bytearray 中拼接聚合 ANY 查询：报文头 + 预编码的 question 片段。
+    """
+    def __init__(self):
+        self.buf = bytearray(HEADER_LEN)
+        self.count = 0
+
+    def reset(self):
+        del self.buf[HEADER_LEN:]
+        self.count = 0
+
+    def add(self, qname, qtype=255):
+        self.buf += encode_question(qname, qtype)
+        self.count += 1
+
+    def add_records(self, records, count, section):
+        """
+        依次加入记录的 rdata 作为 ANY 查询，无法编码的记录打印错误后跳过。
+        """
+        for i in range(0, count):
+            if hasattr(records[i],"rdata"):
+                try:
+                    self.add(records[i].rdata)
+                except Exception as e:
+                    print(f"Error processing {section} record {records[i].rdata}: {e}")
+
+    def payload(self):
+        """返回报文头之后的 question 段。"""
+        return bytes(self.buf[HEADER_LEN:])
+
+    def build(self, qdcount, txid=0x0001):
+        """写入报文头并返回完整请求；qdcount 由调用方给出（沿用原扫描逻辑的计数）。"""
+        _HEADER.pack_into(self.buf, 0, txid, 0x0100, qdcount & 0xffff, 0, 0, 0)
+        return bytes(self.buf)
+
+    def __len__(self):
+        return len(self.buf)
+
+def thread_builder():
+    """返回当前线程专用的 QueryBuilder，供多线程扫描复用。"""
+    builder = getattr(_local, "builder", None)
+    if builder is None:
+        builder = _local.builder = QueryBuilder()
+    builder.reset()
+    return builder
@@ -0,0 +1,128 @@
+#/usr/bin/python3
+#!coding=utf-8
+
+import asyncio
+import time
+from collections import OrderedDict
+
+class TokenBucket:
+    """
+    令牌桶。reserve() 允许令牌透支：返回取得令牌需要等待的秒数，
+    使大量并发协程按速率排队发送，而不是轮询等待。
+    """
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(rate / 10, 1))
+        self.tokens = self.burst
+        self.stamp = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def reserve(self, now=None):
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def set_rate(self, rate):
+        self._refill(time.monotonic())
+        self.rate = float(rate)
+        self.burst = max(rate / 10, 1)
+
+class AIMDState:
+    """
+    一个令牌桶及其丢包统计：每个窗口结束时，丢包率高于目标则乘性降速，否则加性增速。
+    """
+    def __init__(self, rate, min_rate, max_rate, increase, decrease, target_loss, window):
+        self.bucket = TokenBucket(rate)
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.target_loss = target_loss
+        self.window = window
+        self.sent = 0
+        self.lost = 0
+        self.total_sent = 0
+        self.total_lost = 0
+        self.last_loss = 0.0
+
+    def record(self, lost):
+        self.sent += 1
+        self.total_sent += 1
+        if lost:
+            self.lost += 1
+            self.total_lost += 1
+        if self.sent < self.window:
+            return
+        self.last_loss = self.lost / self.sent
+        rate = self.bucket.rate
+        if self.last_loss > self.target_loss:
+            rate *= self.decrease
+        else:
+            rate += self.increase
+        self.bucket.set_rate(min(max(rate, self.min_rate), self.max_rate))
+        self.sent = self.lost = 0
+
+class AdaptiveRateController:
+    """
+    扫描引擎的发送节奏控制：全局令牌桶限制上行总速率，每个 /24 各有一个令牌桶
+    避免冲击单个网络；两者都依据观察到的超时/丢包率做 AIMD 调整。
+    """
+    def __init__(self, rate=1000, min_rate=50, max_rate=100000,
+                 prefix_rate=50, prefix_min_rate=2, prefix_max_rate=1000,
+                 increase=None, decrease=0.7, target_loss=0.05, window=200,
+                 prefix_window=20, max_prefixes=65536):
+        self.global_state = AIMDState(rate, min_rate, max_rate, increase or rate * 0.05,
+                                      decrease, target_loss, window)
+        self.prefix_params = (prefix_rate, prefix_min_rate, prefix_max_rate,
+                              max(prefix_rate * 0.1, 1), decrease, target_loss, prefix_window)
+        self.max_prefixes = max_prefixes
+        self.prefixes = OrderedDict()
+
+    @staticmethod
+    def prefix_of(ip):
+        return ip.rsplit(".", 1)[0] if "." in ip else ip
+
+    def _prefix_state(self, ip):
+        key = self.prefix_of(ip)
+        state = self.prefixes.get(key)
+        if state is None:
+            state = self.prefixes[key] = AIMDState(*self.prefix_params)
+            if len(self.prefixes) > self.max_prefixes:
+                self.prefixes.popitem(last=False)
+        else:
+            self.prefixes.move_to_end(key)
+        return state
+
+    async def acquire(self, ip):
+        """等待直到全局与目标所在 /24 的令牌桶都允许发送。"""
+        now = time.monotonic()
+        delay = max(self.global_state.bucket.reserve(now), self._prefix_state(ip).bucket.reserve(now))
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def record(self, ip, lost):
+        """记录一次请求的结果（lost 为 True 表示超时/丢失）。"""
+        self.global_state.record(lost)
+        self._prefix_state(ip).record(lost)
+
+    @property
+    def rate(self):
+        return self.global_state.bucket.rate
+
+    def snapshot(self):
+        """当前速率与丢包计数，便于定期记录绘图。"""
+        g = self.global_state
+        return {
+            "time": time.time(),
+            "rate": round(g.bucket.rate, 2),
+            "measured": g.total_sent,
+            "lost": g.total_lost,
+            "loss_ratio": round(g.total_lost / g.total_sent, 4) if g.total_sent else 0.0,
+            "window_loss": round(g.last_loss, 4),
+            "prefixes": len(self.prefixes),
+            "throttled_prefixes": sum(1 for s in self.prefixes.values() if s.bucket.rate < self.prefix_params[0]),
+        }
@@ -0,0 +1,281 @@
+#/usr/bin/python3
+#!coding=utf-8
+
+import argparse
+import asyncio
+import ipaddress
+import multiprocessing
+import random
+import struct
+import threading
+
+# 默认通告的服务
+DEFAULT_SERVICES = ["_http._tcp.local", "_ipp._tcp.local", "_printer._tcp.local", "_device-info._tcp.local"]
+SERVICES_QNAME = "_services._dns-sd._udp.local"
+
+def encode_name(name):
+    """将域名编码为 DNS 线格式（不压缩）。"""
+    out = b""
+    for label in name.rstrip(".").split("."):
+        out += bytes([len(label)]) + label.encode()
+    return out + b"\x00"
+
+def encode_rr(name, rtype, rdata, ttl=120):
+    """编码一条资源记录（rclass 设置 cache-flush 位）。"""
+    return encode_name(name) + struct.pack("!HHIH", rtype, 0x8001, ttl, len(rdata)) + rdata
+
+def encode_txt(size):
+    """生成总长约为 size 字节的 TXT rdata，按 255 字节拆分字符串。"""
+    strings = [b"txtvers=1", b"path=/ui"]
+    pad = size - sum(len(s) + 1 for s in strings)
+    n = 0
+    while pad > 1:
+        chunk = min(pad - 1, 255)
+        strings.append((b"k%d=" % n + b"x" * 255)[:chunk])
+        pad -= chunk + 1
+        n += 1
+    return b"".join(bytes([len(s)]) + s for s in strings)
+
+def parse_questions(data):
+    """从查询报文中解析出 (qname, qtype) 列表，仅支持未压缩名称。"""
+    qdcount = struct.unpack_from("!H", data, 4)[0]
+    questions = []
+    pos = 12
+    for _ in range(qdcount):
+        labels = []
+        while pos < len(data) and data[pos] != 0:
+            length = data[pos]
+            labels.append(data[pos+1:pos+1+length].decode(errors="replace"))
+            pos += 1 + length
+        pos += 1
+        if pos + 4 > len(data):
+            break
+        qtype = struct.unpack_from("!H", data, pos)[0]
+        pos += 4
+        questions.append((".".join(labels), qtype))
+    return questions
+
+class ResponderProfile:
+    """
+    虚拟应答方的行为配置。
+    services: 通告的服务列表；txt_size: 每个服务 TXT 记录的字节数，用于控制响应大小；
+    latency/jitter: 响应延迟及其均匀抖动（秒）；loss: 丢弃请求的概率；
+    malformed: 返回畸形报文（截断或错误的压缩指针）的概率；
+    zero_txid: 不回显事务ID（固定为 0）的概率，部分真实设备如此。
+    """
+    def __init__(self, services=DEFAULT_SERVICES, hostname="stub.local", txt_size=20,
+                 latency=0.0, jitter=0.0, loss=0.0, malformed=0.0, zero_txid=0.0):
+        self.services = list(services)
+        self.hostname = hostname
+        self.txt_size = txt_size
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.malformed = malformed
+        self.zero_txid = zero_txid
+
+class VirtualResponder(asyncio.DatagramProtocol):
+    """
+    本地 DNS-SD 虚拟应答方：对服务枚举返回 PTR 列表，对其余问题返回 SRV/TXT 记录，
+    附加段带主机的 A 记录。随机行为由独立种子的 Random 决定，可复现。
+    """
+    def __init__(self, profile=None, address="127.0.0.1", seed=0):
+        self.profile = profile or ResponderProfile()
+        self.address = bytes(map(int, address.split(".")))
+        self.random = random.Random(seed)
+        self.transport = None
+        self._txt = encode_txt(self.profile.txt_size)
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def build_response(self, data):
+        profile = self.profile
+        txid = data[:2]
+        answers = []
+        additionals = [encode_rr(profile.hostname, 1, self.address)]
+        for qname, qtype in parse_questions(data):
+            if qname == SERVICES_QNAME:
+                answers += [encode_rr(qname, 12, encode_name(s)) for s in profile.services]
+            else:
+                instance = f"stub.{qname}"
+                answers.append(encode_rr(instance, 33, struct.pack("!HHH", 0, 0, 80) + encode_name(profile.hostname)))
+                answers.append(encode_rr(instance, 16, self._txt))
+        header = txid + struct.pack("!HHHHH", 0x8400, 0, len(answers), 0, len(additionals))
+        return header + b"".join(answers) + b"".join(additionals)
+
+    def corrupt(self, resp):
+        """截断报文，或把第一条记录的名称改成指向自身之后的压缩指针。"""
+        if self.random.random() < 0.5:
+            return resp[:self.random.randrange(2, len(resp))]
+        return resp[:12] + struct.pack("!H", 0xc000 | min(len(resp), 0x3fff)) + resp[14:]
+
+    def datagram_received(self, data, addr):
+        profile = self.profile
+        if len(data) < 12:
+            return
+        if profile.loss and self.random.random() < profile.loss:
+            return
+        resp = self.build_response(data)
+        if profile.zero_txid and self.random.random() < profile.zero_txid:
+            resp = b"\x00\x00" + resp[2:]
+        if profile.malformed and self.random.random() < profile.malformed:
+            resp = self.corrupt(resp)
+        delay = profile.latency + (self.random.uniform(0, profile.jitter) if profile.jitter else 0)
+        if delay > 0:
+            asyncio.get_running_loop().call_later(delay, self.transport.sendto, resp, addr)
+        else:
+            self.transport.sendto(resp, addr)
+
+def _raise_nofile(count):
+    # 每个应答方占用一个套接字，按需提高文件描述符上限
+    try:
+        import resource
+    except ImportError:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    want = count + 1024
+    if soft != resource.RLIM_INFINITY and soft < want:
+        if hard != resource.RLIM_INFINITY:
+            want = min(want, hard)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (want, hard))
+
+class ResponderFarm:
+    """
+    一组虚拟应答方。network 给出时，每个应答方绑定该网段中的一个地址（默认
+    127.10.0.0/16，Linux 上整个 127.0.0.0/8 都指向回环，无需配置别名）和同一端口；
+    network 为 None 时全部绑定 127.0.0.1 的随机端口。
+    profiles 可以是单个 ResponderProfile 或列表，第 i 个应答方使用 profiles[i % len]。
+    process=True 时应答方运行在独立进程中，避免与被测扫描器争用 GIL 和 CPU 统计。
+    targets 为 (ip, port) 列表。
+    """
+    def __init__(self, count=100, profiles=None, network="127.10.0.0/16", port=5353, seed=0, process=False):
+        self.count = count
+        if profiles is None:
+            profiles = ResponderProfile()
+        self.profiles = profiles if isinstance(profiles, (list, tuple)) else [profiles]
+        self.network = network
+        self.port = port
+        self.seed = seed
+        self.process = process
+        self.targets = []
+        self._loop = None
+        self._thread = None
+        self._proc = None
+        self._conn = None
+
+    def addresses(self):
+        if self.network is None:
+            return [("127.0.0.1", 0)] * self.count
+        hosts = ipaddress.ip_network(self.network).hosts()
+        addresses = []
+        for host in hosts:
+            if len(addresses) == self.count:
+                break
+            addresses.append((str(host), self.port))
+        if len(addresses) < self.count:
+            raise ValueError(f"{self.network} holds fewer than {self.count} hosts")
+        return addresses
+
+    async def _start(self):
+        _raise_nofile(self.count)
+        loop = asyncio.get_running_loop()
+        for i, addr in enumerate(self.addresses()):
+            profile = self.profiles[i % len(self.profiles)]
+            transport, _ = await loop.create_datagram_endpoint(
+                lambda: VirtualResponder(profile, addr[0], self.seed * 1000003 + i), local_addr=addr)
+            self.targets.append(transport.get_extra_info("sockname")[:2])
+
+    def _run(self, ready, started):
+        asyncio.set_event_loop(self._loop)
+        try:
+            self._loop.run_until_complete(self._start())
+            ready.append(None)
+        except Exception as e:
+            ready.append(e)
+        started.set()
+        self._loop.run_forever()
+
+    def start(self):
+        if self.process:
+            ctx = multiprocessing.get_context("spawn")
+            self._conn, child = ctx.Pipe()
+            self._proc = ctx.Process(target=_serve, args=(self, child), daemon=True)
+            self._proc.start()
+            result = self._conn.recv()
+            if isinstance(result, Exception):
+                self._proc.join()
+                raise result
+            self.targets = result
+            return self
+        self._loop = asyncio.new_event_loop()
+        ready = []
+        started = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(ready, started), daemon=True)
+        self._thread.start()
+        started.wait()
+        if ready[0] is not None:
+            self.stop()
+            raise ready[0]
+        return self
+
+    def stop(self):
+        if self._proc is not None:
+            self._conn.send("stop")
+            self._proc.join()
+            self._proc = None
+        elif self._thread is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._thread = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for key in ("_loop", "_thread", "_proc", "_conn"):
+            state[key] = None
+        return state
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+def _serve(farm, conn):
+    """process=True 时子进程的入口：启动应答方，回传地址列表，直到收到停止消息。"""
+    farm.process = False
+    try:
+        farm.start()
+    except Exception as e:
+        conn.send(e)
+        return
+    conn.send(farm.targets)
+    conn.recv()
+    farm.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description="本地 mDNS/DNS-SD 虚拟应答方")
+    parser.add_argument("--count", type=int, default=1000)
+    parser.add_argument("--network", default="127.10.0.0/16")
+    parser.add_argument("--port", type=int, default=5353)
+    parser.add_argument("--services", type=int, default=len(DEFAULT_SERVICES), help="每个应答方通告的服务数")
+    parser.add_argument("--txt-size", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--loss", type=float, default=0.0)
+    parser.add_argument("--malformed", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    services = [f"_svc{i}._tcp.local" for i in range(args.services)] if args.services != len(DEFAULT_SERVICES) else DEFAULT_SERVICES
+    profile = ResponderProfile(services, txt_size=args.txt_size, latency=args.latency, jitter=args.jitter,
+                               loss=args.loss, malformed=args.malformed)
+    with ResponderFarm(args.count, profile, args.network, args.port, args.seed) as farm:
+        print(f"{len(farm.targets)} responders on {args.network} port {args.port}, Ctrl-C to stop")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+#/usr/bin/python3
+#!coding=utf-8
+
+from collections import OrderedDict
+
+class RTTState:
+    __slots__ = ("srtt", "rttvar")
+
+    def __init__(self, rtt):
+        self.srtt = rtt
+        self.rttvar = rtt / 2
+
+class RTTEstimator:
+    """
+    按目标 /24 前缀估计往返时延（RFC 6298 的 SRTT/RTTVAR），并据此给出超时时间：
+    RTO = SRTT + K * RTTVAR，限制在 [min_rto, max_rto]；min_rto 按 RFC 6298 取 1 秒，
+    避免少量样本后超时过短、慢应答（如较大的聚合 ANY 响应）被误判为丢失。
+    没有样本的前缀使用 initial 作为超时。
+    """
+    def __init__(self, initial=2.0, min_rto=1.0, max_rto=4.0, alpha=0.125, beta=0.25, k=4, max_prefixes=65536):
+        self.initial = initial
+        self.min_rto = min_rto
+        self.max_rto = max_rto
+        self.alpha = alpha
+        self.beta = beta
+        self.k = k
+        self.max_prefixes = max_prefixes
+        self.prefixes = OrderedDict()
+
+    @staticmethod
+    def prefix_of(ip):
+        return ip.rsplit(".", 1)[0] if "." in ip else ip
+
+    def sample(self, ip, rtt):
+        """加入一个 RTT 样本（秒）。"""
+        key = self.prefix_of(ip)
+        state = self.prefixes.get(key)
+        if state is None:
+            self.prefixes[key] = RTTState(rtt)
+            if len(self.prefixes) > self.max_prefixes:
+                self.prefixes.popitem(last=False)
+            return
+        self.prefixes.move_to_end(key)
+        state.rttvar = (1 - self.beta) * state.rttvar + self.beta * abs(state.srtt - rtt)
+        state.srtt = (1 - self.alpha) * state.srtt + self.alpha * rtt
+
+    def timeout(self, ip):
+        """返回发往 ip 的请求应等待的秒数。"""
+        state = self.prefixes.get(self.prefix_of(ip))
+        if state is None:
+            return self.initial
+        rto = state.srtt + self.k * state.rttvar
+        return min(max(rto, self.min_rto), self.max_rto)
+
+    def srtt(self, ip):
+        state = self.prefixes.get(self.prefix_of(ip))
+        return state.srtt if state else None
@@ -1,35 +1,91 @@
 #/usr/bin/python3
 #!coding=utf-8
 
+import atexit
+import csv
+import itertools
 import socket
 import time
 import pandas as pd
-from scapy.all import raw, DNS, DNSQR, Raw
 import concurrent.futures
+import metrics
 import utils
-import csv
+from batch_io import recv_buffer
+from dns_parser import parse_dns
+from query_builder import SERVICES_QUERY, HEADER_LEN, query_header, encode_question, thread_builder
+from rtt import RTTEstimator
 
-def get_service_info_an(sock, target, resp_an, count):
+# 阻塞式扫描的重传次数（与 AsyncScanner 默认的 retries=1 一致）与退避倍数；
+# 超时由按 /24 前缀估计的 RTT 给出，未知前缀为 2 秒
+RETRIES = 1
+BACKOFF = 2.0
+RTT = RTTEstimator(initial=2)
+# 可选的 service_cache.ServiceCache：命中时 dnssd_scan() 跳过首轮 PTR 查询
+SERVICE_CACHE = None
+# exchange() 与 pipeline_exchange() 的事务ID序列，各线程共用，保证相邻阶段与重传的ID互不相同
+_TXIDS = itertools.count()
+
+def sync_service_cache():
+    """把 SERVICE_CACHE 中尚未写盘的条目写入磁盘；扫描结束与进程退出时调用。"""
+    if SERVICE_CACHE is not None:
+        SERVICE_CACHE.sync()
+
+atexit.register(sync_service_cache)
+
+def exchange(sock, target, req, stage="ptr"):
     """
-    发送第二阶段DNS-SD请求（基于an ancount），并解析响应。
+    发送请求并接收响应。超时按 RTT 估计给出，最多重传 RETRIES 次并按 BACKOFF 退避，
+    全部超时时抛出 socket.timeout。stage 为 metrics 中的阶段标签（ptr/an/ar）。
+    每次发送使用新的事务ID，来源地址或事务ID不符的数据报（如上一阶段迟到的重复响应）被丢弃；
+    本次调用中较早发送的请求迟到的响应同样有效。
+    响应接收到线程复用的缓冲区中，返回其 memoryview，在下一次 exchange() 前有效。
     """
-    service = Raw(load=resp_an)
-    req = DNS(id=0x0001, rd=1, qd=service, qdcount=count)
-    try:
-        sock.sendto(raw(req), target)
-        data, _ = sock.recvfrom(10240)
-        resp = DNS(data)
-        print("Second DNS-SD (from AN):")
-        resp.show()
-        print("============RESP END===========")
-    except (socket.timeout, ConnectionResetError):
-        print(f"[{target[0]}] OFFLINE or timeout.")
-        return -1
-    except Exception as e:
-        print(f"An error occurred with {target[0]}: {e}")
-        return -1
+    buf = recv_buffer()
+    first = time.perf_counter()
+    sent_at = {}
+    for attempt in range(RETRIES + 1):
+        txid = next(_TXIDS) % 0xffff + 1
+        packet = txid.to_bytes(2, "big") + req[2:]
+        sent_at[txid] = time.perf_counter()
+        sock.sendto(packet, target)
+        metrics.PACKETS_SENT.inc(stage)
+        metrics.BYTES_SENT.inc(stage, amount=len(packet))
+        deadline = time.perf_counter() + RTT.timeout(target[0]) * BACKOFF ** attempt
+        while True:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            sock.settimeout(remaining)
+            try:
+                n, addr = sock.recvfrom_into(buf)
+            except socket.timeout:
+                break
+            except ConnectionResetError:
+                continue
+            if addr[:2] != target or n < HEADER_LEN:
+                continue
+            rid = int.from_bytes(buf[:2], "big")
+            if rid not in sent_at and rid != 0:
+                continue
+            now = time.perf_counter()
+            # 不回显事务ID的应答方（ID 为 0）无法区分响应对应哪一次发送，按 Karn 算法不采样 RTT
+            if rid in sent_at:
+                RTT.sample(target[0], now - sent_at[rid])
+            elif attempt == 0:
+                RTT.sample(target[0], now - first)
+            data = memoryview(buf)[:n]
+            metrics.PACKETS_RECEIVED.inc(stage)
+            metrics.BYTES_RECEIVED.inc(stage, amount=len(data))
+            metrics.STAGE_SECONDS.observe(now - first, stage)
+            return data
+        metrics.TIMEOUTS.inc(stage)
+    raise socket.timeout("timed out")
 
-    magnify = round(len(resp)/len(req),2)
+def parse_service_info_an(target, req_len, resp):
+    """
+    解析第二阶段DNS-SD响应（基于an ancount），记录服务信息与放大倍数。
+    """
+    magnify = round(len(resp)/req_len,2)
     repeat = {}
     port = 0
     if resp.ancount > 0:
@@ -55,27 +111,34 @@ def get_service_info_an(sock, target, resp_an, count):
                 rdata = ("target:" + str(resp.ar[i].target))
             repeat[rrname] = rdata
             utils.write_scan_log(target,rrname,rdata,port)
-    utils.get_magnify(target,len(req),len(resp),magnify,"mDNS")
+    utils.get_magnify(target,req_len,len(resp),magnify,"mDNS")
     return magnify,len(resp)
 
-def get_service_info_ar(sock, target, resp_ar, count):
+def get_service_info_an(sock, target, resp_an, count):
     """
-    发送第二阶段DNS-SD请求（基于arcount），并解析响应。
+    发送第二阶段DNS-SD请求（基于an ancount），并解析响应。
     """
-    service = Raw(load=resp_ar)
-    req = DNS(id=0x0001, rd=1, qd=service, qdcount=count)
+    req = query_header(count) + resp_an
     try:
-        sock.sendto(raw(req), target)
-        data, _ = sock.recvfrom(10240)
-        resp = DNS(data)
+        data = exchange(sock, target, req, "an")
+        resp = parse_dns(data)
+        print("Second DNS-SD (from AN):")
+        resp.show()
+        print("============RESP END===========")
     except (socket.timeout, ConnectionResetError):
         print(f"[{target[0]}] OFFLINE or timeout.")
         return -1
     except Exception as e:
         print(f"An error occurred with {target[0]}: {e}")
         return -1
-        
-    magnify=round(len(resp)/len(req))
+
+    return parse_service_info_an(target, len(req), resp)
+
+def parse_service_info_ar(target, req_len, resp):
+    """
+    解析第二阶段DNS-SD响应（基于arcount），记录服务信息与放大倍数。
+    """
+    magnify=round(len(resp)/req_len)
     repeat = {}
     port = 0
     if resp.arcount > 0:
@@ -101,9 +164,60 @@ def get_service_info_ar(sock, target, resp_ar, count):
                 rdata = ( "target:" + str(resp.an[i].target))
             repeat[rrname] = rdata
             utils.write_scan_log(target,rrname,rdata,port,resp.an[i].type)
-    utils.get_magnify(target,len(req),len(resp),magnify,"DNS-SD")
+    utils.get_magnify(target,req_len,len(resp),magnify,"DNS-SD")
     return magnify,len(resp)
 
+def get_service_info_ar(sock, target, resp_ar, count):
+    """
+    发送第二阶段DNS-SD请求（基于arcount），并解析响应。
+    """
+    req = query_header(count) + resp_ar
+    try:
+        data = exchange(sock, target, req, "ar")
+        resp = parse_dns(data)
+    except (socket.timeout, ConnectionResetError):
+        print(f"[{target[0]}] OFFLINE or timeout.")
+        return -1
+    except Exception as e:
+        print(f"An error occurred with {target[0]}: {e}")
+        return -1
+        
+    return parse_service_info_ar(target, len(req), resp)
+
+def build_aggregate_payload(resp, section):
+    """
+    将首轮响应中 an/ar 段每条记录的 rdata 拼接为聚合 ANY 查询的 question 段。
+    """
+    if section == "AN":
+        records, count = resp.an, resp.ancount
+    else:
+        records, count = resp.ar, resp.arcount
+    builder = thread_builder()
+    builder.add_records(records, count, section)
+    return builder.payload()
+
+def cached_scan(sock, target, cached):
+    """
+    使用缓存的服务列表（service_cache.ServiceList）直接执行 AN/AR 两轮聚合查询。
+    AN 轮失败时返回 None，由调用方回退到完整的服务发现；AN 轮成功后 AR 轮失败返回 0，与 dnssd_scan() 相同。
+    """
+    an_resp = ar_resp = an_req = ar_req = 0
+    if cached.an_count > 0:
+        ret = get_service_info_an(sock, target, cached.an_payload, cached.an_count)
+        if ret == -1:
+            return None
+        an_resp = ret[1]
+        an_req = HEADER_LEN + len(cached.an_payload)
+    if cached.ar_count > 0:
+        ret = get_service_info_ar(sock, target, cached.ar_payload, cached.ar_count)
+        if ret == -1:
+            return None if cached.an_count == 0 else 0
+        ar_resp = ret[1]
+        ar_req = HEADER_LEN + len(cached.ar_payload)
+    print(f"[{target[0]}] ONLINE (cached service list)")
+    return cached.result(an_resp, an_req, ar_resp, ar_req)
+
+@metrics.track_target
 def dnssd_scan(target_ip, port=5353):
     """
     对单个目标执行聚合模式的DNS-SD扫描。
@@ -112,13 +226,19 @@ def dnssd_scan(target_ip, port=5353):
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
     sock.settimeout(2)
 
+    if SERVICE_CACHE is not None:
+        cached = SERVICE_CACHE.get(target)
+        if cached is not None:
+            ret = cached_scan(sock, target, cached)
+            if ret is not None:
+                return ret
+            SERVICE_CACHE.invalidate(target)
+
     # 阶段一: 查询所有服务
-    f_req = DNS(id=0x0001, rd=1, qd=DNSQR(qtype="PTR", qname="_services._dns-sd._udp.local"))
-    print("First DNS-SD request:")
-    f_req.show()
+    f_req = SERVICES_QUERY
+    print("First DNS-SD request:", f_req.hex())
     try:
-        sock.sendto(raw(f_req), target)
-        data, _ = sock.recvfrom(10240)
+        data = exchange(sock, target, f_req)
         magnify = round(len(data)/len(f_req),2)
         utils.get_magnify(target,len(f_req),len(data),magnify,"DNS-SD")
     except (socket.timeout, ConnectionResetError):
@@ -128,7 +248,7 @@ def dnssd_scan(target_ip, port=5353):
         print(f"An error occurred with {target[0]}: {e}")
         return -1
 
-    resp = DNS(data)
+    resp = parse_dns(data)
     print("First DNS-SD response:")
     resp.show()
     print("============RESP END===========")
@@ -137,44 +257,29 @@ def dnssd_scan(target_ip, port=5353):
     an_resp = ar_resp = 0
     an_req = ar_req = 0
     print(f"[{target[0]}] ONLINE")
+    if SERVICE_CACHE is not None:
+        SERVICE_CACHE.put(target, resp, len(resp), magnify)
 
     # 阶段二: 基于 ancount 的聚合查询
     if resp.ancount > 0:
         print(f"resp.ancount={resp.ancount}")
-        dns_payload=b""
-        for i in range(0, resp.ancount):
-            if hasattr(resp.an[i],"rdata"):
-                print("service:", resp.an[i].rdata)
-                try:
-                    dns_payload+=bytes(DNSQR(qtype=255, qname=resp.an[i].rdata))
-                except Exception as e:
-                    print(f"Error processing AN record {resp.an[i].rdata}: {e}")
-            else:
-                print(resp.an[i])
+        dns_payload = build_aggregate_payload(resp, "AN")
         ret = get_service_info_an(sock, target, dns_payload, resp.ancount)
         if ret != -1:
             an_mag , an_resp = ret
-            service = Raw(load=dns_payload)
-            an_req = len(DNS(id=0x0001, rd=1, qd=service, qdcount=resp.ancount))
+            an_req = HEADER_LEN + len(dns_payload)
         else:
             return 0
         print("AN round return: ",ret)
 
     # 阶段三: 基于 arcount 的聚合查询
     if resp.arcount > 0:
-        dns_payload=b""
         print(f"resp.arcount={resp.arcount}")
-        for i in range(0, resp.arcount):
-            if hasattr(resp.ar[i],"rdata"):
-                try:
-                    dns_payload+=bytes(DNSQR(qtype=255, qname=resp.ar[i].rdata))
-                except Exception as e:
-                    print(f"Error processing AR record {resp.ar[i].rdata}: {e}")
+        dns_payload = build_aggregate_payload(resp, "AR")
         ret = get_service_info_ar(sock, target, dns_payload, resp.arcount)
         if ret!=-1:
             ar_mag , ar_resp = ret
-            service = Raw(load=dns_payload)
-            ar_req = len(DNS(id=0x0001, rd=1, qd=service, qdcount=resp.arcount))
+            ar_req = HEADER_LEN + len(dns_payload)
         else:
             return 0
     
@@ -188,6 +293,7 @@ def dnssd_scan(target_ip, port=5353):
         
     return [magnify, mdns_mag, (len(resp)+an_resp+ar_resp), (len(f_req)+an_req+ar_req), resp.ancount+resp.arcount]
 
+@metrics.track_target
 def separate_send(target_ip, port=5353):
     """
     对单个目标执行分离模式的DNS-SD扫描。
@@ -197,10 +303,9 @@ def separate_send(target_ip, port=5353):
     sock.settimeout(2)
 
     magnify = 0
-    f_req = DNS(id=0x0001, rd=1, qd=DNSQR(qtype="PTR", qname="_services._dns-sd._udp.local"))
+    f_req = SERVICES_QUERY
     try:
-        sock.sendto(raw(f_req), target)
-        data, _ = sock.recvfrom(10240)
+        data = exchange(sock, target, f_req)
         magnify = round(len(data)/len(f_req),2)
         utils.get_magnify(target,len(f_req),len(data),magnify,"DNS-SD")
     except (socket.timeout, ConnectionResetError):
@@ -210,7 +315,7 @@ def separate_send(target_ip, port=5353):
         print(f"An error occurred with {target[0]}: {e}")
         return -1
         
-    resp = DNS(data)
+    resp = parse_dns(data)
     an_resp = ar_resp = 0
     an_req = ar_req = 1 # Avoid division by zero
     
@@ -221,7 +326,7 @@ def separate_send(target_ip, port=5353):
             dns_payload=b""
             if hasattr(resp.an[i],"rdata"):
                 try:
-                    dns_payload=bytes(DNSQR(qtype=255, qname=resp.an[i].rdata))
+                    dns_payload=encode_question(resp.an[i].rdata)
                 except Exception as e:
                     print(f"Error processing AN record {resp.an[i].rdata}: {e}")
                     continue
@@ -230,13 +335,11 @@ def separate_send(target_ip, port=5353):
                 continue
             
             ret = get_service_info_an(sock, target, dns_payload, 1)
-            service = Raw(load=dns_payload)
-            req = DNS(id=0x0001, rd=1, qd=service, qdcount=1)
             
             if ret!=-1:
                 mag , res = ret
                 an_resp += res
-                an_req += len(req)
+                an_req += HEADER_LEN + len(dns_payload)
 
     if resp.arcount > 0:
         print(f"resp.arcount={resp.arcount}")
@@ -244,17 +347,15 @@ def separate_send(target_ip, port=5353):
             dns_payload=b""
             if hasattr(resp.ar[i],"rdata"):
                 try:
-                    dns_payload=bytes(DNSQR(qtype=255, qname=resp.ar[i].rdata))
+                    dns_payload=encode_question(resp.ar[i].rdata)
                 except Exception as e:
                     print(f"Error processing AR record {resp.ar[i].rdata}: {e}")
                     continue
             ret = get_service_info_ar(sock, target, dns_payload, 1)
-            service = Raw(load=dns_payload)
-            req = DNS(id=0x0001, rd=1, qd=service, qdcount=1)
             if ret!=-1:
                 mag , res = ret
                 ar_resp += res
-                ar_req += len(req)
+                ar_req += HEADER_LEN + len(dns_payload)
                 
     time_end=time.perf_counter()
     time_consumed=time_end-time_start
@@ -265,6 +366,265 @@ def separate_send(target_ip, port=5353):
     
     return [magnify, mdns_mag, total_resp_len, total_req_len, time_consumed, resp.ancount+resp.arcount]
 
+# 混合模式的字节预算：None 表示按路径 MTU 计算；取不到 MTU 时按以太网 1500 字节
+HYBRID_BUDGET = None
+DEFAULT_MTU = 1500
+# IP 头 20 字节 + UDP 头 8 字节
+UDP_OVERHEAD = 28
+IP_MTU = getattr(socket, "IP_MTU", 14)
+
+def path_budget(target):
+    """
+    估计发往 target 的单个 UDP 载荷可用字节数：Linux 上连接一个临时套接字读取 IP_MTU，
+    其他平台或失败时按 DEFAULT_MTU 计算。
+    """
+    mtu = DEFAULT_MTU
+    probe = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        probe.connect(target)
+        mtu = probe.getsockopt(socket.IPPROTO_IP, IP_MTU)
+    except OSError:
+        pass
+    finally:
+        probe.close()
+    return mtu - UDP_OVERHEAD
+
+def chunk_questions(fragments, budget):
+    """
+    把预编码的 question 片段按顺序装箱，每块连同报文头不超过 budget 字节；
+    单个片段本身超出预算时独占一块。返回 [[片段, ...], ...]。
+    """
+    chunks = []
+    current = []
+    size = HEADER_LEN
+    for fragment in fragments:
+        if current and size + len(fragment) > budget:
+            chunks.append(current)
+            current = []
+            size = HEADER_LEN
+        current.append(fragment)
+        size += len(fragment)
+    if current:
+        chunks.append(current)
+    return chunks
+
+def pipeline_exchange(sock, target, requests, stage="an"):
+    """
+    一次性发出全部请求（各自使用从 _TXIDS 取得的不同事务ID，与之前的轮次不重复），在同一个截止时间内收集响应，
+    未应答的请求按 RETRIES/BACKOFF 整体重传；之前轮次迟到的响应同样有效。
+    stage 为 metrics 阶段标签，也可以是与 requests 等长的标签列表。
+    返回与 requests 对应的响应列表，未应答为 None。
+    """
+    stages = stage if isinstance(stage, list) else [stage] * len(requests)
+    results = [None] * len(requests)
+    unanswered = set(range(len(requests)))
+    pending = {}
+    sent_at = {}
+    for attempt in range(RETRIES + 1):
+        for i in sorted(unanswered):
+            txid = next(_TXIDS) % 0xffff + 1
+            req = txid.to_bytes(2, "big") + requests[i][2:]
+            sock.sendto(req, target)
+            metrics.PACKETS_SENT.inc(stages[i])
+            metrics.BYTES_SENT.inc(stages[i], amount=len(req))
+            pending[txid] = i
+            sent_at[txid] = time.perf_counter()
+        deadline = time.perf_counter() + RTT.timeout(target[0]) * BACKOFF ** attempt
+        while unanswered:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            sock.settimeout(remaining)
+            try:
+                data, addr = sock.recvfrom(10240)
+            except socket.timeout:
+                break
+            except ConnectionResetError:
+                continue
+            if addr[:2] != target or len(data) < 12:
+                continue
+            rid = int.from_bytes(data[:2], "big")
+            guessed = rid == 0 and rid not in pending and bool(pending)
+            if guessed:
+                # 不回显事务ID的应答方，按发送顺序匹配
+                rid = next(iter(pending))
+            i = pending.pop(rid, None)
+            if i is None or results[i] is not None:
+                continue
+            elapsed = time.perf_counter() - sent_at[rid]
+            # 按顺序猜测的匹配可能对应别的请求，按 Karn 算法不采样 RTT
+            if not guessed:
+                RTT.sample(target[0], elapsed)
+            metrics.PACKETS_RECEIVED.inc(stages[i])
+            metrics.BYTES_RECEIVED.inc(stages[i], amount=len(data))
+            metrics.STAGE_SECONDS.observe(elapsed, stages[i])
+            results[i] = data
+            unanswered.discard(i)
+        for i in unanswered:
+            metrics.TIMEOUTS.inc(stages[i])
+        if not unanswered:
+            break
+    return results
+
+def _hybrid_round(sock, target, records, count, section, budget):
+    """
+    混合模式的一个阶段：把 an/ar 段的服务名装箱为若干 ANY 查询，流水线发送并只重传失败的块。
+    返回 (响应总长, 已应答请求总长, 块数, 失败块数)，全部失败时返回 -1。
+    """
+    fragments = []
+    for i in range(0, count):
+        if hasattr(records[i],"rdata"):
+            try:
+                fragments.append(encode_question(records[i].rdata))
+            except Exception as e:
+                print(f"Error processing {section} record {records[i].rdata}: {e}")
+    chunks = chunk_questions(fragments, budget)
+    if not chunks:
+        return 0, 0, 0, 0
+    requests = [query_header(len(chunk)) + b"".join(chunk) for chunk in chunks]
+    parse = parse_service_info_an if section == "AN" else parse_service_info_ar
+    resp_len = req_len = failed = 0
+    for req, data in zip(requests, pipeline_exchange(sock, target, requests, section.lower())):
+        if data is None:
+            failed += 1
+            continue
+        try:
+            _, n = parse(target, len(req), parse_dns(data))
+        except Exception as e:
+            print(f"An error occurred with {target[0]}: {e}")
+            failed += 1
+            continue
+        resp_len += n
+        req_len += len(req)
+    if failed == len(requests):
+        return -1
+    return resp_len, req_len, len(requests), failed
+
+@metrics.track_target
+def hybrid_send(target_ip, port=5353, budget=None):
+    """
+    对单个目标执行混合模式扫描：介于聚合与分离模式之间，按路径 MTU（或 budget 字节）
+    把服务名装成多个 ANY 查询，流水线发送，只重传未应答的块。
+    返回值与 dnssd_scan() 相同，便于在 model_test() 中直接比较。
+    """
+    target = (target_ip, port)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    budget = budget or HYBRID_BUDGET or path_budget(target)
+
+    f_req = SERVICES_QUERY
+    try:
+        data = exchange(sock, target, f_req)
+        magnify = round(len(data)/len(f_req),2)
+        utils.get_magnify(target,len(f_req),len(data),magnify,"DNS-SD")
+        resp = parse_dns(data)
+    except (socket.timeout, ConnectionResetError):
+        print(f"[{target[0]}] OFFLINE or timeout.")
+        sock.close()
+        return -1
+    except Exception as e:
+        print(f"An error occurred with {target[0]}: {e}")
+        sock.close()
+        return -1
+    print(f"[{target[0]}] ONLINE")
+
+    totals = {"AN": (0, 0), "AR": (0, 0)}
+    try:
+        for section, records, count in (("AN", resp.an, resp.ancount), ("AR", resp.ar, resp.arcount)):
+            if count <= 0:
+                continue
+            ret = _hybrid_round(sock, target, records, count, section, budget)
+            if ret == -1:
+                return 0
+            resp_len, req_len, chunks, failed = ret
+            print(f"{section} round: {chunks} chunks, {failed} failed")
+            totals[section] = (resp_len, req_len)
+    finally:
+        sock.close()
+
+    total_req_len = len(f_req) + totals["AN"][1] + totals["AR"][1]
+    total_resp_len = len(resp) + totals["AN"][0] + totals["AR"][0]
+    mdns_mag = total_resp_len / total_req_len if total_req_len > 0 else 0
+    return [magnify, mdns_mag, total_resp_len, total_req_len, resp.ancount+resp.arcount]
+
+@metrics.track_target
+def separate_pipelined(target_ip, port=5353):
+    """
+    流水线版本的分离模式：每个服务仍单独查询，但全部请求一次性发出（各自使用不同的事务ID），
+    在同一个截止时间内收集响应，耗时约一个 RTT。请求的构造与计数与 separate_send() 相同，
+    返回值格式也相同，可直接替换其参与聚合/分离模式的对比。
+    """
+    target = (target_ip, port)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    magnify = 0
+    f_req = SERVICES_QUERY
+    try:
+        data = exchange(sock, target, f_req)
+        magnify = round(len(data)/len(f_req),2)
+        utils.get_magnify(target,len(f_req),len(data),magnify,"DNS-SD")
+        resp = parse_dns(data)
+    except (socket.timeout, ConnectionResetError):
+        print(f"[{target[0]}] OFFLINE or timeout.")
+        sock.close()
+        return -1
+    except Exception as e:
+        print(f"An error occurred with {target[0]}: {e}")
+        sock.close()
+        return -1
+
+    an_resp = ar_resp = 0
+    an_req = ar_req = 1 # Avoid division by zero
+
+    time_start=time.perf_counter()
+    # (阶段, 请求) 列表，与 separate_send() 逐个发送的请求一一对应
+    queries = []
+    for i in range(0, resp.ancount):
+        if hasattr(resp.an[i],"rdata"):
+            try:
+                queries.append(("AN", query_header(1) + encode_question(resp.an[i].rdata)))
+            except Exception as e:
+                print(f"Error processing AN record {resp.an[i].rdata}: {e}")
+        else:
+            print(resp.an[i])
+    for i in range(0, resp.arcount):
+        dns_payload=b""
+        if hasattr(resp.ar[i],"rdata"):
+            try:
+                dns_payload=encode_question(resp.ar[i].rdata)
+            except Exception as e:
+                print(f"Error processing AR record {resp.ar[i].rdata}: {e}")
+                continue
+        queries.append(("AR", query_header(1) + dns_payload))
+
+    try:
+        replies = pipeline_exchange(sock, target, [q for _, q in queries], [s.lower() for s, _ in queries])
+    finally:
+        sock.close()
+    for (section, req), data in zip(queries, replies):
+        if data is None:
+            print(f"[{target[0]}] OFFLINE or timeout.")
+            continue
+        try:
+            if section == "AN":
+                _, res = parse_service_info_an(target, len(req), parse_dns(data))
+                an_resp += res
+                an_req += len(req)
+            else:
+                _, res = parse_service_info_ar(target, len(req), parse_dns(data))
+                ar_resp += res
+                ar_req += len(req)
+        except Exception as e:
+            print(f"An error occurred with {target[0]}: {e}")
+
+    time_end=time.perf_counter()
+    time_consumed=time_end-time_start
+
+    total_req_len = len(f_req) + an_req + ar_req
+    total_resp_len = len(resp) + an_resp + ar_resp
+    mdns_mag = total_resp_len / total_req_len if total_req_len > 0 else 0
+
+    return [magnify, mdns_mag, total_resp_len, total_req_len, time_consumed, resp.ancount+resp.arcount]
+
 def speed_test(duration, target_ip):
     """
     在指定时间内，对单个IP重复发送扫描包以测试速度。
@@ -307,38 +667,48 @@ def magnify_test(excel_file_path):
                 if status[2] > len_max:
                     len_max = status[2]
     
+    sync_service_cache()
     print("Scan end")
     print(f"Max DNS-SD magnify: {dnssd_max}")
     print(f"Max mDNS magnify: {mdns_max}")
     df.to_excel(excel_file_path, index=False)
 
-def model_test(df):
+def model_test(df, pipelined=False):
     """
-    对DataFrame中的IP列表同时进行聚合和分离模式的扫描，并记录结果。
+    对DataFrame中的IP列表同时进行聚合、分离和混合模式的扫描，并记录结果。
+    pipelined=True 时分离模式使用 separate_pipelined()。
     """
-    with open("aggtest.csv","a+", newline='') as wf1, open("septest.csv","a+", newline='') as wf2:
+    separate = separate_pipelined if pipelined else separate_send
+    with open("aggtest.csv","a+", newline='') as wf1, open("septest.csv","a+", newline='') as wf2, \
+            open("hybtest.csv","a+", newline='') as wf3:
         csv_write1 = csv.writer(wf1)
         csv_write2 = csv.writer(wf2)
+        csv_write3 = csv.writer(wf3)
         
         # 写入标题行
         header = ["IP", "dnssd_mag", "mdns_mag", "total_resp_len", "total_req_len", "service_count"]
         csv_write1.writerow(header)
         header_sep = header + ["time_consumed"]
         csv_write2.writerow(header_sep)
+        csv_write3.writerow(header)
 
         networks = df["IP"]
         i=0
         for network in networks:
             agg_status = dnssd_scan(network)
-            sep_status = separate_send(network)
+            sep_status = separate(network)
+            hyb_status = hybrid_send(network)
             if(agg_status!=-1 and sep_status!=-1):
                 agg_status.insert(0,network)
                 sep_status.insert(0,network)
                 csv_write1.writerow(agg_status)
                 csv_write2.writerow(sep_status)
+            if hyb_status!=-1 and hyb_status!=0:
+                csv_write3.writerow([network] + hyb_status)
             i+=1
             if i%100==0:
                 print(f"{i} scan finished!")
+    sync_service_cache()
     print("Scan end")
 
 def func(network):
@@ -0,0 +1,160 @@
+#/usr/bin/python3
+#!coding=utf-8
+
+import collections
+import os
+import sqlite3
+import threading
+import time
+import metrics
+from query_builder import SERVICES_QUERY, thread_builder
+
+class ServiceList:
+    """
+    一个主机首轮 PTR 枚举的结果：AN/AR 两段聚合 ANY 查询的 question 段与问题数，
+    以及首轮响应长度与 DNS-SD 放大倍数（命中缓存时用于计算返回值）。
+    """
+    __slots__ = ("an_payload", "an_count", "ar_payload", "ar_count", "ptr_len", "magnify", "expires")
+
+    def __init__(self, an_payload, an_count, ar_payload, ar_count, ptr_len, magnify, expires):
+        self.an_payload = an_payload
+        self.an_count = an_count
+        self.ar_payload = ar_payload
+        self.ar_count = ar_count
+        self.ptr_len = ptr_len
+        self.magnify = magnify
+        self.expires = expires
+
+    def result(self, an_resp, an_req, ar_resp, ar_req):
+        """按 dnssd_scan() 的格式给出返回值，首轮的长度与放大倍数取缓存的值。"""
+        total_req_len = len(SERVICES_QUERY) + an_req + ar_req
+        total_resp_len = self.ptr_len + an_resp + ar_resp
+        mdns_mag = total_resp_len / total_req_len if total_req_len > 0 else 0
+        return [self.magnify, mdns_mag, total_resp_len, total_req_len, self.an_count + self.ar_count]
+
+def _payload(resp, section):
+    builder = thread_builder()
+    if section == "AN":
+        builder.add_records(resp.an, resp.ancount, section)
+    else:
+        builder.add_records(resp.ar, resp.arcount, section)
+    return builder.payload()
+
+class ServiceCache:
+    """
+    按 (IP, 端口) 缓存服务列表，带 TTL 与 LRU 淘汰。命中时扫描跳过首轮 PTR 查询，
+    直接发送聚合 ANY 查询；该轮失败时调用方 invalidate() 并回退到完整的服务发现。
+    内存中最多保留 max_entries 条；给出 path 时另以 SQLite 文件保存，
+    内存未命中时从磁盘读取，跨进程、跨次运行复用。
+    """
+    def __init__(self, ttl=3600, max_entries=100000, path=None, sync_every=1000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.path = path
+        self.sync_every = sync_every
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self._pending = {}
+        self._db = None
+        self._open()
+
+    def _open(self):
+        if self.path:
+            self._db = sqlite3.connect(os.path.abspath(self.path), timeout=60, check_same_thread=False)
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS service_cache (
+                    ip TEXT NOT NULL, port INTEGER NOT NULL, expires REAL NOT NULL,
+                    an_payload BLOB, an_count INTEGER, ar_payload BLOB, ar_count INTEGER,
+                    ptr_len INTEGER, magnify REAL, PRIMARY KEY (ip, port))""")
+            self._db.commit()
+
+    def __getstate__(self):
+        # 分片扫描的工作进程各自重新打开磁盘缓存，内存中的条目不随之复制
+        return {"ttl": self.ttl, "max_entries": self.max_entries, "path": self.path, "sync_every": self.sync_every}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, target):
+        """返回未过期的 ServiceList，没有时返回 None。"""
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(target)
+            if entry is None and self._db is not None:
+                entry = self._load(target)
+                if entry is not None:
+                    self._insert(target, entry)
+            if entry is not None and entry.expires <= now:
+                self._remove(target)
+                entry = None
+            if entry is None:
+                metrics.SERVICE_CACHE.inc("miss")
+                return None
+            self.entries.move_to_end(target)
+        metrics.SERVICE_CACHE.inc("hit")
+        return entry
+
+    def put(self, target, resp, ptr_len, magnify):
+        """记录首轮响应 resp 中的服务列表。没有任何记录时不缓存，以免跳过对主机在线与否的探测。"""
+        if resp.ancount <= 0 and resp.arcount <= 0:
+            return
+        entry = ServiceList(_payload(resp, "AN") if resp.ancount > 0 else b"", max(resp.ancount, 0),
+                            _payload(resp, "AR") if resp.arcount > 0 else b"", max(resp.arcount, 0),
+                            ptr_len, magnify, time.time() + self.ttl)
+        with self.lock:
+            self._insert(target, entry)
+            if self._db is not None:
+                self._pending[target] = entry
+                if len(self._pending) >= self.sync_every:
+                    self._sync()
+
+    def invalidate(self, target):
+        """缓存的服务列表失效（聚合查询失败）时调用。"""
+        metrics.SERVICE_CACHE.inc("fallback")
+        with self.lock:
+            self._remove(target)
+
+    def sync(self):
+        """把尚未写盘的条目写入磁盘。"""
+        with self.lock:
+            self._sync()
+
+    def close(self):
+        if self._db is not None:
+            self.sync()
+            self._db.close()
+            self._db = None
+
+    def _insert(self, target, entry):
+        self.entries[target] = entry
+        self.entries.move_to_end(target)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def _remove(self, target):
+        self.entries.pop(target, None)
+        if self._db is not None:
+            self._pending.pop(target, None)
+            self._db.execute("DELETE FROM service_cache WHERE ip = ? AND port = ?", target)
+            self._db.commit()
+
+    def _load(self, target):
+        if target in self._pending:
+            return self._pending[target]
+        row = self._db.execute("""
+            SELECT an_payload, an_count, ar_payload, ar_count, ptr_len, magnify, expires
+            FROM service_cache WHERE ip = ? AND port = ?""", target).fetchone()
+        return ServiceList(*row) if row else None
+
+    def _sync(self):
+        if not self._pending:
+            return
+        self._db.executemany("INSERT OR REPLACE INTO service_cache VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                             [(ip, port, e.expires, e.an_payload, e.an_count, e.ar_payload, e.ar_count, e.ptr_len, e.magnify)
+                              for (ip, port), e in self._pending.items()])
+        self._db.execute("DELETE FROM service_cache WHERE expires <= ?", (time.time(),))
+        self._db.commit()
+        self._pending.clear()
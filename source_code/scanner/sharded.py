@@ -0,0 +1,202 @@
+#/usr/bin/python3
+#!coding=utf-8
+
+import asyncio
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import zlib
+import dns_parser
+import metrics
+import utils
+from async_scanner import AsyncScanner
+from rate_control import AdaptiveRateController
+from targets import TargetSource
+
+AGG_COLUMNS = ["IP", "dnssd_mag", "mdns_mag", "total_resp_len", "total_req_len", "service_count"]
+
+# 工作进程回传结果的批量条数与最长间隔（秒）
+RESULT_BATCH = 256
+RESULT_INTERVAL = 0.5
+
+def shard_of(target, shards, partition="prefix"):
+    """
+    计算目标所属的分片。partition="prefix" 按 /24 划分，同一网段的目标落在同一进程，
+    其 RTT 估计与每前缀限速不被拆散；"hash" 按单个 IP 划分，负载更均匀。
+    """
+    ip = target[0] if isinstance(target, tuple) else target
+    key = ip.rsplit(".", 1)[0] if partition == "prefix" and "." in ip else ip
+    return zlib.crc32(key.encode()) % shards
+
+def _worker(shard, in_queue, out_queue, options, rate_options, parse_cache):
+    """
+    工作进程：运行独立的事件循环与套接字扫描分到的目标，
+    结果与 CSV 行成批回传给聚合进程。
+    """
+    utils.forward_writers(out_queue)
+    if parse_cache:
+        dns_parser.enable_cache(parse_cache)
+
+    async def targets():
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await loop.run_in_executor(None, in_queue.get)
+            if batch is None:
+                return
+            for item in batch:
+                yield item
+
+    def send(results):
+        # 先送出结果对应的 CSV 行，聚合进程保存检查点时这些行已经入队
+        utils.flush_writers()
+        out_queue.put(("results", results))
+        out_queue.put(("metrics", shard, metrics.REGISTRY.state()))
+
+    async def _main():
+        rate_controller = AdaptiveRateController(**rate_options) if rate_options else None
+        results = []
+        deadline = time.monotonic() + RESULT_INTERVAL
+        async with AsyncScanner(rate_controller=rate_controller, **options) as scanner:
+            async for item in scanner.scan(targets()):
+                results.append(item)
+                if len(results) >= RESULT_BATCH or time.monotonic() >= deadline:
+                    send(results)
+                    results = []
+                    deadline = time.monotonic() + RESULT_INTERVAL
+        if results:
+            send(results)
+
+    try:
+        asyncio.run(_main())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        utils.close_writers()
+        if options.get("service_cache") is not None:
+            options["service_cache"].close()
+        out_queue.put(("metrics", shard, metrics.REGISTRY.state()))
+        out_queue.put(("done", shard))
+
+def scan_sharded(targets, workers=None, partition="prefix", batch_size=256, rate=None, parse_cache=None, **options):
+    """
+    多进程分片扫描：目标流按 shard_of() 分给 workers 个进程（默认每个核一个），
+    每个进程运行自己的 AsyncScanner。按完成顺序产出 (目标, 结果)；
+    各进程写出的 service.csv / service_magnify.csv 行由本进程统一写入。
+    rate 为总发送速率，平均分给各进程的 AdaptiveRateController；
+    parse_cache 给出时每个进程启用容量为该值的 dns_parser.ParseCache；
+    其余参数（concurrency、timeout、retries 等）原样传给每个进程的 AsyncScanner。
+    """
+    workers = workers or os.cpu_count() or 1
+    ctx = multiprocessing.get_context("spawn")
+    out_queue = ctx.Queue()
+    in_queues = [ctx.Queue(maxsize=8) for _ in range(workers)]
+    rate_options = {"rate": rate / workers, "max_rate": rate / workers} if rate else None
+    procs = [ctx.Process(target=_worker, args=(i, in_queues[i], out_queue, options, rate_options, parse_cache), daemon=True)
+             for i in range(workers)]
+    for p in procs:
+        p.start()
+    stop = threading.Event()
+
+    def put(i, batch):
+        # 队列有界：工作进程跟不上时读取目标的线程在此等待，不会把整个目标流读进内存
+        while not stop.is_set():
+            try:
+                in_queues[i].put(batch, timeout=0.5)
+                return
+            except queue.Full:
+                if not procs[i].is_alive():
+                    return
+
+    def feed():
+        batches = [[] for _ in range(workers)]
+        try:
+            for item in targets:
+                if stop.is_set():
+                    return
+                i = shard_of(item, workers, partition)
+                batches[i].append(item)
+                if len(batches[i]) >= batch_size:
+                    put(i, batches[i])
+                    batches[i] = []
+            for i in range(workers):
+                if batches[i]:
+                    put(i, batches[i])
+        except Exception as e:
+            print(f"Failed to read targets: {e}")
+        finally:
+            for i in range(workers):
+                put(i, None)
+
+    feeder = threading.Thread(target=feed, name="shard-feeder", daemon=True)
+    feeder.start()
+    remaining = set(range(workers))
+    try:
+        while remaining:
+            try:
+                kind, *payload = out_queue.get(timeout=1)
+            except queue.Empty:
+                for i in list(remaining):
+                    if not procs[i].is_alive():
+                        print(f"Shard {i} exited unexpectedly (exit code {procs[i].exitcode})")
+                        remaining.discard(i)
+                continue
+            if kind == "rows":
+                filename, columns, rows = payload
+                writer = utils.get_writer(filename, columns)
+                for row in rows:
+                    writer.write(row)
+            elif kind == "results":
+                yield from payload[0]
+            elif kind == "metrics":
+                # 工作进程的指标与本进程合并导出
+                metrics.REGISTRY.merge_remote(*payload)
+            elif kind == "done":
+                remaining.discard(payload[0])
+    finally:
+        stop.set()
+        for p in procs:
+            if p.is_alive() and remaining:
+                p.terminate()
+            p.join()
+        utils.flush_writers()
+
+def run_sharded(targets, workers=None, checkpoint=None, checkpoint_every=1000, **kwargs):
+    """
+    分片版本的聚合模式批量扫描：成功的结果按 model_test() 的格式追加到 aggtest.csv。
+    targets 为目标文件路径（列表）时以流式 TargetSource 读取，并可用 checkpoint 断点续扫；
+    也可以直接传入 IP 或 (IP, 端口) 的可迭代对象。返回 (扫描目标数, 成功数)。
+    """
+    if isinstance(targets, str) or (isinstance(targets, (list, tuple)) and targets
+                                    and all(isinstance(t, str) and os.path.isfile(t) for t in targets)):
+        targets = TargetSource(targets, checkpoint)
+    source = targets if isinstance(targets, TargetSource) else None
+    new_file = not os.path.exists("aggtest.csv") or os.path.getsize("aggtest.csv") == 0
+    agg = utils.get_writer("aggtest.csv", AGG_COLUMNS)
+    if new_file:
+        agg.write(AGG_COLUMNS)
+    finished = found = 0
+    try:
+        for item, result in scan_sharded(targets, workers, **kwargs):
+            if result != -1 and result != 0:
+                agg.write([item[0] if isinstance(item, tuple) else item] + result)
+                found += 1
+            finished += 1
+            if source:
+                source.mark_done(item)
+            if finished % checkpoint_every == 0:
+                print(f"{finished} scan finished!")
+                if source:
+                    utils.flush_writers()
+                    source.save()
+    finally:
+        utils.flush_writers()
+        if source:
+            source.save()
+    print("Scan end")
+    return finished, found
+
+if __name__ == "__main__":
+    import sys
+    run_sharded(sys.argv[1:] or ["8.8.8.8"])
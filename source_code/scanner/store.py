@@ -0,0 +1,351 @@
+#/usr/bin/python3
+#!coding=utf-8
+
+import argparse
+import ast
+import contextlib
+import csv
+import os
+import re
+import sqlite3
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scans (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    started REAL NOT NULL,
+    finished REAL,
+    mode TEXT,
+    hosts INTEGER DEFAULT 0,
+    changes INTEGER DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS hosts (
+    ip TEXT NOT NULL,
+    port INTEGER NOT NULL,
+    first_seen REAL NOT NULL,
+    last_seen REAL NOT NULL,
+    last_changed REAL,
+    last_scan INTEGER,
+    PRIMARY KEY (ip, port)
+);
+CREATE TABLE IF NOT EXISTS services (
+    ip TEXT NOT NULL,
+    port INTEGER NOT NULL,
+    service_type TEXT NOT NULL,
+    first_seen REAL NOT NULL,
+    last_seen REAL NOT NULL,
+    PRIMARY KEY (ip, port, service_type)
+);
+CREATE INDEX IF NOT EXISTS services_type ON services (service_type);
+-- 每个主机最近一次快照的记录
+CREATE TABLE IF NOT EXISTS records_current (
+    ip TEXT NOT NULL,
+    port INTEGER NOT NULL,
+    rrname TEXT NOT NULL,
+    rdata TEXT NOT NULL,
+    srv_port INTEGER NOT NULL,
+    rtype TEXT NOT NULL,
+    service_type TEXT,
+    scan_id INTEGER NOT NULL,
+    UNIQUE (ip, port, rrname, rdata, srv_port, rtype)
+);
+CREATE INDEX IF NOT EXISTS records_current_type ON records_current (service_type);
+-- 相邻两次快照之间的增删
+CREATE TABLE IF NOT EXISTS record_changes (
+    scan_id INTEGER NOT NULL,
+    time REAL NOT NULL,
+    ip TEXT NOT NULL,
+    port INTEGER NOT NULL,
+    change TEXT NOT NULL,
+    rrname TEXT NOT NULL,
+    rdata TEXT NOT NULL,
+    srv_port INTEGER NOT NULL,
+    rtype TEXT NOT NULL,
+    service_type TEXT
+);
+CREATE INDEX IF NOT EXISTS record_changes_ip ON record_changes (ip, time);
+CREATE INDEX IF NOT EXISTS record_changes_time ON record_changes (time);
+CREATE INDEX IF NOT EXISTS record_changes_type ON record_changes (service_type, time);
+-- 非增量模式下保存每次扫描的完整快照
+CREATE TABLE IF NOT EXISTS records (
+    scan_id INTEGER NOT NULL,
+    ip TEXT NOT NULL,
+    port INTEGER NOT NULL,
+    rrname TEXT NOT NULL,
+    rdata TEXT NOT NULL,
+    srv_port INTEGER NOT NULL,
+    rtype TEXT NOT NULL,
+    service_type TEXT
+);
+CREATE INDEX IF NOT EXISTS records_ip ON records (ip, scan_id);
+CREATE TABLE IF NOT EXISTS magnify (
+    scan_id INTEGER,
+    time REAL NOT NULL,
+    ip TEXT NOT NULL,
+    port INTEGER NOT NULL,
+    type TEXT NOT NULL,
+    send INTEGER,
+    receive INTEGER,
+    magnify REAL
+);
+CREATE INDEX IF NOT EXISTS magnify_ip ON magnify (ip, time);
+CREATE INDEX IF NOT EXISTS magnify_time ON magnify (time);
+"""
+
+# 本次扫描收到的记录先进入临时表，finish_scan() 时与 records_current 做差
+STAGING = """
+CREATE TABLE IF NOT EXISTS staging (
+    ip TEXT NOT NULL,
+    port INTEGER NOT NULL,
+    rrname TEXT NOT NULL,
+    rdata TEXT NOT NULL,
+    srv_port INTEGER NOT NULL,
+    rtype TEXT NOT NULL,
+    service_type TEXT
+);
+"""
+
+_SERVICE_TYPE = re.compile(r"(_[^.]+\._(?:tcp|udp)\.local)\.?$")
+_COLUMNS = "ip, port, rrname, rdata, srv_port, rtype, service_type"
+
+def service_type_of(rrname, rdata=""):
+    """
+    从记录名推出服务类型（如 _http._tcp.local）；服务枚举的 PTR 记录取 rdata。
+    """
+    if rrname.startswith("_services._dns-sd._udp.local"):
+        rrname = rdata
+    match = _SERVICE_TYPE.search(rrname)
+    return match.group(1) if match else None
+
+def split_target(target):
+    """扫描器写出的目标是 (ip, port) 元组；CSV 中则是它的字符串形式。"""
+    if isinstance(target, str):
+        if target.startswith("("):
+            target = ast.literal_eval(target)
+        else:
+            return target, 5353
+    return target[0], int(target[1])
+
+def record_row(row):
+    """service.csv 的一行 [target, rrname, rdata, port, rtype] 转为记录表的列。"""
+    target, rrname, rdata, port, rtype = row
+    ip, host_port = split_target(target)
+    rdata = str(rdata)
+    return (ip, host_port, str(rrname), rdata, int(port or 0), str(rtype), service_type_of(str(rrname), rdata))
+
+def magnify_row(row, scan_id, now):
+    """service_magnify.csv 的一行 [target, type, send, receive, magnify]。"""
+    target, rtype, send, receive, magnify = row
+    ip, port = split_target(target)
+    return (scan_id, now, ip, port, str(rtype), int(send), int(receive), float(magnify))
+
+class ResultStore:
+    """
+    基于 SQLite 的扫描结果库：hosts、services、records_current（最新快照）、
+    record_changes（快照之间的增删）、magnify（放大倍数测量），按 IP、服务类型和时间建索引。
+
+    一次扫描的流程：begin_scan() -> 写入记录与放大倍数（可由 utils 的写线程批量写入）
+    -> finish_scan()。finish_scan() 只对本次有响应的主机做差：新出现的记录记为 added，
+    消失的记为 removed，并更新 records_current。incremental=False 时另在 records 表中
+    保存每次扫描的完整快照。
+    """
+    def __init__(self, path="scan.db", incremental=True):
+        self.path = os.path.abspath(path)
+        self.incremental = incremental
+        self.scan_id = None
+        with self.connect() as conn:
+            conn.executescript(SCHEMA)
+            conn.executescript(STAGING)
+
+    def connect(self):
+        """新建连接（SQLite 连接不能跨线程共享，每个写线程各自调用）。"""
+        conn = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def begin_scan(self, mode="aggregate"):
+        with self.connect() as conn:
+            conn.execute("DELETE FROM staging")
+            self.scan_id = conn.execute("INSERT INTO scans (started, mode) VALUES (?, ?)",
+                                        (time.time(), mode)).lastrowid
+        return self.scan_id
+
+    def insert_records(self, conn, rows):
+        """批量写入 service.csv 格式的行。"""
+        conn.execute("BEGIN")
+        conn.executemany(f"INSERT INTO staging ({_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?)", map(record_row, rows))
+        conn.execute("COMMIT")
+
+    def insert_magnify(self, conn, rows):
+        """批量写入 service_magnify.csv 格式的行。"""
+        now = time.time()
+        conn.execute("BEGIN")
+        conn.executemany("INSERT INTO magnify VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                         (magnify_row(row, self.scan_id, now) for row in rows))
+        conn.execute("COMMIT")
+
+    def table_for(self, filename):
+        """结果文件对应的表，没有对应表时返回 None。"""
+        return {"service.csv": "records", "service_magnify.csv": "magnify"}.get(os.path.basename(filename))
+
+    def insert_rows(self, conn, filename, rows):
+        """按结果文件名分派，供 utils.ResultWriter 的 sqlite 格式调用。"""
+        table = self.table_for(filename)
+        if table == "records":
+            self.insert_records(conn, rows)
+        elif table == "magnify":
+            self.insert_magnify(conn, rows)
+        else:
+            raise ValueError(f"{os.path.basename(filename)} has no table in the result store")
+
+    def finish_scan(self):
+        """
+        将本次扫描的快照与上一次比较，写入增删记录并更新 hosts/services/records_current。
+        返回本次记录的变化条数。
+        """
+        now = time.time()
+        scan_id = self.scan_id
+        with self.connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("CREATE TEMP TABLE scanned AS SELECT DISTINCT ip, port FROM staging")
+            conn.execute("CREATE TEMP TABLE snapshot AS SELECT DISTINCT * FROM staging")
+            conn.execute("CREATE INDEX temp.snapshot_key ON snapshot (ip, port, rrname, rdata, srv_port, rtype)")
+            added = conn.execute(f"""
+                INSERT INTO record_changes (scan_id, time, change, {_COLUMNS})
+                SELECT ?, ?, 'added', s.ip, s.port, s.rrname, s.rdata, s.srv_port, s.rtype, s.service_type
+                FROM snapshot s
+                WHERE NOT EXISTS (SELECT 1 FROM records_current c
+                    WHERE c.ip = s.ip AND c.port = s.port AND c.rrname = s.rrname AND c.rdata = s.rdata
+                      AND c.srv_port = s.srv_port AND c.rtype = s.rtype)""", (scan_id, now)).rowcount
+            removed = conn.execute(f"""
+                INSERT INTO record_changes (scan_id, time, change, {_COLUMNS})
+                SELECT ?, ?, 'removed', c.ip, c.port, c.rrname, c.rdata, c.srv_port, c.rtype, c.service_type
+                FROM records_current c JOIN scanned h ON c.ip = h.ip AND c.port = h.port
+                WHERE NOT EXISTS (SELECT 1 FROM snapshot s
+                    WHERE c.ip = s.ip AND c.port = s.port AND c.rrname = s.rrname AND c.rdata = s.rdata
+                      AND c.srv_port = s.srv_port AND c.rtype = s.rtype)""", (scan_id, now)).rowcount
+            conn.execute("""
+                DELETE FROM records_current WHERE rowid IN (
+                    SELECT c.rowid FROM records_current c JOIN record_changes d
+                      ON d.scan_id = ? AND d.change = 'removed' AND c.ip = d.ip AND c.port = d.port
+                     AND c.rrname = d.rrname AND c.rdata = d.rdata AND c.srv_port = d.srv_port AND c.rtype = d.rtype)""",
+                         (scan_id,))
+            conn.execute(f"INSERT OR IGNORE INTO records_current ({_COLUMNS}, scan_id) SELECT {_COLUMNS}, ? FROM snapshot",
+                         (scan_id,))
+            if not self.incremental:
+                conn.execute(f"INSERT INTO records (scan_id, {_COLUMNS}) SELECT ?, {_COLUMNS} FROM snapshot", (scan_id,))
+            conn.execute("""
+                INSERT INTO hosts (ip, port, first_seen, last_seen, last_scan) SELECT ip, port, ?, ?, ? FROM scanned WHERE true
+                ON CONFLICT (ip, port) DO UPDATE SET last_seen = excluded.last_seen, last_scan = excluded.last_scan""",
+                         (now, now, scan_id))
+            conn.execute("""
+                UPDATE hosts SET last_changed = ? WHERE (ip, port) IN
+                    (SELECT DISTINCT ip, port FROM record_changes WHERE scan_id = ?)""", (now, scan_id))
+            conn.execute("""
+                INSERT INTO services (ip, port, service_type, first_seen, last_seen)
+                SELECT DISTINCT ip, port, service_type, ?, ? FROM snapshot WHERE service_type IS NOT NULL
+                ON CONFLICT (ip, port, service_type) DO UPDATE SET last_seen = excluded.last_seen""", (now, now))
+            hosts = conn.execute("SELECT COUNT(*) FROM scanned").fetchone()[0]
+            conn.execute("UPDATE scans SET finished = ?, hosts = ?, changes = ? WHERE id = ?",
+                         (now, hosts, added + removed, scan_id))
+            conn.execute("DELETE FROM staging")
+            conn.execute("DROP TABLE temp.scanned")
+            conn.execute("DROP TABLE temp.snapshot")
+            conn.execute("COMMIT")
+        return added + removed
+
+    @contextlib.contextmanager
+    def scanning(self, mode="aggregate", batch_size=5000, flush_interval=1.0):
+        """
+        在 with 块内把扫描器写出的 service.csv / service_magnify.csv 行批量写入本库，
+        退出时刷新写线程并做快照差分，之后恢复原来的输出格式：
+
+            with store.scanning("sharded"):
+                sharded.run_sharded(["ips.txt"])
+        """
+        import utils
+        previous = (utils.OUTPUT_FORMAT, utils.BATCH_SIZE, utils.FLUSH_INTERVAL, utils.STORE)
+        utils.configure_writers("sqlite", batch_size, flush_interval, store=self)
+        self.begin_scan(mode)
+        try:
+            yield self
+        finally:
+            utils.close_writers()
+            changes = self.finish_scan()
+            print(f"Scan {self.scan_id}: {changes} record changes stored")
+            utils.configure_writers(*previous[:3], store=previous[3])
+
+    def changed_hosts(self, since):
+        """since（时间戳）之后服务记录有变化的主机：[(ip, port, 新增数, 删除数)]。"""
+        with self.connect() as conn:
+            return conn.execute("""
+                SELECT ip, port, SUM(change = 'added'), SUM(change = 'removed') FROM record_changes
+                WHERE time >= ? GROUP BY ip, port ORDER BY ip, port""", (since,)).fetchall()
+
+    def host_changes(self, ip, since=0):
+        """主机的变化历史：[(time, change, rrname, rdata, srv_port, rtype)]。"""
+        with self.connect() as conn:
+            return conn.execute("""
+                SELECT time, change, rrname, rdata, srv_port, rtype FROM record_changes
+                WHERE ip = ? AND time >= ? ORDER BY time""", (ip, since)).fetchall()
+
+    def hosts_with_service(self, service_type):
+        """当前快照中提供某类服务的主机。"""
+        with self.connect() as conn:
+            return conn.execute("SELECT DISTINCT ip, port FROM records_current WHERE service_type = ?",
+                                (service_type,)).fetchall()
+
+    def import_csv(self, service_csv=None, magnify_csv=None, mode="import", batch=10000):
+        """把已有的 service.csv / service_magnify.csv 作为一次扫描导入。"""
+        self.begin_scan(mode)
+        with self.connect() as conn:
+            for path, insert in ((service_csv, self.insert_records), (magnify_csv, self.insert_magnify)):
+                if not path:
+                    continue
+                with open(path, newline='', encoding="utf-8") as f:
+                    rows = []
+                    for row in csv.reader(f):
+                        if len(row) != 5:
+                            continue
+                        rows.append(row)
+                        if len(rows) >= batch:
+                            insert(conn, rows)
+                            rows = []
+                    if rows:
+                        insert(conn, rows)
+        return self.finish_scan()
+
+def main():
+    parser = argparse.ArgumentParser(description="扫描结果库")
+    parser.add_argument("db")
+    sub = parser.add_subparsers(dest="command")
+    imp = sub.add_parser("import", help="导入 service.csv / service_magnify.csv 作为一次扫描")
+    imp.add_argument("--services")
+    imp.add_argument("--magnify")
+    imp.add_argument("--full", action="store_true", help="同时保存完整快照")
+    changes = sub.add_parser("changes", help="列出一段时间内服务有变化的主机")
+    changes.add_argument("--days", type=float, default=7)
+    host = sub.add_parser("host", help="某个主机的变化历史")
+    host.add_argument("ip")
+    service = sub.add_parser("service", help="当前提供某类服务的主机")
+    service.add_argument("service_type")
+    args = parser.parse_args()
+
+    store = ResultStore(args.db, incremental=not getattr(args, "full", False))
+    if args.command == "import":
+        print(f"{store.import_csv(args.services, args.magnify)} changes recorded")
+    elif args.command == "changes":
+        for ip, port, added, removed in store.changed_hosts(time.time() - args.days * 86400):
+            print(f"{ip}:{port} +{added} -{removed}")
+    elif args.command == "host":
+        for t, change, rrname, rdata, srv_port, rtype in store.host_changes(args.ip):
+            print(time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(t)), change, rrname, rdata, srv_port, rtype)
+    elif args.command == "service":
+        for ip, port in store.hosts_with_service(args.service_type):
+            print(f"{ip}:{port}")
+    else:
+        parser.print_help()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+#/usr/bin/python3
+#!coding=utf-8
+
+import csv
+import gzip
+import ipaddress
+import json
+import os
+import shutil
+import socket
+import tempfile
+
+class IPBitmap:
+    """
+    按 /16 分块的稀疏位图，用于 IPv4 目标去重：每个出现过的 /16 占 8KB。
+    无法解析为 IPv4 的目标（IPv6、主机名）退化为集合。
+    """
+    def __init__(self):
+        self.blocks = {}
+        self.others = set()
+
+    def add(self, ip):
+        """加入目标，返回是否为首次出现。"""
+        try:
+            value = int.from_bytes(socket.inet_aton(ip), "big")
+        except OSError:
+            if ip in self.others:
+                return False
+            self.others.add(ip)
+            return True
+        block = self.blocks.get(value >> 16)
+        if block is None:
+            block = self.blocks[value >> 16] = bytearray(8192)
+        low = value & 0xffff
+        mask = 1 << (low & 7)
+        if block[low >> 3] & mask:
+            return False
+        block[low >> 3] |= mask
+        return True
+
+def _open_text(path):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", newline='', encoding="utf-8")
+    return open(path, newline='', encoding="utf-8")
+
+def _expand(entry):
+    """单个条目展开为 IP：CIDR 网段逐个产出主机地址，其余原样返回。"""
+    entry = entry.strip()
+    if not entry or entry.startswith("#"):
+        return
+    if "/" in entry:
+        try:
+            network = ipaddress.ip_network(entry, strict=False)
+        except ValueError:
+            print(f"Skipping invalid CIDR: {entry}")
+            return
+        for host in (network.hosts() if network.num_addresses > 2 else network):
+            yield str(host)
+    else:
+        yield entry
+
+def _rows_match(row, require):
+    return all(str(row.get(k, "")).strip() == v for k, v in require.items())
+
+def iter_file(path, column="IP", require=None):
+    """
+    惰性读取单个目标文件中的 IP。支持纯文本（每行一个 IP 或 CIDR）、CSV
+    （有 column 表头时取该列，否则取第一列）、Excel（只读流式）及其 .gz 压缩形式。
+    require 为 {列名: 取值}，只保留满足条件的行（仅对带表头的 CSV/Excel 生效）。
+    """
+    name = path[:-3] if path.endswith(".gz") else path
+    if name.endswith((".xlsx", ".xlsm")):
+        from openpyxl import load_workbook
+        source = path
+        if path.endswith(".gz"):
+            # xlsx 是 zip 文件，需要可随机访问：先解压到临时文件（不占内存），再交给 openpyxl
+            source = tempfile.TemporaryFile()
+            with gzip.open(path, "rb") as gz:
+                shutil.copyfileobj(gz, source)
+            source.seek(0)
+        wb = load_workbook(source, read_only=True)
+        try:
+            rows = wb.active.iter_rows(values_only=True)
+            header = [str(c) if c is not None else "" for c in next(rows, [])]
+            for values in rows:
+                row = dict(zip(header, values))
+                if require and not _rows_match(row, require):
+                    continue
+                if row.get(column) is not None:
+                    yield from _expand(str(row[column]))
+        finally:
+            wb.close()
+            if source is not path:
+                source.close()
+        return
+    with _open_text(path) as f:
+        if not name.endswith(".csv"):
+            for line in f:
+                yield from _expand(line)
+            return
+        reader = csv.reader(f)
+        first = next(reader, None)
+        if first is None:
+            return
+        if column in first:
+            idx = first.index(column)
+            header = first
+        else:
+            header = None
+            yield from _expand(first[0])
+        for values in reader:
+            if not values:
+                continue
+            if header is None:
+                yield from _expand(values[0])
+                continue
+            if require and not _rows_match(dict(zip(header, values)), require):
+                continue
+            if idx < len(values):
+                yield from _expand(values[idx])
+
+class TargetSource:
+    """
+    流式目标源：按顺序惰性读取若干目标文件，用位图去重，并把扫描进度写入检查点。
+
+    进度以“已完成的去重后目标数”的低水位记录：并发扫描完成顺序不定，
+    只有某个序号之前的目标全部 mark_done() 后水位才前移。恢复时重新读取输入、
+    以相同规则去重并跳过水位之前的目标，不需要保存或改写目标列表本身。
+    """
+    def __init__(self, paths, checkpoint=None, column="IP", require=None):
+        self.paths = [paths] if isinstance(paths, str) else list(paths)
+        self.checkpoint = checkpoint
+        self.column = column
+        self.require = require
+        self.position = 0
+        self.duplicates = 0
+        self._inflight = {}
+        self._done = set()
+        if checkpoint and os.path.exists(checkpoint):
+            with open(checkpoint, encoding="utf-8") as f:
+                state = json.load(f)
+            if state.get("paths") == self.paths:
+                self.position = state["position"]
+                print(f"Resuming from checkpoint {checkpoint}: {self.position} targets done")
+            else:
+                print(f"Checkpoint {checkpoint} belongs to other inputs, starting over")
+
+    def __iter__(self):
+        seen = IPBitmap()
+        index = 0
+        for path in self.paths:
+            for ip in iter_file(path, self.column, self.require):
+                if not seen.add(ip):
+                    self.duplicates += 1
+                    continue
+                if index >= self.position:
+                    self._inflight[ip] = index
+                    yield ip
+                index += 1
+
+    def mark_done(self, ip):
+        """标记目标扫描完成并推进低水位。"""
+        index = self._inflight.pop(ip, None)
+        if index is None:
+            return
+        self._done.add(index)
+        while self.position in self._done:
+            self._done.remove(self.position)
+            self.position += 1
+
+    def save(self):
+        """原子地写出检查点。"""
+        if not self.checkpoint:
+            return
+        tmp = self.checkpoint + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"paths": self.paths, "position": self.position}, f)
+        os.replace(tmp, self.checkpoint)
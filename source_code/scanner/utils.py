@@ -1,20 +1,227 @@
 #/usr/bin/python3
 #!coding=utf-8
 
+import atexit
 import csv
+import os
+import queue
+import threading
+import time
+
+# 各结果文件的列名（CSV 不写表头，列式格式需要）
+SERVICE_COLUMNS = ["target", "rrname", "rdata", "port", "rtype"]
+MAGNIFY_COLUMNS = ["target", "type", "send", "receive", "magnify"]
+
+# 输出格式与批量参数，可通过 configure_writers() 修改
+OUTPUT_FORMAT = "csv"
+BATCH_SIZE = 1000
+FLUSH_INTERVAL = 1.0
+# OUTPUT_FORMAT 为 "sqlite" 时写入的 store.ResultStore
+STORE = None
+
+_FLUSH = object()
+_CLOSE = object()
+
+class ResultWriter:
+    """
+    缓冲写入扫描结果：调用方只把行放入队列，由单独的写线程持有文件，
+    按条数（batch_size）或时间（flush_interval 秒）批量写出。
+    fmt 可选 "csv"、"parquet"、"arrow"，后两者需要 pyarrow；"sqlite" 时批量插入 store 中对应的表。
+    """
+    def __init__(self, filename, columns, fmt="csv", batch_size=1000, flush_interval=1.0, store=None):
+        self.filename = os.path.abspath(filename)
+        self.columns = columns
+        self.fmt = fmt
+        self.store = store
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue()
+        self._file = None
+        self._writer = None
+        self._thread = threading.Thread(target=self._run, name=f"writer-{filename}", daemon=True)
+        self._thread.start()
+
+    def write(self, row):
+        self.queue.put(row)
+
+    def flush(self):
+        """阻塞直到此前放入的行全部写出。"""
+        self.queue.put(_FLUSH)
+        self.queue.join()
+
+    def close(self):
+        self.queue.put(_CLOSE)
+        self._thread.join()
+
+    def qsize(self):
+        return self.queue.qsize()
+
+    def _run(self):
+        batch = []
+        taken = 0
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                item = self.queue.get(timeout=max(deadline - time.monotonic(), 0))
+                taken += 1
+            except queue.Empty:
+                item = _FLUSH
+            if item is not _FLUSH and item is not _CLOSE:
+                batch.append(item)
+                if len(batch) < self.batch_size:
+                    continue
+            if batch:
+                try:
+                    self._write_batch(batch)
+                except Exception as e:
+                    print(f"Failed to write {len(batch)} rows to {self.filename}: {e}")
+                batch = []
+            deadline = time.monotonic() + self.flush_interval
+            for _ in range(taken):
+                self.queue.task_done()
+            taken = 0
+            if item is _CLOSE:
+                self._close_file()
+                return
+
+    def _open(self):
+        if self.fmt == "csv":
+            self._file = open(self.filename, "a+", newline='')
+            self._writer = csv.writer(self._file)
+            return
+        if self.fmt == "sqlite":
+            # SQLite 连接只能在创建它的线程使用，由写线程自己打开
+            self._writer = self.store.connect()
+            return
+        import pyarrow as pa
+        path = self.filename
+        stem, ext = os.path.splitext(path)
+        n = 1
+        # 列式文件无法追加，已存在时改用带序号的新文件
+        while os.path.exists(path):
+            path = f"{stem}.{n}{ext}"
+            n += 1
+        self._schema = pa.schema([(c, pa.string()) for c in self.columns])
+        if self.fmt == "parquet":
+            import pyarrow.parquet as pq
+            self._writer = pq.ParquetWriter(path, self._schema)
+        else:
+            self._file = pa.OSFile(path, "wb")
+            self._writer = pa.ipc.new_file(self._file, self._schema)
+
+    def _write_batch(self, batch):
+        if self._writer is None:
+            self._open()
+        if self.fmt == "csv":
+            self._writer.writerows(batch)
+            self._file.flush()
+            return
+        if self.fmt == "sqlite":
+            self.store.insert_rows(self._writer, self.filename, batch)
+            return
+        import pyarrow as pa
+        arrays = [pa.array([str(row[i]) for row in batch], pa.string()) for i in range(len(self.columns))]
+        self._writer.write_table(pa.Table.from_arrays(arrays, schema=self._schema))
+
+    def _close_file(self):
+        if self._writer is not None and self.fmt != "csv":
+            self._writer.close()
+        if self._file is not None:
+            self._file.close()
+        self._file = self._writer = None
+
+class ForwardingWriter:
+    """
+    分片扫描的工作进程使用：把行攒成批次发送到聚合进程的队列，
+    由聚合进程的 ResultWriter 写入同一个文件。
+    """
+    def __init__(self, filename, columns, out_queue, batch_size=500):
+        self.filename = filename
+        self.columns = columns
+        self.out_queue = out_queue
+        self.batch_size = batch_size
+        self.rows = []
+
+    def write(self, row):
+        self.rows.append(row)
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.rows:
+            self.out_queue.put(("rows", self.filename, self.columns, self.rows))
+            self.rows = []
+
+    def close(self):
+        self.flush()
+
+    def qsize(self):
+        return len(self.rows)
+
+_writers = {}
+_writers_lock = threading.Lock()
+# 不为 None 时，get_writer() 返回转发到该队列的 ForwardingWriter
+_forward_queue = None
+
+def _output_name(filename):
+    if OUTPUT_FORMAT in ("csv", "sqlite"):
+        return filename
+    return os.path.splitext(filename)[0] + (".parquet" if OUTPUT_FORMAT == "parquet" else ".arrow")
+
+def get_writer(filename, columns):
+    """返回 filename 对应的共享 ResultWriter，首次使用时创建。"""
+    writer = _writers.get(filename)
+    if writer is None:
+        with _writers_lock:
+            writer = _writers.get(filename)
+            if writer is None and _forward_queue is not None:
+                writer = _writers[filename] = ForwardingWriter(filename, columns, _forward_queue)
+            elif writer is None:
+                fmt = OUTPUT_FORMAT
+                if fmt == "sqlite" and STORE.table_for(filename) is None:
+                    # 结果库只收服务记录与放大倍数，aggtest.csv 等汇总文件仍写 CSV
+                    fmt = "csv"
+                writer = ResultWriter(_output_name(filename), columns, fmt, BATCH_SIZE, FLUSH_INTERVAL, STORE)
+                _writers[filename] = writer
+    return writer
+
+def configure_writers(fmt="csv", batch_size=1000, flush_interval=1.0, store=None):
+    """
+    设置输出格式与批量参数，已打开的写入器会先被关闭。
+    fmt="sqlite" 时须给出 store（store.ResultStore），扫描前后分别调用其 begin_scan()/finish_scan()。
+    """
+    global OUTPUT_FORMAT, BATCH_SIZE, FLUSH_INTERVAL, STORE
+    if fmt == "sqlite" and store is None:
+        raise ValueError("sqlite output needs a ResultStore")
+    close_writers()
+    OUTPUT_FORMAT, BATCH_SIZE, FLUSH_INTERVAL, STORE = fmt, batch_size, flush_interval, store
+
+def forward_writers(out_queue):
+    """在工作进程中调用：之后写出的所有行都转发到 out_queue。"""
+    global _forward_queue
+    close_writers()
+    _forward_queue = out_queue
+
+def flush_writers():
+    for writer in list(_writers.values()):
+        writer.flush()
+
+def close_writers():
+    """刷新并关闭所有写入器，进程退出时自动调用。"""
+    with _writers_lock:
+        writers = list(_writers.values())
+        _writers.clear()
+    for writer in writers:
+        writer.close()
+
+atexit.register(close_writers)
 
 def write_scan_log(target,rrname,rdata,port= 0,rtype="NA"):
     """将扫描到的服务信息写入CSV文件。"""
-    filename = "service.csv"
-    with open(filename,"a+", newline='') as wf:
-        csv_write = csv.writer(wf)
-        data = [target,rrname,rdata,port,rtype]
-        csv_write.writerow(data)
-        
+    data = [target,rrname,rdata,port,rtype]
+    get_writer("service.csv", SERVICE_COLUMNS).write(data)
+
 def get_magnify(target,send,receive,magnify,type):
     """将放大倍数信息写入CSV文件。"""
-    filename = "service_magnify.csv"
-    with open(filename,"a+", newline='') as wf:
-        csv_write = csv.writer(wf)
-        data = [target,type,send,receive,magnify]
-        csv_write.writerow(data)
+    data = [target,type,send,receive,magnify]
+    get_writer("service_magnify.csv", MAGNIFY_COLUMNS).write(data)
@@ -1,38 +1,87 @@
-from typing import List
-from sklearn.feature_extraction.text import TfidfVectorizer
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
 from sklearn.decomposition import LatentDirichletAllocation
-from .utils import preprocess_service_names
+from .tfidf_model import TFIDFModel
+
+def _fit_lda(X, n_topics: int, learning_method: str, batch_size: int, max_iter: int) -> Tuple[int, LatentDirichletAllocation, float]:
+    """
+    拟合一个主题数为 n_topics 的 LDA 并计算困惑度（在子进程中执行）。
+    """
+    lda = LatentDirichletAllocation(n_components=n_topics, random_state=42, learning_method=learning_method,
+                                    batch_size=batch_size, max_iter=max_iter)
+    lda.fit(X)
+    return n_topics, lda, lda.perplexity(X)
 
 class LDAModel:
     """
     封装LDA模型相关操作，用于确定主题数和提取主题关键词。
+    给出已 fit_transform() 的 tfidf 时直接复用其向量器与矩阵，不再重复预处理和向量化。
     """
-    def __init__(self, service_names: List[str]):
-        self.processed_names = preprocess_service_names(service_names)
-        self.vectorizer = TfidfVectorizer(max_features=1000)
-        self.X = self.vectorizer.fit_transform(self.processed_names)
+    def __init__(self, service_names: Optional[List[str]] = None, tfidf: Optional[TFIDFModel] = None):
+        if tfidf is None:
+            tfidf = TFIDFModel(max_features=1000)
+            tfidf.fit_transform(service_names)
+        self.vectorizer = tfidf.vectorizer
+        self.X = tfidf.X
+        self.best_model = None
+        self.scores = {}
 
-    def find_best_topic_num(self, min_topics=2, max_topics=10) -> int:
+    def find_best_topic_num(self, min_topics=2, max_topics=10, n_jobs: Optional[int] = 1,
+                            early_stopping: Optional[int] = None, learning_method: str = "batch",
+                            batch_size: int = 128, max_iter: int = 10) -> int:
         """
-        通过困惑度自动确定最佳主题数。
+        通过困惑度自动确定最佳主题数，并保留最佳模型（best_model）供 get_top_words() 复用。
+        n_jobs: 并行拟合的进程数，None 表示每个 CPU 一个；
+        early_stopping: 连续这么多个主题数没有改进时停止搜索（并行时按批次判断）；
+        learning_method: "batch"，或大语料上使用 "online"（按 batch_size 条的小批量更新）。
+        各主题数的困惑度记录在 scores 中。
         """
+        candidates = list(range(min_topics, max_topics + 1))
+        n_jobs = n_jobs or os.cpu_count() or 1
+        self.scores = {}
         best_num = min_topics
         best_score = float('inf')
-        for n in range(min_topics, max_topics + 1):
-            lda = LatentDirichletAllocation(n_components=n, random_state=42)
-            lda.fit(self.X)
-            score = lda.perplexity(self.X)
-            if score < best_score:
-                best_score = score
-                best_num = n
+        best_model = None
+        stale = 0
+
+        def consider(results):
+            nonlocal best_num, best_score, best_model, stale
+            for n, lda, score in sorted(results, key=lambda r: r[0]):
+                self.scores[n] = score
+                if score < best_score:
+                    best_score, best_num, best_model = score, n, lda
+                    stale = 0
+                else:
+                    stale += 1
+
+        if n_jobs == 1:
+            for n in candidates:
+                consider([_fit_lda(self.X, n, learning_method, batch_size, max_iter)])
+                if early_stopping and stale >= early_stopping:
+                    break
+        else:
+            with ProcessPoolExecutor(max_workers=min(n_jobs, len(candidates))) as pool:
+                # 不早停时一次提交全部候选；早停时按进程数分批提交，每批结束后判断
+                wave = n_jobs if early_stopping else len(candidates)
+                for i in range(0, len(candidates), wave):
+                    futures = [pool.submit(_fit_lda, self.X, n, learning_method, batch_size, max_iter)
+                               for n in candidates[i:i + wave]]
+                    consider([f.result() for f in futures])
+                    if early_stopping and stale >= early_stopping:
+                        break
+
+        self.best_model = best_model
         return best_num
 
     def get_top_words(self, n_topics: int, n_top_words: int = 5) -> List[List[str]]:
         """
-        获取每个主题的高频词。
+        获取每个主题的高频词。主题数与 find_best_topic_num() 保留的最佳模型一致时直接复用该模型。
         """
-        lda = LatentDirichletAllocation(n_components=n_topics, random_state=42)
-        lda.fit(self.X)
+        lda = self.best_model
+        if lda is None or lda.n_components != n_topics:
+            lda = LatentDirichletAllocation(n_components=n_topics, random_state=42)
+            lda.fit(self.X)
         feature_names = self.vectorizer.get_feature_names_out()
         topic_keywords = []
         for topic_idx, topic in enumerate(lda.components_):
@@ -0,0 +1,81 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+from .utils import normalize_service_name
+
+class DescriptionCache:
+    """
+    LLM 服务描述的磁盘缓存（SQLite），以规范化服务名与模型名为键。
+    条目超过 ttl 秒视为过期；条目数超过 max_entries 时按最近访问时间淘汰最旧的条目。
+    """
+    def __init__(self, path: str, ttl: float = 30 * 86400, max_entries: int = 100000):
+        self.path = os.path.abspath(path)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self._writes = 0
+        self.conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS descriptions (
+                name TEXT NOT NULL,
+                model TEXT NOT NULL,
+                text TEXT NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL,
+                PRIMARY KEY (name, model)
+            )""")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS descriptions_accessed ON descriptions (accessed)")
+        self.conn.commit()
+
+    def __len__(self) -> int:
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM descriptions").fetchone()[0]
+
+    def get(self, service_name: str, model: str) -> Optional[str]:
+        """
+        返回未过期的描述并刷新其访问时间，没有时返回 None。
+        """
+        key = normalize_service_name(service_name)
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute("SELECT text, created FROM descriptions WHERE name = ? AND model = ?",
+                                    (key, model)).fetchone()
+            if row is None:
+                return None
+            if row[1] + self.ttl <= now:
+                self.conn.execute("DELETE FROM descriptions WHERE name = ? AND model = ?", (key, model))
+                self.conn.commit()
+                return None
+            self.conn.execute("UPDATE descriptions SET accessed = ? WHERE name = ? AND model = ?", (now, key, model))
+            self.conn.commit()
+        return row[0]
+
+    def put(self, service_name: str, model: str, text: str):
+        """
+        写入描述；每 100 次写入检查一次容量。text 为 None（模型未返回内容）时不写入。
+        """
+        if text is None:
+            return
+        key = normalize_service_name(service_name)
+        now = time.time()
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO descriptions VALUES (?, ?, ?, ?, ?)", (key, model, text, now, now))
+            self._writes += 1
+            if self._writes % 100 == 0:
+                self._evict()
+            self.conn.commit()
+
+    def _evict(self):
+        self.conn.execute("DELETE FROM descriptions WHERE created <= ?", (time.time() - self.ttl,))
+        self.conn.execute("""
+            DELETE FROM descriptions WHERE rowid IN (
+                SELECT rowid FROM descriptions ORDER BY accessed DESC LIMIT -1 OFFSET ?)""", (self.max_entries,))
+
+    def close(self):
+        with self.lock:
+            self._evict()
+            self.conn.commit()
+            self.conn.close()
@@ -1,75 +1,228 @@
+import asyncio
 import json
-from typing import List, Dict, Any
-from openai import OpenAI
+from typing import List, Dict, Any, Optional
+from openai import OpenAI, AsyncOpenAI
 from openai.types.chat.chat_completion import Choice
 
+from .llm_cache import DescriptionCache
+from .utils import normalize_service_name
+
+DEFAULT_MODEL = "moonshot-v1-auto"
+
+TOOLS = [
+    {
+        "type": "builtin_function",
+        "function": {"name": "$web_search"},
+    }
+]
+
+class RateLimiter:
+    """
+    异步请求限速：按 rate（次/秒）均匀分配请求时刻。
+    """
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate
+        self.next_slot = 0.0
+
+    async def acquire(self):
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        slot = max(now, self.next_slot)
+        self.next_slot = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
 class LLMHandler:
     """
     封装与大语言模型（LLM）交互的逻辑，包括API调用和结果缓存。
+    cache_path 给出时描述同时写入磁盘缓存（DescriptionCache），跨次运行复用；
+    concurrency > 1 或给出 rate（每秒请求数）时，batch_describe() 以异步方式并发请求。
     """
-    def __init__(self, api_key: str, base_url: str):
+    def __init__(self, api_key: str, base_url: str, model: str = DEFAULT_MODEL, cache_path: Optional[str] = None,
+                 cache_ttl: float = 30 * 86400, cache_size: int = 100000, concurrency: int = 1,
+                 rate: Optional[float] = None):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.model = model
         self.client = OpenAI(base_url=base_url, api_key=api_key)
         self.cache = {}
+        self.disk_cache = DescriptionCache(cache_path, cache_ttl, cache_size) if cache_path else None
+        self.concurrency = concurrency
+        self.rate = rate
+
+    def close(self):
+        """
+        关闭客户端与磁盘缓存；关闭磁盘缓存时按 cache_ttl 与 cache_size 清理条目。
+        """
+        self.client.close()
+        if self.disk_cache is not None:
+            self.disk_cache.close()
+            self.disk_cache = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
 
     def _chat(self, messages: List[Dict[str, str]]) -> Choice:
         completion = self.client.chat.completions.create(
-            model="moonshot-v1-auto",
+            model=self.model,
+            messages=messages,
+            temperature=0.3,
+            tools=TOOLS
+        )
+        return completion.choices[0]
+
+    async def _achat(self, client: AsyncOpenAI, messages: List[Dict[str, str]],
+                     limiter: Optional[RateLimiter]) -> Choice:
+        if limiter:
+            await limiter.acquire()
+        completion = await client.chat.completions.create(
+            model=self.model,
             messages=messages,
             temperature=0.3,
-            tools=[
-                {
-                    "type": "builtin_function",
-                    "function": {"name": "$web_search"},
-                }
-            ]
+            tools=TOOLS
         )
         return completion.choices[0]
 
     def _search_impl(self, arguments: Dict[str, Any]) -> Any:
         return arguments
 
-    def describe_service(self, service_name: str) -> str:
+    def _messages(self, service_name: str) -> List[Dict[str, str]]:
+        return [
+            {"role": "system", "content": "Using English to Answer the following questions"},
+            {"role": "user", "content": f'What service is "{service_name}"? Briefly, summarize the application scenarios, common devices, and service types of the service in a few sentences.'}
+        ]
+
+    def _tool_results(self, choice: Choice) -> List[Dict[str, str]]:
         """
-        使用大模型对服务名进行语义描述，带缓存。
+        执行一轮工具调用，返回需要追加到对话中的工具结果消息。
+        """
+        results = []
+        for tool_call in choice.message.tool_calls:
+            tool_call_name = tool_call.function.name
+            tool_call_arguments = json.loads(tool_call.function.arguments)
+            if tool_call_name == "$web_search":
+                tool_result = self._search_impl(tool_call_arguments)
+            else:
+                tool_result = f"Error: unable to find tool by name '{tool_call_name}'"
+
+            results.append({
+                "role": "tool",
+                "tool_call_id": tool_call.id,
+                "name": tool_call_name,
+                "content": json.dumps(tool_result),
+            })
+        return results
+
+    def _lookup(self, service_name: str) -> Optional[str]:
+        """
+        依次查找内存与磁盘缓存，磁盘命中时同时填入内存缓存。
         """
         if service_name in self.cache:
             return self.cache[service_name]
+        if self.disk_cache is not None:
+            text = self.disk_cache.get(service_name, self.model)
+            if text is not None:
+                self.cache[service_name] = text
+                return text
+        return None
 
-        messages = [
-            {"role": "system", "content": "Using English to Answer the following questions"},
-            {"role": "user", "content": f'What service is "{service_name}"? Briefly, summarize the application scenarios, common devices, and service types of the service in a few sentences.'}
-        ]
+    def _store(self, service_name: str, text: Optional[str]):
+        print(f"LLM Description for '{service_name}':\n{text}\n")
+        if text is None:
+            # 模型未返回内容（如被过滤），不缓存，下次重新请求
+            return
+        self.cache[service_name] = text
+        if self.disk_cache is not None:
+            self.disk_cache.put(service_name, self.model, text)
+
+    def describe_service(self, service_name: str) -> str:
+        """
+        使用大模型对服务名进行语义描述，带缓存。
+        """
+        text = self._lookup(service_name)
+        if text is not None:
+            return text
 
+        messages = self._messages(service_name)
         finish_reason = None
         while finish_reason is None or finish_reason == "tool_calls":
             choice = self._chat(messages)
             finish_reason = choice.finish_reason
             messages.append(choice.message)
             if finish_reason == "tool_calls":
-                for tool_call in choice.message.tool_calls:
-                    tool_call_name = tool_call.function.name
-                    tool_call_arguments = json.loads(tool_call.function.arguments)
-                    if tool_call_name == "$web_search":
-                        tool_result = self._search_impl(tool_call_arguments)
-                    else:
-                        tool_result = f"Error: unable to find tool by name '{tool_call_name}'"
-                    
-                    messages.append({
-                        "role": "tool",
-                        "tool_call_id": tool_call.id,
-                        "name": tool_call_name,
-                        "content": json.dumps(tool_result),
-                    })
-        
+                messages.extend(self._tool_results(choice))
+
         text = choice.message.content
-        print(f"LLM Description for '{service_name}':\n{text}\n")
-        self.cache[service_name] = text
+        self._store(service_name, text)
         return text
 
+    async def adescribe_service(self, client: AsyncOpenAI, service_name: str,
+                                limiter: Optional[RateLimiter] = None) -> str:
+        """
+        describe_service() 的异步版本，使用给定的 AsyncOpenAI 客户端；每轮请求（含工具调用轮）都经过 limiter。
+        """
+        text = self._lookup(service_name)
+        if text is not None:
+            return text
+
+        messages = self._messages(service_name)
+        finish_reason = None
+        while finish_reason is None or finish_reason == "tool_calls":
+            choice = await self._achat(client, messages, limiter)
+            finish_reason = choice.finish_reason
+            messages.append(choice.message)
+            if finish_reason == "tool_calls":
+                messages.extend(self._tool_results(choice))
+
+        text = choice.message.content
+        self._store(service_name, text)
+        return text
+
+    async def abatch_describe(self, services: List[str], concurrency: Optional[int] = None,
+                              rate: Optional[float] = None) -> Dict[str, str]:
+        """
+        并发获取服务名解释：同时进行的请求不超过 concurrency 个，请求速率不超过 rate（次/秒）。
+        规范化后相同的服务名只请求一次；单个服务失败时打印错误并跳过，不写入缓存。
+        """
+        concurrency = concurrency or self.concurrency
+        rate = rate or self.rate
+        limiter = RateLimiter(rate) if rate else None
+        semaphore = asyncio.Semaphore(max(concurrency, 1))
+        client = AsyncOpenAI(base_url=self.base_url, api_key=self.api_key)
+        tasks = {}
+
+        async def describe(name: str) -> str:
+            async with semaphore:
+                return await self.adescribe_service(client, name, limiter)
+
+        try:
+            for name in services:
+                key = normalize_service_name(name)
+                if key not in tasks:
+                    tasks[key] = (name, asyncio.ensure_future(describe(name)))
+            for key, (name, task) in tasks.items():
+                try:
+                    await task
+                except Exception as e:
+                    print(f"LLM request for '{name}' failed: {e}")
+        finally:
+            await client.close()
+        # 与首次出现的写法不同但规范化后相同的服务名共用同一描述
+        for name in services:
+            first = tasks[normalize_service_name(name)][0]
+            if name not in self.cache and first in self.cache:
+                self.cache[name] = self.cache[first]
+        return self.cache
+
     def batch_describe(self, services: List[str]) -> Dict[str, str]:
         """
         批量获取服务名解释，并返回完整的缓存。
         """
+        if self.concurrency > 1 or self.rate:
+            return asyncio.run(self.abatch_describe(services))
         for name in services:
             self.describe_service(name)
         return self.cache
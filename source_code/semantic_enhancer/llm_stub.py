@@ -0,0 +1,127 @@
+import argparse
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+class StubLLMServer:
+    """
+    本地的 OpenAI 兼容接口替身，用于在不调用真实模型的情况下测试 LLMHandler。
+    POST .../chat/completions：请求带 tools 且对话中还没有工具结果时（tool_calls=True），
+    先返回一次 $web_search 工具调用，之后返回固定格式的描述。
+    latency 为每个请求的处理时间（秒），requests 与 max_in_flight 记录请求数与最大并发数。
+    """
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0, tool_calls: bool = True,
+                 fail_every: Optional[int] = None):
+        self.latency = latency
+        self.tool_calls = tool_calls
+        self.fail_every = fail_every
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def reply(self, body: dict) -> dict:
+        messages = body.get("messages", [])
+        question = next((m.get("content", "") for m in messages if m.get("role") == "user"), "")
+        match = re.search(r'"([^"]+)"', question or "")
+        service = match.group(1) if match else "unknown"
+        if self.tool_calls and body.get("tools") and not any(m.get("role") == "tool" for m in messages):
+            message = {
+                "role": "assistant",
+                "content": "",
+                "tool_calls": [{
+                    "id": f"call_{self.requests}",
+                    "type": "function",
+                    "function": {"name": "$web_search", "arguments": json.dumps({"query": service})},
+                }],
+            }
+            finish_reason = "tool_calls"
+        else:
+            message = {"role": "assistant", "content": f"Stub description of {service}."}
+            finish_reason = "stop"
+        return {
+            "id": f"chatcmpl-{self.requests}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        }
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                if not self.path.endswith("/chat/completions"):
+                    self.send_error(404)
+                    return
+                with stub.lock:
+                    stub.requests += 1
+                    stub.in_flight += 1
+                    stub.max_in_flight = max(stub.max_in_flight, stub.in_flight)
+                    fail = stub.fail_every and stub.requests % stub.fail_every == 0
+                try:
+                    if stub.latency:
+                        time.sleep(stub.latency)
+                    if fail:
+                        payload = json.dumps({"error": {"message": "stub failure", "type": "invalid_request_error"}}).encode()
+                        self.send_response(400)
+                    else:
+                        payload = json.dumps(stub.reply(body)).encode()
+                        self.send_response(200)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(payload)))
+                    self.end_headers()
+                    self.wfile.write(payload)
+                finally:
+                    with stub.lock:
+                        stub.in_flight -= 1
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name="stub-llm", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        if self._thread:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="本地 OpenAI 兼容接口替身")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--no-tool-calls", action="store_true")
+    args = parser.parse_args()
+    with StubLLMServer(port=args.port, latency=args.latency, tool_calls=not args.no_tool_calls) as stub:
+        print(f"Stub LLM endpoint at {stub.base_url}, Ctrl-C to stop")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
@@ -1,9 +1,9 @@
 import json
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 
 from .llm_handler import LLMHandler
 from .lda_model import LDAModel
-from .tfidf_model import TFIDFModel
+from .tfidf_model import TFIDFModel, save_tfidf_matrix, service_rows
 
 # ---------------- 主流程 ----------------
 
@@ -11,8 +11,23 @@ class ServiceSemanticEnhancer:
     """
     整合所有模块，执行完整的服务语义增强流程。
     """
-    def __init__(self, llm_api_key: str, llm_base_url: str):
-        self.llm_handler = LLMHandler(api_key=llm_api_key, base_url=llm_base_url)
+    def __init__(self, llm_api_key: str, llm_base_url: str, **llm_options: Any):
+        """
+        llm_options 原样传给 LLMHandler，如 model、cache_path、cache_ttl、cache_size、concurrency、rate。
+        """
+        self.llm_handler = LLMHandler(api_key=llm_api_key, base_url=llm_base_url, **llm_options)
+
+    def close(self):
+        """
+        关闭 LLMHandler（及其磁盘缓存）。
+        """
+        self.llm_handler.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
 
     def enhance(
         self,
@@ -20,38 +35,52 @@ class ServiceSemanticEnhancer:
         lda_min_topics: int = 2,
         lda_max_topics: int = 10,
         tfidf_max_features: int = 1000,
-        lda_top_words_num: int = 5
+        lda_top_words_num: int = 5,
+        lda_options: Optional[Dict[str, Any]] = None,
+        tfidf_output: Optional[str] = None,
+        return_matrix: bool = False
     ) -> Dict[str, Any]:
         """
         综合流程：LLM解释、LDA确定类别数及高频词、TF-IDF分类。
+        lda_options 原样传给 LDAModel.find_best_topic_num()，如 n_jobs、early_stopping、learning_method、batch_size。
+        TF-IDF 只计算一次并由 LDA 复用；向量以稀疏矩阵给出，每个服务记录其所在行号（row）。
+        结果默认可直接 json.dump：给出 tfidf_output 时矩阵写入该 .npz 文件
+        （索引写入同名 .index.json，见 tfidf_model.load_tfidf_matrix），结果中只记录文件路径；
+        return_matrix=True 时结果另含 tfidf_matrix（CSR，不能序列化为 JSON）与 service_index（服务名→行号）。
         """
         # 1. LLM 解释
         llm_cache = self.llm_handler.batch_describe(service_names)
 
-        # 2. LDA 自动确定类别数和高频词
-        lda_model = LDAModel(service_names)
-        best_topic_num = lda_model.find_best_topic_num(lda_min_topics, lda_max_topics)
-        lda_keywords = lda_model.get_top_words(best_topic_num, lda_top_words_num)
-
-        # 3. TF-IDF 分类
+        # 2. TF-IDF 向量化（只做一次）
         tfidf_model = TFIDFModel(max_features=tfidf_max_features)
-        tfidf_model.train(service_names)
-        vectors = tfidf_model.classify(service_names)
+        matrix = tfidf_model.fit_transform(service_names)
+
+        # 3. LDA 自动确定类别数和高频词，复用同一矩阵
+        lda_model = LDAModel(tfidf=tfidf_model)
+        best_topic_num = lda_model.find_best_topic_num(lda_min_topics, lda_max_topics, **(lda_options or {}))
+        lda_keywords = lda_model.get_top_words(best_topic_num, lda_top_words_num)
 
         # 4. 汇总结果
         results = []
-        for name, vec in zip(service_names, vectors):
+        for row, name in enumerate(service_names):
             results.append({
                 "service_name": name,
-                "tfidf_vector": vec.toarray().tolist()[0],
+                "row": row,
                 "llm_description": llm_cache.get(name, "N/A")
             })
 
-        return {
+        output = {
             "best_topic_num": best_topic_num,
             "lda_topic_keywords": lda_keywords,
             "services": results
         }
+        if tfidf_output:
+            save_tfidf_matrix(tfidf_output, matrix, service_names, tfidf_model.vectorizer.get_feature_names_out())
+            output["tfidf_path"] = tfidf_output
+        if return_matrix:
+            output["tfidf_matrix"] = matrix
+            output["service_index"] = service_rows(service_names)
+        return output
 
 # ---------------- 示例用法 ----------------
 
@@ -68,14 +97,13 @@ if __name__ == "__main__":
         "_ftp._tcp.local."
     ]
     
-    enhancer = ServiceSemanticEnhancer(llm_api_key=API_KEY, llm_base_url=BASE_URL)
-    
-    result = enhancer.enhance(
-        services_to_analyze, 
-        lda_min_topics=2, 
-        lda_max_topics=5, 
-        lda_top_words_num=3
-    )
+    with ServiceSemanticEnhancer(llm_api_key=API_KEY, llm_base_url=BASE_URL) as enhancer:
+        result = enhancer.enhance(
+            services_to_analyze,
+            lda_min_topics=2,
+            lda_max_topics=5,
+            lda_top_words_num=3
+        )
     
     print("\n--- Final Result ---")
     print(json.dumps(result, ensure_ascii=False, indent=2))
\ No newline at end of file
@@ -1,14 +1,19 @@
+import json
+import os
 import numpy as np
-from typing import List
+from typing import Dict, List, Tuple
+from scipy import sparse
 from sklearn.feature_extraction.text import TfidfVectorizer
 from .utils import preprocess_service_names
 
 class TFIDFModel:
     """
     封装TF-IDF模型，用于文本向量化。
+    fit_transform() 之后 X 为训练集的稀疏矩阵（CSR），可直接交给 LDAModel 复用。
     """
     def __init__(self, max_features: int = 1000):
         self.vectorizer = TfidfVectorizer(max_features=max_features)
+        self.X = None
 
     def train(self, service_names: List[str]):
         """
@@ -17,9 +22,49 @@ class TFIDFModel:
         processed = preprocess_service_names(service_names)
         self.vectorizer.fit(processed)
 
+    def fit_transform(self, service_names: List[str]) -> sparse.csr_matrix:
+        """
+        预处理与向量化只做一次：训练并返回训练集的 TF-IDF 稀疏矩阵，同时保存在 X 中。
+        """
+        processed = preprocess_service_names(service_names)
+        self.X = self.vectorizer.fit_transform(processed).tocsr()
+        return self.X
+
     def classify(self, service_names: List[str]) -> np.ndarray:
         """
         使用 TF-IDF 模型对服务名进行向量化。
         """
         processed = preprocess_service_names(service_names)
         return self.vectorizer.transform(processed)
+
+def service_rows(service_names: List[str]) -> Dict[str, int]:
+    """
+    服务名→行号；重复出现的服务名取第一次出现的行。
+    """
+    rows = {}
+    for row, name in enumerate(service_names):
+        rows.setdefault(name, row)
+    return rows
+
+def _index_path(path: str) -> str:
+    return os.path.splitext(path)[0] + ".index.json"
+
+def save_tfidf_matrix(path: str, X: sparse.spmatrix, service_names: List[str], feature_names: List[str]) -> str:
+    """
+    把 TF-IDF 矩阵写为 CSR .npz（不压缩，便于快速加载），
+    行号对应的服务名与列对应的特征词写入同名的 .index.json。返回索引文件路径。
+    """
+    sparse.save_npz(path, sparse.csr_matrix(X), compressed=False)
+    index_path = _index_path(path)
+    with open(index_path, "w", encoding="utf-8") as f:
+        json.dump({"services": list(service_names), "features": list(feature_names)}, f, ensure_ascii=False)
+    return index_path
+
+def load_tfidf_matrix(path: str) -> Tuple[sparse.csr_matrix, Dict[str, int], List[str]]:
+    """
+    读取 save_tfidf_matrix() 的输出，返回 (矩阵, 服务名→行号, 特征词列表)。
+    """
+    X = sparse.load_npz(path).tocsr()
+    with open(_index_path(path), encoding="utf-8") as f:
+        index = json.load(f)
+    return X, service_rows(index["services"]), index["features"]
@@ -11,3 +11,10 @@ def preprocess_service_names(service_names: List[str]) -> List[str]:
         clean = re.sub(r'[^a-zA-Z0-9 ]', ' ', name).lower()
         processed.append(clean)
     return processed
+
+def normalize_service_name(name: str) -> str:
+    """
+    规范化服务名作为缓存键：去除首尾空白与末尾的点，转小写，
+    使 "_HTTP._tcp.local." 与 "_http._tcp.local" 对应同一条缓存。
+    """
+    return name.strip().rstrip(".").lower()
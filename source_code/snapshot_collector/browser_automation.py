@@ -1,8 +1,17 @@
+import argparse
 import asyncio
 import csv
 import os
+import tempfile
+import threading
+import time
+from contextlib import asynccontextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from playwright.async_api import async_playwright, Error as PlaywrightError
 
+import scan_targets
+import web_probe
+
 # --- 配置参数 ---
 # 输入文件，包含IP地址列表
 IP_LIST_FILE = "ip_list.csv"
@@ -12,10 +21,14 @@ OUTPUT_DIR = "output"
 SCREENSHOTS_DIR = os.path.join(OUTPUT_DIR, "screenshots")
 # 成功截图的IP日志
 SUCCESS_LOG = os.path.join(OUTPUT_DIR, "successful_ips.txt")
-# 并发任务数
+# 并发任务数（同时打开的页面总数）
 MAX_CONCURRENCY = 10
 # 页面加载超时时间（毫秒）
 PAGE_TIMEOUT = 8000
+# 浏览器池中的浏览器个数
+BROWSER_COUNT = 2
+# 每个浏览器累计服务多少个页面后换新（防止内存泄漏与状态累积）
+RECYCLE_AFTER = 500
 
 def setup_directories():
     """创建输出目录"""
@@ -30,64 +43,321 @@ def load_ips(csv_file: str) -> list[str]:
         # 过滤空行
         return [row[0].strip() for row in csv.reader(f) if row and row[0].strip()]
 
-async def capture_ip(ip: str, semaphore: asyncio.Semaphore):
+class _PooledBrowser:
+    """池中的一个浏览器及其计数"""
+    __slots__ = ("browser", "served", "active", "retired")
+
+    def __init__(self, browser):
+        self.browser = browser
+        self.served = 0
+        self.active = 0
+        self.retired = False
+
+class BrowserPool:
     """
-    使用Playwright捕获单个IP地址的网页截图。
-    会依次尝试 http 和 https 协议。
+    长期存活的 Chromium 浏览器池，替代每个IP单独启动一次浏览器。
+    每个浏览器同时服务多个页面，每个页面使用独立的轻量 context（互不共享 cookie/缓存）；
+    同时打开的页面总数不超过 max_pages，新页面分配给当前页面最少的浏览器。
+    浏览器累计服务 recycle_after 个页面后换上新浏览器，旧浏览器在其页面全部关闭后退出；
+    浏览器崩溃（断开连接）时自动重启，创建 context 失败时在新浏览器上重试一次。
     """
-    async with semaphore:
-        browser = None
-        context = None
+    def __init__(self, size: int = BROWSER_COUNT, max_pages: int = MAX_CONCURRENCY,
+                 recycle_after: int = RECYCLE_AFTER, **launch_options):
+        self.size = size
+        self.recycle_after = recycle_after
+        self.launch_options = {"headless": True, **launch_options}
+        self.semaphore = asyncio.Semaphore(max_pages)
+        self.playwright = None
+        self.slots: list[_PooledBrowser] = []
+        self.locks: list[asyncio.Lock] = []
+        self.launches = 0
+        self.crashes = 0
+
+    async def start(self):
+        self.playwright = await async_playwright().start()
+        self.locks = [asyncio.Lock() for _ in range(self.size)]
+        self.slots = list(await asyncio.gather(*(self._launch() for _ in range(self.size))))
+        return self
+
+    async def close(self):
+        for entry in self.slots:
+            await self._close(entry)
+        self.slots = []
+        if self.playwright:
+            await self.playwright.stop()
+            self.playwright = None
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def _launch(self) -> _PooledBrowser:
+        browser = await self.playwright.chromium.launch(**self.launch_options)
+        self.launches += 1
+        return _PooledBrowser(browser)
+
+    async def _close(self, entry: _PooledBrowser):
         try:
-            async with async_playwright() as p:
-                browser = await p.chromium.launch(headless=True)
-                context = await browser.new_context(ignore_https_errors=True)
-                page = await context.new_page()
+            await entry.browser.close()
+        except PlaywrightError:
+            pass
+
+    async def _replace(self, i: int, old: _PooledBrowser) -> _PooledBrowser:
+        """
+        为槽位 i 换上新浏览器；old 已被其他任务换掉时直接返回当前浏览器。
+        """
+        async with self.locks[i]:
+            if self.slots[i] is not old:
+                return self.slots[i]
+            if not old.browser.is_connected():
+                self.crashes += 1
+                print(f"[!] 浏览器 {i} 已崩溃，正在重启")
+            self.slots[i] = await self._launch()
+        old.retired = True
+        if old.active == 0:
+            await self._close(old)
+        return self.slots[i]
+
+    async def _release(self, entry: _PooledBrowser, context):
+        if context is not None:
+            try:
+                await context.close()
+            except PlaywrightError:
+                pass
+        entry.active -= 1
+        if entry.retired and entry.active == 0:
+            await self._close(entry)
+
+    @asynccontextmanager
+    async def page(self):
+        """
+        从池中取一个新页面（位于独立的 context 中），退出时关闭其 context。
+        """
+        async with self.semaphore:
+            i = min(range(self.size), key=lambda k: self.slots[k].active)
+            entry = self.slots[i]
+            if entry.served >= self.recycle_after or not entry.browser.is_connected():
+                entry = await self._replace(i, entry)
+            entry.served += 1
+            entry.active += 1
+            try:
+                context = await entry.browser.new_context(ignore_https_errors=True)
+            except PlaywrightError:
+                if entry.browser.is_connected():
+                    await self._release(entry, None)
+                    raise
+                # 浏览器在分配后崩溃：换新浏览器重试一次
+                await self._release(entry, None)
+                entry = await self._replace(i, entry)
+                entry.served += 1
+                entry.active += 1
+                try:
+                    context = await entry.browser.new_context(ignore_https_errors=True)
+                except PlaywrightError:
+                    await self._release(entry, None)
+                    raise
+            try:
+                yield await context.new_page()
+            finally:
+                await self._release(entry, context)
 
-                for scheme in ["http://", "https://"]:
-                    url = f"{scheme}{ip}"
+def screenshot_path(name: str, output_dir: str = SCREENSHOTS_DIR) -> str:
+    """截图文件路径：使用名称创建有效的文件名"""
+    safe_name = name.replace(':', '_').replace('/', '_')
+    return os.path.join(output_dir, f"{safe_name}.png")
+
+async def capture_urls(pool: BrowserPool, name: str, urls: list[str], output_dir: str = SCREENSHOTS_DIR,
+                       success_log: str = SUCCESS_LOG):
+    """
+    依次尝试 urls，把第一个成功加载的页面截图保存为 output_dir/{name}.png，返回成功的URL。
+    访问过程中页面或浏览器崩溃时换一个新页面，从失败的URL起重试一次。
+    """
+    path = screenshot_path(name, output_dir)
+    pending = list(urls)
+    for attempt in range(2):
+        crashed = False
+        try:
+            async with pool.page() as page:
+                while pending:
+                    url = pending[0]
                     try:
                         print(f"[*] 正在尝试: {url}")
                         await page.goto(url, timeout=PAGE_TIMEOUT)
-                        
-                        # 使用IP地址创建有效的文件名
-                        safe_ip = ip.replace(':', '_').replace('/', '_')
-                        screenshot_path = os.path.join(SCREENSHOTS_DIR, f"{safe_ip}.png")
-                        
-                        await page.screenshot(path=screenshot_path)
-                        print(f"[+] 截图成功: {screenshot_path}")
-                        
-                        # 异步写入成功日志
-                        async with asyncio.Lock():
-                            with open(SUCCESS_LOG, "a", encoding='utf-8') as log:
-                                log.write(f"{url}\n")
-                        return  # 成功后即返回
-
+                        await page.screenshot(path=path)
+                        print(f"[+] 截图成功: {path}")
+                        with open(success_log, "a", encoding='utf-8') as log:
+                            log.write(f"{url}\n")
+                        return url  # 成功后即返回
                     except Exception as e:
-                        error_message = str(e).splitlines()[0]
+                        error_message = str(e).splitlines()[0] if str(e) else ""
                         print(f"[-] 访问失败 {url}: {e.__class__.__name__}: {error_message}")
-
+                        if page.is_closed() or not page.context.browser.is_connected():
+                            crashed = True
+                            break
+                        pending.pop(0)
         except PlaywrightError as e:
-            print(f"[!] Playwright初始化错误 for {ip}: {str(e)}")
-        finally:
-            if context:
-                await context.close()
-            if browser:
+            print(f"[!] Playwright初始化错误 for {name}: {str(e)}")
+            return None
+        if not crashed:
+            return None
+    return None
+
+async def capture_ip(ip: str, pool: BrowserPool):
+    """
+    使用浏览器池捕获单个IP地址的网页截图。
+    会依次尝试 http 和 https 协议。
+    """
+    return await capture_urls(pool, ip, [f"http://{ip}", f"https://{ip}"])
+
+async def run_workers(jobs, worker, concurrency: int = MAX_CONCURRENCY):
+    """
+    启动 concurrency 个工作协程依次消费 jobs（任意可迭代对象），对每个元素调用 await worker(job)。
+    与一次性为所有任务创建协程相比，内存占用与任务数无关。
+    """
+    jobs = iter(jobs)
+
+    async def loop():
+        for job in jobs:
+            await worker(job)
+
+    await asyncio.gather(*(loop() for _ in range(concurrency)))
+
+class _BenchmarkHandler(BaseHTTPRequestHandler):
+    """基准测试用的本地页面"""
+    body = ("<html><head><title>Device Login</title></head><body><h1>Router Admin</h1>"
+            "<form><input name=user><input name=pass type=password><button>Login</button></form>"
+            "</body></html>").encode()
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html")
+        self.send_header("Content-Length", str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, *args):
+        pass
+
+async def benchmark(n_urls: int, browsers: int = BROWSER_COUNT, concurrency: int = MAX_CONCURRENCY,
+                    recycle_after: int = RECYCLE_AFTER):
+    """
+    吞吐量基准：对本地HTTP测试服务器截图 n_urls 次，
+    输出浏览器池的页面/秒，并与单次浏览器启动+关闭的开销对比。
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _BenchmarkHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    try:
+        with tempfile.TemporaryDirectory() as out:
+            log = os.path.join(out, "success.txt")
+            async with async_playwright() as p:
+                start = time.perf_counter()
+                browser = await p.chromium.launch(headless=True)
                 await browser.close()
+                launch_cost = time.perf_counter() - start
+
+            results = []
+
+            async def worker(i):
+                results.append(await capture_urls(pool, f"bench_{i}", [f"{base}/?i={i}"], out, log))
+
+            start = time.perf_counter()
+            async with BrowserPool(browsers, concurrency, recycle_after) as pool:
+                ready = time.perf_counter()
+                await run_workers(range(n_urls), worker, concurrency)
+            elapsed = time.perf_counter() - ready
+            ok = sum(r is not None for r in results)
+            print(f"\n浏览器池: {browsers} 个浏览器, {concurrency} 个并发页面, 启动耗时 {ready - start:.2f}s")
+            print(f"截图 {ok}/{n_urls} 个, 耗时 {elapsed:.1f}s, {n_urls / elapsed:.1f} 页/秒, "
+                  f"浏览器启动 {pool.launches} 次, 崩溃 {pool.crashes} 次")
+            print(f"单次浏览器启动+关闭耗时 {launch_cost:.2f}s（每个IP单独启动浏览器时的额外开销）")
+    finally:
+        server.shutdown()
+        server.server_close()
+
+def group_urls(targets) -> list[tuple[str, list[str]]]:
+    """把 (scheme, host, port) 按主机分组为 (host, [url, ...])，保持原有顺序"""
+    groups = {}
+    for scheme, host, port in targets:
+        groups.setdefault(host, []).append(web_probe.format_url(scheme, host, port))
+    return list(groups.items())
+
+def service_urls(targets) -> list[tuple[str, list[str]]]:
+    """
+    扫描发现的每个Web服务单独截图，名称为 "host:port"（截图文件名为 host_port.png）；
+    同一主机端口只访问一次。
+    """
+    jobs = {}
+    for scheme, host, port in targets:
+        jobs.setdefault(f"{host}:{port}", [web_probe.format_url(scheme, host, port)])
+    return list(jobs.items())
+
+async def load_jobs(ip_list_file: str = IP_LIST_FILE, services_csv: str = None, scan_db: str = None,
+                    probe: bool = True, probe_concurrency: int = web_probe.PROBE_CONCURRENCY,
+                    probe_timeout: float = web_probe.PROBE_TIMEOUT) -> list[tuple[str, list[str]]]:
+    """
+    生成截图任务列表 [(名称, [url, ...]), ...]。
+    给出 services_csv（扫描器的 service.csv）或 scan_db（扫描结果库）时，只访问扫描发现的
+    Web服务（SRV 记录中的协议、主机与端口）；否则对IP列表中的每个IP依次尝试 http 与 https 默认端口。
+    probe 为 True 时先用 web_probe 预探测，只保留有应答的URL。
+    """
+    if services_csv or scan_db:
+        targets = []
+        if services_csv:
+            targets += scan_targets.load_service_csv(services_csv)
+        if scan_db:
+            targets += scan_targets.load_scan_db(scan_db)
+        print(f"[*] 从扫描结果中得到 {len(targets)} 个Web服务")
+    else:
+        ip_list = load_ips(ip_list_file)
+        if not ip_list:
+            print("IP列表为空。")
+            return []
+        targets = [target for ip in ip_list for target in web_probe.default_targets(ip)]
+
+    if probe:
+        cache = web_probe.ProbeCache()
+        try:
+            targets = await web_probe.filter_targets(targets, probe_concurrency, probe_timeout, cache)
+        finally:
+            cache.close()
+    return service_urls(targets) if services_csv or scan_db else group_urls(targets)
+
+def add_target_arguments(parser: argparse.ArgumentParser):
+    """截图目标与浏览器池相关的命令行参数（pipeline.py 共用）"""
+    parser.add_argument("--ip-list", default=IP_LIST_FILE, help="IP列表文件")
+    parser.add_argument("--services", help="扫描器的 service.csv，只访问其中发现的Web服务")
+    parser.add_argument("--scan-db", help="扫描结果库（scanner/store.py），只访问其中发现的Web服务")
+    parser.add_argument("--browsers", type=int, default=BROWSER_COUNT, help="浏览器池中的浏览器个数")
+    parser.add_argument("--concurrency", type=int, default=MAX_CONCURRENCY, help="同时打开的页面总数")
+    parser.add_argument("--recycle-after", type=int, default=RECYCLE_AFTER, help="浏览器服务多少个页面后换新")
+    parser.add_argument("--no-probe", action="store_true", help="不做预探测，所有IP都交给浏览器")
+    parser.add_argument("--probe-concurrency", type=int, default=web_probe.PROBE_CONCURRENCY, help="同时进行的预探测数")
+    parser.add_argument("--probe-timeout", type=float, default=web_probe.PROBE_TIMEOUT, help="预探测超时时间（秒）")
 
-async def main():
+async def main(args: argparse.Namespace):
     """主函数，设置并运行并发截图任务"""
     setup_directories()
-    ip_list = load_ips(IP_LIST_FILE)
-    if not ip_list:
-        print("IP列表为空，程序退出。")
+    jobs = await load_jobs(args.ip_list, args.services, args.scan_db, not args.no_probe,
+                           args.probe_concurrency, args.probe_timeout)
+    if not jobs:
+        print("没有可访问的Web服务，程序退出。")
         return
 
-    semaphore = asyncio.Semaphore(MAX_CONCURRENCY)
-    tasks = [capture_ip(ip, semaphore) for ip in ip_list]
-    await asyncio.gather(*tasks)
+    async with BrowserPool(args.browsers, args.concurrency, args.recycle_after) as pool:
+        await run_workers(jobs, lambda job: capture_urls(pool, *job), args.concurrency)
 
 if __name__ == "__main__":
-    print("--- 开始网页截图 ---")
-    asyncio.run(main())
-    print("--- 截图任务完成 ---")
+    parser = argparse.ArgumentParser(description="网页截图")
+    add_target_arguments(parser)
+    parser.add_argument("--benchmark", type=int, metavar="N", help="对本地测试服务器截图 N 次并输出吞吐量")
+    args = parser.parse_args()
+    if args.benchmark:
+        asyncio.run(benchmark(args.benchmark, args.browsers, args.concurrency, args.recycle_after))
+    else:
+        print("--- 开始网页截图 ---")
+        asyncio.run(main(args))
+        print("--- 截图任务完成 ---")
@@ -0,0 +1,212 @@
+import asyncio
+import hashlib
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple, Union
+
+import easyocr
+import numpy as np
+from PIL import Image
+
+# --- 配置参数 ---
+# OCR 工作进程数（每个进程一个 easyocr.Reader）
+OCR_WORKERS = 2
+OCR_LANGS = ['ch_sim', 'en']
+# OCR结果缓存
+OCR_CACHE = os.path.join("output", "ocr_cache.db")
+# 感知哈希（dHash）边长，哈希位数为其平方
+HASH_SIZE = 16
+# 感知哈希的汉明距离不超过此值的图片视为同一页面，复用已有文本；None 表示只按内容哈希复用。
+# 感知哈希对小字号文字（MAC、IP、设备名）的差异不敏感，而这正是隐私分析关心的内容，因此默认关闭
+PHASH_DISTANCE = None
+
+def ocr_image(reader: easyocr.Reader, file_path: str) -> str:
+    """对单张图片执行OCR，返回以空格连接的文本"""
+    result = reader.readtext(file_path, detail=0, paragraph=True)
+    return ' '.join(result)
+
+def content_hash(path: str) -> str:
+    """图片文件内容的 SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def image_hash(path: str, size: int = HASH_SIZE) -> int:
+    """
+    差值哈希（dHash）：缩放为 (size+1)×size 的灰度图，比较每行相邻像素的明暗，
+    得到 size*size 位的整数；渲染相同而细节（压缩噪声、时钟等）略有差异的页面哈希接近。
+    """
+    with Image.open(path) as img:
+        pixels = np.asarray(img.convert("L").resize((size + 1, size), Image.Resampling.LANCZOS), dtype=np.int16)
+    bits = np.packbits(pixels[:, 1:] > pixels[:, :-1])
+    return int.from_bytes(bits.tobytes(), "big")
+
+class OCRCache:
+    """
+    OCR文本的磁盘缓存（SQLite），以图片内容哈希为键，同时记录感知哈希。
+    find_similar() 查找感知哈希的汉明距离不超过 distance 的已识别图片：哈希分成 distance+1 段，
+    距离不超过 distance 的两个哈希至少有一段完全相同，因此只需比较在某一段上相同的候选。
+    各方法可在不同线程中调用（OCRPool 经 asyncio.to_thread 访问），由 lock 串行化。
+    """
+    def __init__(self, path: str = OCR_CACHE, distance: Optional[int] = PHASH_DISTANCE, hash_size: int = HASH_SIZE):
+        self.distance = distance
+        self.hash_size = hash_size
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS ocr (
+                sha256 TEXT PRIMARY KEY,
+                dhash TEXT,
+                text TEXT NOT NULL,
+                source TEXT NOT NULL,
+                created REAL NOT NULL
+            )""")
+        self.conn.commit()
+        self.bits = hash_size * hash_size
+        self.bands = []
+        self.index = {}
+        if distance is not None:
+            width = -(-self.bits // (distance + 1))
+            self.bands = [(start, (1 << min(width, self.bits - start)) - 1) for start in range(0, self.bits, width)]
+            # 只有实际识别过的图片进入索引，近似命中的图片不再作为比较基准
+            for sha, dhash in self.conn.execute("SELECT sha256, dhash FROM ocr WHERE source = 'ocr' AND dhash IS NOT NULL"):
+                self._add(int(dhash, 16), sha)
+
+    def _add(self, dhash: int, sha: str):
+        for i, (start, mask) in enumerate(self.bands):
+            self.index.setdefault((i, (dhash >> start) & mask), []).append((dhash, sha))
+
+    def get(self, sha: str) -> Optional[str]:
+        with self.lock:
+            row = self.conn.execute("SELECT text FROM ocr WHERE sha256 = ?", (sha,)).fetchone()
+        return row[0] if row else None
+
+    def find_similar(self, dhash: int) -> Optional[Tuple[str, str]]:
+        """返回 (文本, 来源图片的内容哈希)，没有足够接近的图片时返回 None"""
+        if self.distance is None:
+            return None
+        best = None
+        with self.lock:
+            for i, (start, mask) in enumerate(self.bands):
+                for other, sha in self.index.get((i, (dhash >> start) & mask), ()):
+                    d = bin(dhash ^ other).count("1")
+                    if d <= self.distance and (best is None or d < best[0]):
+                        best = (d, sha)
+        if best is None:
+            return None
+        text = self.get(best[1])
+        return (text, best[1]) if text is not None else None
+
+    def put(self, sha: str, dhash: Optional[int], text: str, source: str = "ocr"):
+        """写入一条结果；source 为 "ocr"（实际识别）或 "near:<来源内容哈希>"（近似重复复用）"""
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO ocr VALUES (?, ?, ?, ?, ?)",
+                              (sha, f"{dhash:x}" if dhash is not None else None, text, source, time.time()))
+            self.conn.commit()
+            if source == "ocr" and dhash is not None and self.bands:
+                self._add(dhash, sha)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+_READER = None
+
+def _init_worker(langs: List[str], threads: int):
+    global _READER
+    import torch
+    # 多个工作进程时限制每个进程的计算线程数，避免互相争抢CPU
+    torch.set_num_threads(threads)
+    _READER = easyocr.Reader(langs)
+
+def _ocr_task(path: str) -> str:
+    return ocr_image(_READER, path)
+
+class OCRPool:
+    """
+    多进程OCR：workers 个工作进程各持有一个 easyocr.Reader。
+    给出 cache 时先按内容哈希查缓存，再按感知哈希查近似重复的页面（cache.distance 不为 None 时），
+    都未命中才识别，结果写回缓存；
+    同一次运行中内容相同的图片只识别一次，等待进行中识别的图片计入 exact_hits。
+    exact_hits / similar_hits / recognized 记录各自的数量。
+    """
+    def __init__(self, workers: int = OCR_WORKERS, cache: Optional[OCRCache] = None, langs: List[str] = OCR_LANGS):
+        threads = max(1, (os.cpu_count() or 1) // workers)
+        self.executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"),
+                                            initializer=_init_worker, initargs=(langs, threads))
+        self.workers = workers
+        self.cache = cache
+        self.exact_hits = 0
+        self.similar_hits = 0
+        self.recognized = 0
+        self._inflight = {}
+
+    def close(self):
+        self.executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    async def ocr(self, path: str) -> str:
+        """识别一张图片（在事件循环中调用）；读文件计算哈希与查写缓存都在线程中进行，不阻塞事件循环"""
+        sha = await asyncio.to_thread(content_hash, path)
+        task = self._inflight.get(sha)
+        if task is None:
+            task = self._inflight[sha] = asyncio.ensure_future(self._ocr(path, sha))
+            task.add_done_callback(lambda _: self._inflight.pop(sha, None))
+            return await asyncio.shield(task)
+        # 内容相同的图片正在识别，等待同一结果，计为缓存命中
+        text = await asyncio.shield(task)
+        self.exact_hits += 1
+        return text
+
+    async def _ocr(self, path: str, sha: str) -> str:
+        loop = asyncio.get_running_loop()
+        dhash = None
+        if self.cache:
+            text = await asyncio.to_thread(self.cache.get, sha)
+            if text is not None:
+                self.exact_hits += 1
+                return text
+            # 感知哈希总是随结果保存，之后开启近似重复复用时旧条目同样可用；
+            # 在线程中计算（PIL 缩放时释放 GIL），不必排在OCR进程池中耗时数秒的识别任务之后
+            dhash = await asyncio.to_thread(image_hash, path, self.cache.hash_size)
+            match = await asyncio.to_thread(self.cache.find_similar, dhash)
+            if match:
+                text, source = match
+                await asyncio.to_thread(self.cache.put, sha, dhash, text, f"near:{source}")
+                self.similar_hits += 1
+                return text
+        text = await loop.run_in_executor(self.executor, _ocr_task, path)
+        self.recognized += 1
+        if self.cache:
+            await asyncio.to_thread(self.cache.put, sha, dhash, text)
+        return text
+
+    async def ocr_all(self, paths: List[str]) -> List[Union[str, Exception]]:
+        """按顺序返回每张图片的文本，识别失败的位置为异常对象"""
+        results = [None] * len(paths)
+        jobs = iter(enumerate(paths))
+
+        async def worker():
+            for i, path in jobs:
+                try:
+                    results[i] = await self.ocr(path)
+                except Exception as e:
+                    results[i] = e
+
+        await asyncio.gather(*(worker() for _ in range(max(1, min(self.workers * 2, len(paths))))))
+        return results
+
+    def stats(self) -> str:
+        return f"识别 {self.recognized} 张, 缓存命中 {self.exact_hits} 张, 近似重复复用 {self.similar_hits} 张"
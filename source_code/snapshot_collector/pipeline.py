@@ -0,0 +1,177 @@
+import argparse
+import asyncio
+import csv
+import time
+from typing import Dict, List, Optional
+
+import browser_automation
+import privacy_analyze
+from ocr_cache import OCR_CACHE, OCR_WORKERS, PHASH_DISTANCE, OCRCache, OCRPool
+
+# --- 配置参数 ---
+# 规则分析工作协程数
+RULE_WORKERS = 1
+# 同时进行的大模型请求数
+LLM_WORKERS = 4
+# 大模型请求速率（次/秒）
+LLM_RATE = 0.2
+# 相邻两级之间队列的容量；下游处理不过来时上游在此阻塞（背压）
+QUEUE_SIZE = 32
+
+_DONE = object()
+
+# 与 semantic_enhancer/llm_handler.py 中的 RateLimiter 相同：各工具目录是独立运行的脚本，互不导入
+class RateLimiter:
+    """异步请求限速：按 rate（次/秒）均匀分配请求时刻"""
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate
+        self.next_slot = 0.0
+
+    async def acquire(self):
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        slot = max(now, self.next_slot)
+        self.next_slot = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+class CsvSink:
+    """逐行写出并立即刷新的CSV文件，流水线中途停止时已处理的结果不会丢失"""
+    def __init__(self, path: str, fieldnames: List[str]):
+        self.file = open(path, 'w', newline='', encoding='utf-8')
+        self.writer = csv.DictWriter(self.file, fieldnames=fieldnames)
+        self.writer.writeheader()
+        self.rows = 0
+
+    def write(self, row: Dict):
+        self.writer.writerow(row)
+        self.file.flush()
+        self.rows += 1
+
+    def close(self):
+        self.file.close()
+
+async def run_stage(name: str, inbox: asyncio.Queue, outbox: Optional[asyncio.Queue], workers: int, handle):
+    """
+    流水线的一级：workers 个工作协程从 inbox 取数据交给 handle，非 None 的结果放入 outbox。
+    收到结束标记后本级全部退出，再向 outbox 放入结束标记；单条数据处理失败时打印错误并跳过。
+    """
+    async def worker():
+        while True:
+            item = await inbox.get()
+            if item is _DONE:
+                # 放回结束标记，让本级的其他工作协程也能退出
+                await inbox.put(_DONE)
+                return
+            try:
+                result = await handle(item)
+            except Exception as e:
+                print(f"[!] {name} 处理失败 {item.get('IP')}: {e.__class__.__name__}: {e}")
+                continue
+            if result is not None and outbox is not None:
+                await outbox.put(result)
+
+    await asyncio.gather(*(worker() for _ in range(workers)))
+    if outbox is not None:
+        await outbox.put(_DONE)
+
+async def run_pipeline(jobs, browsers: int = browser_automation.BROWSER_COUNT,
+                       concurrency: int = browser_automation.MAX_CONCURRENCY,
+                       recycle_after: int = browser_automation.RECYCLE_AFTER, ocr_workers: int = OCR_WORKERS,
+                       rule_workers: int = RULE_WORKERS, llm_workers: int = LLM_WORKERS, llm_rate: float = LLM_RATE,
+                       queue_size: int = QUEUE_SIZE, use_llm: bool = True, ocr_cache: Optional[str] = OCR_CACHE,
+                       phash_distance: Optional[int] = PHASH_DISTANCE):
+    """
+    流式执行 截图 → OCR → 规则分析 → 大模型分析：每张截图完成后立即进入下一级，
+    各级有独立的并发数，级间为容量 queue_size 的有界队列；三个结果CSV逐行写出。
+    jobs 为 browser_automation.load_jobs() 生成的 [(名称, [url, ...]), ...]。
+    OCR 由 ocr_workers 个进程执行；ocr_cache 给出时内容相同的截图复用缓存中的文本，
+    phash_distance 不为 None 时感知哈希相近的截图也复用。
+    """
+    browser_automation.setup_directories()
+    ocr_queue = asyncio.Queue(queue_size)
+    rule_queue = asyncio.Queue(queue_size)
+    llm_queue = asyncio.Queue(queue_size) if use_llm else None
+    ocr_sink = CsvSink(privacy_analyze.OCR_RESULTS_CSV, ['IP', 'OCR_Text'])
+    rule_sink = CsvSink(privacy_analyze.RULE_BASED_RESULTS_CSV, ['IP'] + privacy_analyze.PRIVACY_CATEGORIES)
+    llm_sink = CsvSink(privacy_analyze.LLM_RESULTS_CSV, ['IP'] + privacy_analyze.PRIVACY_CATEGORIES_LLM) if use_llm else None
+    cache = OCRCache(ocr_cache, phash_distance) if ocr_cache else None
+    ocr_pool = OCRPool(ocr_workers, cache)
+    limiter = RateLimiter(llm_rate) if llm_rate else None
+    start = time.perf_counter()
+
+    async def capture(pool, job):
+        name, urls = job
+        if await browser_automation.capture_urls(pool, name, urls):
+            await ocr_queue.put({'IP': name, 'path': browser_automation.screenshot_path(name)})
+
+    async def capture_stage():
+        async with browser_automation.BrowserPool(browsers, concurrency, recycle_after) as pool:
+            await browser_automation.run_workers(jobs, lambda job: capture(pool, job), concurrency)
+        await ocr_queue.put(_DONE)
+
+    async def ocr(item):
+        text = await ocr_pool.ocr(item['path'])
+        ocr_sink.write({'IP': item['IP'], 'OCR_Text': text})
+        return {'IP': item['IP'], 'OCR_Text': text}
+
+    async def rules(item):
+        rule_sink.write({'IP': item['IP'], **privacy_analyze.analyze_text_rules(item['OCR_Text'])})
+        return item if use_llm else None
+
+    async def llm(item):
+        ip, text = item['IP'], item['OCR_Text']
+        if privacy_analyze.needs_llm(text) and limiter:
+            await limiter.acquire()
+        result = await asyncio.to_thread(privacy_analyze.analyze_privacy_llm, ip, text)
+        llm_sink.write({'IP': ip, **result})
+        detected = [cat for cat, found in result.items() if found]
+        print(f"[*] LLM分析 {ip} -> 检测到: {', '.join(detected) if detected else '无'}")
+
+    stages = [
+        capture_stage(),
+        run_stage("OCR", ocr_queue, rule_queue, ocr_workers, ocr),
+        run_stage("规则分析", rule_queue, llm_queue, rule_workers, rules),
+    ]
+    if use_llm:
+        stages.append(run_stage("LLM分析", llm_queue, None, llm_workers, llm))
+    try:
+        await asyncio.gather(*stages)
+    finally:
+        ocr_pool.close()
+        if cache:
+            cache.close()
+        for sink in (ocr_sink, rule_sink, llm_sink):
+            if sink:
+                sink.close()
+    elapsed = time.perf_counter() - start
+    print(f"\n[+] 流水线完成, 耗时 {elapsed:.1f}s: 截图 {ocr_sink.rows} 张, 规则分析 {rule_sink.rows} 条"
+          + (f", 大模型分析 {llm_sink.rows} 条" if llm_sink else ""))
+    print(f"[+] OCR: {ocr_pool.stats()}")
+
+async def main(args: argparse.Namespace):
+    jobs = await browser_automation.load_jobs(args.ip_list, args.services, args.scan_db, not args.no_probe,
+                                              args.probe_concurrency, args.probe_timeout)
+    if not jobs:
+        print("没有可访问的Web服务，程序退出。")
+        return
+    await run_pipeline(jobs, args.browsers, args.concurrency, args.recycle_after, args.ocr_workers,
+                       args.rule_workers, args.llm_workers, args.llm_rate, args.queue_size, not args.no_llm,
+                       None if args.no_ocr_cache else args.ocr_cache, args.phash_distance)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="截图 → OCR → 隐私分析 流水线")
+    browser_automation.add_target_arguments(parser)
+    parser.add_argument("--ocr-workers", type=int, default=OCR_WORKERS, help="OCR 工作进程数")
+    parser.add_argument("--ocr-cache", default=OCR_CACHE, help="OCR结果缓存文件")
+    parser.add_argument("--no-ocr-cache", action="store_true", help="不使用OCR结果缓存")
+    parser.add_argument("--phash-distance", type=int, default=PHASH_DISTANCE,
+                        help="感知哈希汉明距离不超过此值的截图复用已有文本（默认只复用内容完全相同的截图）")
+    parser.add_argument("--rule-workers", type=int, default=RULE_WORKERS, help="规则分析工作协程数")
+    parser.add_argument("--llm-workers", type=int, default=LLM_WORKERS, help="同时进行的大模型请求数")
+    parser.add_argument("--llm-rate", type=float, default=LLM_RATE, help="大模型请求速率（次/秒），0 表示不限速")
+    parser.add_argument("--queue-size", type=int, default=QUEUE_SIZE, help="相邻两级之间的队列容量")
+    parser.add_argument("--no-llm", action="store_true", help="不做大模型分析")
+    args = parser.parse_args()
+    print("--- 开始截图与隐私分析流水线 ---")
+    asyncio.run(main(args))
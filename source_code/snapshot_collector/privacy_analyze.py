@@ -1,17 +1,19 @@
+import asyncio
 import os
 import csv
 import re
 import json
 import time
-from typing import Dict, List, Set
+from typing import Dict, List, Optional, Set
 
-import easyocr
 import pandas as pd
 from geotext import GeoText
 import nltk
 from nltk.corpus import names
 from openai import OpenAI
 
+from ocr_cache import OCR_CACHE, OCR_WORKERS, PHASH_DISTANCE, OCRCache, OCRPool
+
 # --- 全局配置 ---
 # 输入目录
 SCREENSHOTS_DIR = os.path.join("output", "screenshots")
@@ -41,27 +43,41 @@ def initialize_nltk_names():
 COMMON_NAMES = initialize_nltk_names()
 
 # --- 1. OCR处理模块 ---
-def perform_ocr_on_screenshots():
-    """对截图目录中的所有图片执行OCR，并将结果保存到CSV"""
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+def ip_from_filename(filename: str) -> str:
+    """截图文件名还原为IP（browser_automation 把 ':' 替换为 '_'）"""
+    return os.path.splitext(filename)[0].replace('_', ':')
+
+def perform_ocr_on_screenshots(workers: int = OCR_WORKERS, cache_path: Optional[str] = OCR_CACHE,
+                               phash_distance: Optional[int] = PHASH_DISTANCE):
+    """
+    对截图目录中的所有图片执行OCR，并将结果保存到CSV。
+    workers 个进程并行识别；cache_path 给出时内容相同的截图复用缓存中的文本，只识别新的图片；
+    phash_distance 不为 None 时感知哈希相近的截图也视为重复。
+    """
     print("\n--- 阶段1: 开始OCR处理 ---")
     if not os.path.exists(SCREENSHOTS_DIR):
         print(f"错误: 截图目录 '{SCREENSHOTS_DIR}' 不存在。")
         return
 
-    reader = easyocr.Reader(['ch_sim', 'en'])
-    ocr_data = []
+    image_files = [f for f in os.listdir(SCREENSHOTS_DIR) if f.endswith(IMAGE_EXTENSIONS)]
+    print(f"[*] 正在处理 {len(image_files)} 张截图")
+    cache = OCRCache(cache_path, phash_distance) if cache_path else None
+    try:
+        with OCRPool(workers, cache) as pool:
+            results = asyncio.run(pool.ocr_all([os.path.join(SCREENSHOTS_DIR, f) for f in image_files]))
+            print(f"[*] {pool.stats()}")
+    finally:
+        if cache:
+            cache.close()
 
-    image_files = [f for f in os.listdir(SCREENSHOTS_DIR) if f.endswith(('.png', '.jpg', '.jpeg'))]
-    for filename in image_files:
-        ip = os.path.splitext(filename)[0].replace('_', ':')
-        file_path = os.path.join(SCREENSHOTS_DIR, filename)
-        try:
-            print(f"[*] 正在处理: {filename}")
-            result = reader.readtext(file_path, detail=0, paragraph=True)
-            ocr_text = ' '.join(result)
-            ocr_data.append({'IP': ip, 'OCR_Text': ocr_text})
-        except Exception as e:
-            print(f"[!] OCR处理失败 {filename}: {e}")
+    ocr_data = []
+    for filename, result in zip(image_files, results):
+        if isinstance(result, Exception):
+            print(f"[!] OCR处理失败 {filename}: {result}")
+        else:
+            ocr_data.append({'IP': ip_from_filename(filename), 'OCR_Text': result})
     
     if ocr_data:
         pd.DataFrame(ocr_data).to_csv(OCR_RESULTS_CSV, index=False, encoding='utf-8')
@@ -81,6 +97,33 @@ def is_public_ip(ip: str) -> bool:
     ]
     return not any(pat.match(ip) for pat in private_ip_patterns)
 
+# 定义正则表达式
+MAC_REGEX = re.compile(r'(?:[0-9A-Fa-f]{2}[:-]){5}[0-9A-Fa-f]{2}')
+IP_REGEX = re.compile(r'\b(?:\d{1,3}\.){3}\d{1,3}\b')
+EMAIL_REGEX = re.compile(r'[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+')
+PHONE_REGEX = re.compile(r'\b(?:\+?\d{1,3})?[\s-]?\(?\d{2,4}\)?[\s-]?\d{3,4}[\s-]?\d{4}\b')
+PRIVACY_CATEGORIES = ['Name', 'Location', 'MAC', 'PublicIP', 'Email', 'Phone']
+
+def analyze_text_rules(ocr_content: str) -> Dict[str, str]:
+    """对一段OCR文本做基于规则的隐私识别，返回各类别以 ';' 连接的结果"""
+    privacy = {cat: '' for cat in PRIVACY_CATEGORIES}
+
+    # 人名、地名、MAC、IP、Email、电话识别
+    words = re.findall(r'\b[a-zA-Z]{2,}\b', ocr_content)
+    privacy['Name'] = ';'.join({word for word in words if word.lower() in COMMON_NAMES})
+
+    places = GeoText(ocr_content)
+    privacy['Location'] = ';'.join(set(places.cities + places.countries))
+
+    privacy['MAC'] = ';'.join(set(MAC_REGEX.findall(ocr_content)))
+
+    public_ips = {ip_addr for ip_addr in IP_REGEX.findall(ocr_content) if is_public_ip(ip_addr)}
+    privacy['PublicIP'] = ';'.join(public_ips)
+
+    privacy['Email'] = ';'.join(set(EMAIL_REGEX.findall(ocr_content)))
+    privacy['Phone'] = ';'.join(set(PHONE_REGEX.findall(ocr_content)))
+    return privacy
+
 def analyze_privacy_rules():
     """使用正则表达式和词典进行隐私分析"""
     print("\n--- 阶段2: 开始基于规则的隐私分析 ---")
@@ -88,13 +131,6 @@ def analyze_privacy_rules():
         print(f"错误: OCR结果文件 '{OCR_RESULTS_CSV}' 不存在。请先运行OCR处理。")
         return
 
-    # 定义正则表达式
-    MAC_REGEX = re.compile(r'(?:[0-9A-Fa-f]{2}[:-]){5}[0-9A-Fa-f]{2}')
-    IP_REGEX = re.compile(r'\b(?:\d{1,3}\.){3}\d{1,3}\b')
-    EMAIL_REGEX = re.compile(r'[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+')
-    PHONE_REGEX = re.compile(r'\b(?:\+?\d{1,3})?[\s-]?\(?\d{2,4}\)?[\s-]?\d{3,4}[\s-]?\d{4}\b')
-    PRIVACY_CATEGORIES = ['Name', 'Location', 'MAC', 'PublicIP', 'Email', 'Phone']
-
     with open(OCR_RESULTS_CSV, 'r', encoding='utf-8') as infile, \
          open(RULE_BASED_RESULTS_CSV, 'w', newline='', encoding='utf-8') as outfile:
 
@@ -104,24 +140,7 @@ def analyze_privacy_rules():
 
         for row in reader:
             ip, ocr_content = row['IP'], row['OCR_Text']
-            privacy = {cat: '' for cat in PRIVACY_CATEGORIES}
-
-            # 人名、地名、MAC、IP、Email、电话识别
-            words = re.findall(r'\b[a-zA-Z]{2,}\b', ocr_content)
-            privacy['Name'] = ';'.join({word for word in words if word.lower() in COMMON_NAMES})
-            
-            places = GeoText(ocr_content)
-            privacy['Location'] = ';'.join(set(places.cities + places.countries))
-            
-            privacy['MAC'] = ';'.join(set(MAC_REGEX.findall(ocr_content)))
-            
-            public_ips = {ip_addr for ip_addr in IP_REGEX.findall(ocr_content) if is_public_ip(ip_addr)}
-            privacy['PublicIP'] = ';'.join(public_ips)
-            
-            privacy['Email'] = ';'.join(set(EMAIL_REGEX.findall(ocr_content)))
-            privacy['Phone'] = ';'.join(set(PHONE_REGEX.findall(ocr_content)))
-
-            writer.writerow({'IP': ip, **privacy})
+            writer.writerow({'IP': ip, **analyze_text_rules(ocr_content)})
     
     print(f"[+] 基于规则的分析结果已保存到: {RULE_BASED_RESULTS_CSV}")
     print("--- 基于规则的分析完成 ---")
@@ -144,9 +163,13 @@ def extract_json_from_response(response: str) -> Dict[str, bool]:
         print(f"无法解析响应中的JSON: {response}")
     return {category: False for category in PRIVACY_CATEGORIES_LLM}
 
+def needs_llm(ocr_content: str) -> bool:
+    """文本过短时无需调用大模型"""
+    return bool(ocr_content) and len(ocr_content.strip()) >= 5
+
 def analyze_privacy_llm(ip: str, ocr_content: str) -> Dict[str, bool]:
     """使用大模型分析OCR内容中的隐私信息"""
-    if not ocr_content or len(ocr_content.strip()) < 5:
+    if not needs_llm(ocr_content):
         return {category: False for category in PRIVACY_CATEGORIES_LLM}
 
     prompt = f"""
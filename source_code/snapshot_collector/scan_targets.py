@@ -0,0 +1,88 @@
+import ast
+import csv
+import os
+import re
+import sqlite3
+from typing import Optional
+
+# --- 配置参数 ---
+# 提供Web界面的mDNS服务类型及其协议
+WEB_SERVICE_TYPES = {
+    "_http": "http",
+    "_http-alt": "http",
+    "_webdav": "http",
+    "_ipp": "http",
+    "_https": "https",
+    "_webdavs": "https",
+    "_ipps": "https",
+}
+
+# 服务实例名中的服务类型，如 "Printer._http._tcp.local." -> "_http"
+_SERVICE_TYPE = re.compile(r"(_[^.]+)\._tcp\.local\.?$")
+
+def _host_of(target: str) -> str:
+    """扫描器写出的目标是 (ip, port) 元组的字符串形式，只取IP"""
+    target = target.strip()
+    if target.startswith("("):
+        return str(ast.literal_eval(target)[0])
+    return target
+
+def web_target(target: str, rrname: str, rdata: str, port) -> Optional[tuple[str, str, int]]:
+    """
+    service.csv 的一行若是Web服务的 SRV 记录（rdata 为 "target:..." 且端口非0），
+    返回 (scheme, host, port)，否则返回 None。
+    """
+    if not str(rdata).startswith("target:"):
+        return None
+    match = _SERVICE_TYPE.search(rrname)
+    scheme = WEB_SERVICE_TYPES.get(match.group(1).lower()) if match else None
+    try:
+        port = int(port)
+    except (TypeError, ValueError):
+        return None
+    if scheme is None or not 0 < port < 65536:
+        return None
+    try:
+        return scheme, _host_of(target), port
+    except (ValueError, SyntaxError, IndexError):
+        return None
+
+def load_service_csv(path: str) -> list[tuple[str, str, int]]:
+    """
+    从扫描器的 service.csv（列为 target, rrname, rdata, port, rtype）中取出Web服务的 (scheme, host, port)，
+    去重并保持首次出现的顺序。
+    """
+    if not os.path.exists(path):
+        print(f"错误: 扫描结果文件 '{path}' 未找到。")
+        return []
+    targets = {}
+    with open(path, newline='', encoding='utf-8', errors='replace') as f:
+        for row in csv.reader(f):
+            if len(row) < 4:
+                continue
+            target = web_target(row[0], row[1], row[2], row[3])
+            if target:
+                targets.setdefault(target, None)
+    return list(targets)
+
+def load_scan_db(path: str) -> list[tuple[str, str, int]]:
+    """
+    从扫描结果库（scanner/store.py 的 records_current，即各主机最近一次快照）中取出Web服务的 (scheme, host, port)。
+    """
+    if not os.path.exists(path):
+        print(f"错误: 扫描结果库 '{path}' 未找到。")
+        return []
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        rows = conn.execute("""
+            SELECT ip, rrname, rdata, srv_port FROM records_current
+            WHERE srv_port > 0 AND rdata LIKE 'target:%'
+            ORDER BY ip, srv_port""").fetchall()
+    finally:
+        conn.close()
+    targets = {}
+    for ip, rrname, rdata, port in rows:
+        target = web_target(ip, rrname, rdata, port)
+        if target:
+            targets.setdefault(target, None)
+    return list(targets)
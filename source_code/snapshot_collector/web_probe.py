@@ -0,0 +1,135 @@
+import asyncio
+import os
+import sqlite3
+import ssl
+import time
+from typing import Optional
+
+# --- 配置参数 ---
+# 单个探测（TCP连接 + TLS握手 + HEAD应答）的超时时间（秒）
+PROBE_TIMEOUT = 3.0
+# 同时进行的探测数
+PROBE_CONCURRENCY = 500
+# 探测结果缓存
+PROBE_CACHE = os.path.join("output", "probe_cache.db")
+# 缓存有效期（秒）
+PROBE_TTL = 7 * 86400
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+def default_targets(host: str) -> list[tuple[str, str, int]]:
+    """截图的默认目标：依次为 http 与 https 的默认端口"""
+    return [("http", host, 80), ("https", host, 443)]
+
+def format_url(scheme: str, host: str, port: int) -> str:
+    """由 (scheme, host, port) 构造URL，默认端口省略，IPv6地址加方括号"""
+    if ":" in host:
+        host = f"[{host}]"
+    if DEFAULT_PORTS.get(scheme) == port:
+        return f"{scheme}://{host}"
+    return f"{scheme}://{host}:{port}"
+
+def _ssl_context() -> ssl.SSLContext:
+    # 设备多为自签名证书，只关心是否有应答，不校验证书
+    ctx = ssl.create_default_context()
+    ctx.check_hostname = False
+    ctx.verify_mode = ssl.CERT_NONE
+    return ctx
+
+SSL_CONTEXT = _ssl_context()
+
+class ProbeCache:
+    """
+    探测结果的磁盘缓存（SQLite），以 (scheme, host, port) 为键；
+    有应答时记录HTTP状态码，无应答记为 NULL，超过 ttl 秒的记录视为不存在。
+    """
+    def __init__(self, path: str = PROBE_CACHE, ttl: float = PROBE_TTL):
+        self.ttl = ttl
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS probes (
+                scheme TEXT NOT NULL,
+                host TEXT NOT NULL,
+                port INTEGER NOT NULL,
+                status INTEGER,
+                checked REAL NOT NULL,
+                PRIMARY KEY (scheme, host, port)
+            )""")
+        self.conn.commit()
+
+    def get(self, target: tuple[str, str, int]) -> tuple[bool, Optional[int]]:
+        """返回 (是否命中, 状态码)；状态码为 None 表示无应答"""
+        row = self.conn.execute("SELECT status, checked FROM probes WHERE scheme = ? AND host = ? AND port = ?",
+                                target).fetchone()
+        if row is None or row[1] + self.ttl <= time.time():
+            return False, None
+        return True, row[0]
+
+    def put_many(self, results: list[tuple[tuple[str, str, int], Optional[int]]]):
+        now = time.time()
+        self.conn.executemany("INSERT OR REPLACE INTO probes VALUES (?, ?, ?, ?, ?)",
+                              [(*target, status, now) for target, status in results])
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+async def probe(scheme: str, host: str, port: int, timeout: float = PROBE_TIMEOUT) -> Optional[int]:
+    """
+    TCP连接并发送一个最小的 HEAD 请求（https 先完成TLS握手），
+    返回应答的HTTP状态码；连接失败、超时或应答不是HTTP时返回 None。
+    """
+    authority = format_url(scheme, host, port).split("://", 1)[1]
+
+    async def head():
+        reader, writer = await asyncio.open_connection(host, port, ssl=SSL_CONTEXT if scheme == "https" else None)
+        try:
+            writer.write(f"HEAD / HTTP/1.0\r\nHost: {authority}\r\nConnection: close\r\n\r\n".encode())
+            await writer.drain()
+            line = await reader.readline()
+        finally:
+            writer.close()
+        parts = line.split()
+        if len(parts) >= 2 and parts[0].startswith(b"HTTP/") and parts[1].isdigit():
+            return int(parts[1])
+        return None
+
+    try:
+        return await asyncio.wait_for(head(), timeout)
+    except (OSError, asyncio.TimeoutError, ssl.SSLError, ValueError):
+        return None
+
+async def filter_targets(targets, concurrency: int = PROBE_CONCURRENCY, timeout: float = PROBE_TIMEOUT,
+                         cache: Optional[ProbeCache] = None) -> list[tuple[str, str, int]]:
+    """
+    并发探测所有 (scheme, host, port)，按输入顺序返回有应答的目标。
+    给出 cache 时缓存中未过期的结果（包括无应答）直接使用，新的结果写回缓存。
+    """
+    targets = list(dict.fromkeys(targets))
+    status = {}
+    pending = []
+    for target in targets:
+        hit, code = cache.get(target) if cache else (False, None)
+        if hit:
+            status[target] = code
+        else:
+            pending.append(target)
+
+    done = []
+    jobs = iter(pending)
+
+    async def worker():
+        for target in jobs:
+            status[target] = await probe(*target, timeout=timeout)
+            done.append((target, status[target]))
+            if cache and len(done) >= 1000:
+                cache.put_many(done)
+                done.clear()
+
+    await asyncio.gather(*(worker() for _ in range(min(concurrency, len(pending)))))
+    if cache and done:
+        cache.put_many(done)
+    alive = [target for target in targets if status[target] is not None]
+    print(f"[*] 预探测: {len(targets)} 个目标（缓存命中 {len(targets) - len(pending)} 个），有应答 {len(alive)} 个")
+    return alive